@@ -0,0 +1,182 @@
+"""Runs one benchmark scenario in-process and prints its results as JSON.
+
+Started by bench/run.py inside a throwaway copy of the repo (its own
+config.json, data/ and a fake ``claude`` on PATH). Requests go through the
+real handlers — ``handle_message``, ``handle_file`` and ``_run_cron_job`` —
+and every Bot API call goes to bench/fake_telegram.py.
+"""
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Update  # noqa: E402
+from telegram.ext import Application, CallbackContext  # noqa: E402
+
+from bench.fake_telegram import FakeTelegramAPI  # noqa: E402
+from bot.handlers import handle_file, handle_message  # noqa: E402
+from bot.outbox import outbox  # noqa: E402
+from bot.sender import send_text  # noqa: E402
+from claude.pool import warm_pool  # noqa: E402
+from claude.queue import execution_queue  # noqa: E402
+from claude.retry import retry_queue  # noqa: E402
+from config import get_config  # noqa: E402
+from db.store import close_db, init_db  # noqa: E402
+from metrics import registry  # noqa: E402
+from scheduler import cron  # noqa: E402
+
+_LAG_INTERVAL_SEC = 0.05
+_CHAT_BASE = 10_000
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _message_update(update_id: int, chat_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "bench"},
+            "text": text,
+        },
+    }
+
+
+def _file_update(update_id: int, chat_id: int, size: int) -> dict:
+    data = _message_update(update_id, chat_id, "")
+    message = data["message"]
+    del message["text"]
+    message["caption"] = "이 파일을 확인해주세요"
+    message["document"] = {
+        "file_id": f"bench-{size}-{update_id}",
+        "file_unique_id": f"bench-{size}-{update_id}",
+        "file_name": f"bench-{update_id}.bin",
+        "file_size": size,
+    }
+    return data
+
+
+async def _measure_lag(samples: list[float]):
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(_LAG_INTERVAL_SEC)
+        samples.append(max(0.0, loop.time() - started - _LAG_INTERVAL_SEC))
+
+
+async def run(scenario: dict) -> dict:
+    api = FakeTelegramAPI(scenario["tg_latency_ms"])
+    await api.start()
+    config = get_config()
+    app = (
+        Application.builder()
+        .token(config.telegram.bot_token)
+        .base_url(api.base_url)
+        .base_file_url(api.base_file_url)
+        .build()
+    )
+    await app.initialize()
+
+    async def send_to_chat(chat_id, text):
+        await send_text(app.bot, chat_id or _CHAT_BASE, text)
+
+    async def send_default(text):
+        await send_to_chat(None, text)
+
+    await init_db(config.db.flush_interval_ms, config.db.flush_max_rows)
+    execution_queue.start(config.claude.max_concurrent, config.claude.queue_max_size)
+    await warm_pool.start([config.claude.default_work_dir])
+    await retry_queue.start(send_to_chat)
+    await cron.init_scheduler(send_default)
+    cron_id = await cron.add_cron("0 0 1 1 *", "벤치마크 크론 프롬프트", config.claude.default_work_dir)
+    # Let warm processes come up before the clock starts
+    await asyncio.sleep(scenario["warmup_sec"])
+    registry.reset()
+    api.calls.clear()
+
+    kinds = [k for k, weight in scenario["mix"].items() for _ in range(weight)]
+    rng = random.Random(scenario["seed"])
+    plan = [rng.choice(kinds) for _ in range(scenario["requests"])]
+    message = ("벤치마크 메시지 " * (scenario["message_chars"] // 9 + 1))[:scenario["message_chars"]]
+    counter = itertools.count()
+    latencies: dict[str, list[float]] = {k: [] for k in scenario["mix"]}
+    errors = 0
+
+    async def client(chat_id: int):
+        nonlocal errors
+        while (i := next(counter)) < len(plan):
+            kind = plan[i]
+            started = time.perf_counter()
+            try:
+                if kind == "cron":
+                    await cron._run_cron_job(cron_id)
+                else:
+                    data = (
+                        _file_update(i + 1, chat_id, scenario["file_bytes"])
+                        if kind == "file"
+                        else _message_update(i + 1, chat_id, message)
+                    )
+                    update = Update.de_json(data, app.bot)
+                    context = CallbackContext.from_update(update, app)
+                    await (handle_file if kind == "file" else handle_message)(update, context)
+            except Exception as e:
+                errors += 1
+                print(f"request {i} ({kind}) failed: {e!r}", file=sys.stderr)
+            latencies[kind].append(time.perf_counter() - started)
+
+    lag: list[float] = []
+    lag_task = asyncio.create_task(_measure_lag(lag))
+    started = time.perf_counter()
+    await asyncio.gather(*(client(_CHAT_BASE + n) for n in range(scenario["clients"])))
+    elapsed = time.perf_counter() - started
+    lag_task.cancel()
+
+    cron.shutdown_scheduler()
+    await retry_queue.stop()
+    await execution_queue.stop()
+    await warm_pool.stop()
+    await outbox.stop()
+    await close_db()
+    await app.shutdown()
+    await api.stop()
+
+    counters = {c["name"]: c["value"] for c in registry.counters()}
+    db_tx = sum(r["count"] for r in registry.summary() if r["name"] == "kkabi_db_write_seconds")
+    claude_runs = {}
+    for row in registry.summary():
+        if row["name"] == "kkabi_claude_run_seconds":
+            key = f"{row['labels'].get('mode')}:{row['labels'].get('status')}"
+            claude_runs[key] = claude_runs.get(key, 0) + row["count"]
+    everything = [v for values in latencies.values() for v in values]
+    return {
+        "requests": len(everything),
+        "errors": errors,
+        "elapsed_sec": elapsed,
+        "throughput_rps": len(everything) / elapsed if elapsed else 0.0,
+        "latency": {
+            kind: {"p50": percentile(v, 0.5), "p95": percentile(v, 0.95), "p99": percentile(v, 0.99), "n": len(v)}
+            for kind, v in {"all": everything, **latencies}.items()
+        },
+        "loop_lag_ms": {"p99": percentile(lag, 0.99) * 1000, "max": max(lag, default=0.0) * 1000},
+        "db_rows_written": counters.get("kkabi_db_rows_written_total", 0),
+        "db_transactions": db_tx,
+        "telegram_calls": dict(api.calls),
+        "claude_runs": claude_runs,
+    }
+
+
+if __name__ == "__main__":
+    result = asyncio.run(run(json.loads(sys.argv[1])))
+    print(json.dumps(result, ensure_ascii=False))
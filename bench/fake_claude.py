@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Stand-in for the ``claude`` CLI used by the benchmark.
+
+Speaks the same output formats kkabi uses (``json``, ``stream-json`` and
+stream-json input mode for the warm pool). Tuned with environment variables:
+
+    BENCH_CLAUDE_STARTUP_MS   simulated process start-up (default 300)
+    BENCH_CLAUDE_LATENCY_MS   time to produce an answer (default 500)
+    BENCH_CLAUDE_OUTPUT_CHARS answer length (default 500)
+    BENCH_CLAUDE_FAILURE_RATE fraction of runs that fail, 0..1 (default 0)
+    BENCH_CLAUDE_FAILURE      "error" or "rate_limit" (default "error")
+"""
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+STARTUP = int(os.environ.get("BENCH_CLAUDE_STARTUP_MS", "300")) / 1000
+LATENCY = int(os.environ.get("BENCH_CLAUDE_LATENCY_MS", "500")) / 1000
+OUTPUT_CHARS = int(os.environ.get("BENCH_CLAUDE_OUTPUT_CHARS", "500"))
+FAILURE_RATE = float(os.environ.get("BENCH_CLAUDE_FAILURE_RATE", "0"))
+FAILURE = os.environ.get("BENCH_CLAUDE_FAILURE", "error")
+
+# Streamed answers arrive in this many text events
+_CHUNKS = 5
+
+_LINE = "벤치마크 응답 줄입니다. The quick brown fox jumps over the lazy dog.\n"
+
+
+def _answer() -> str:
+    return (_LINE * (OUTPUT_CHARS // len(_LINE) + 1))[:OUTPUT_CHARS]
+
+
+def _emit(data: dict):
+    sys.stdout.write(json.dumps(data, ensure_ascii=False) + "\n")
+    sys.stdout.flush()
+
+
+def _failed() -> bool:
+    return random.random() < FAILURE_RATE
+
+
+def _failure_text() -> str:
+    return "API Error: rate limit exceeded" if FAILURE == "rate_limit" else "bench: simulated failure"
+
+
+def _stream_answer(session_id: str):
+    """Write one turn as stream-json events. Returns False if the turn failed."""
+    answer = _answer()
+    step = max(1, len(answer) // _CHUNKS)
+    for i in range(0, len(answer), step):
+        time.sleep(LATENCY / _CHUNKS)
+        _emit({"type": "assistant", "message": {"content": [{"type": "text", "text": answer[i:i + step]}]}})
+    if _failed():
+        _emit({"type": "result", "subtype": "error_during_execution", "is_error": True,
+               "result": _failure_text(), "session_id": session_id})
+        return False
+    _emit({"type": "result", "subtype": "success", "result": answer, "session_id": session_id})
+    return True
+
+
+def main() -> int:
+    args = sys.argv[1:]
+    time.sleep(STARTUP)
+    session_id = args[args.index("--resume") + 1] if "--resume" in args else str(uuid.uuid4())
+    output_format = args[args.index("--output-format") + 1] if "--output-format" in args else "text"
+
+    if "--input-format" in args:
+        # Warm-pool mode: one turn per stdin line until stdin closes
+        for line in sys.stdin:
+            if line.strip():
+                _stream_answer(session_id)
+        return 0
+
+    if output_format == "stream-json":
+        return 0 if _stream_answer(session_id) else 1
+
+    time.sleep(LATENCY)
+    if _failed():
+        sys.stderr.write(_failure_text() + "\n")
+        return 1
+    if output_format == "json":
+        _emit({"type": "result", "subtype": "success", "result": _answer(), "session_id": session_id})
+    else:
+        sys.stdout.write(_answer())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""Local stand-in for the Telegram Bot API.
+
+Serves just the methods kkabi calls, at ``http://127.0.0.1:<port>/bot<token>/<method>``,
+with an optional per-call latency. File downloads are served from
+``/file/bot<token>/<file_path>``; a ``file_id`` of the form ``bench-<size>-<n>``
+downloads ``size`` bytes.
+"""
+import asyncio
+import collections
+import json
+import time
+import urllib.parse
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "kkabi-bench", "username": "kkabi_bench_bot"}
+
+
+class FakeTelegramAPI:
+    def __init__(self, latency_ms: int = 0):
+        self._latency = latency_ms / 1000
+        self._server: asyncio.base_events.Server | None = None
+        self._next_message_id = 1000
+        self.port = 0
+        self.calls: collections.Counter = collections.Counter()
+        self.bytes_in = 0
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/bot"
+
+    @property
+    def base_file_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/file/bot"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode("latin-1").strip()
+                    if not line:
+                        break
+                    key, _, value = line.partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", "0") or 0))
+                self.bytes_in += len(body)
+                if self._latency:
+                    await asyncio.sleep(self._latency)
+                status, content_type, payload = self._dispatch(method, path, headers, body)
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                    f"Content-Length: {len(payload)}\r\n\r\n".encode("latin-1") + payload
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def _dispatch(self, method: str, path: str, headers: dict, body: bytes) -> tuple[str, str, bytes]:
+        parts = path.split("?")[0].strip("/").split("/")
+        if method == "GET" and parts[0] == "file":
+            self.calls["download"] += 1
+            file_id = parts[-1]
+            size = int(file_id.split("-")[1]) if file_id.startswith("bench-") else 0
+            return "200 OK", "application/octet-stream", b"\0" * size
+
+        api_method = parts[-1]
+        self.calls[api_method] += 1
+        params = _parse_params(headers.get("content-type", ""), body)
+        result = self._result(api_method, params)
+        payload = json.dumps({"ok": True, "result": result}).encode("utf-8")
+        return "200 OK", "application/json", payload
+
+    def _result(self, api_method: str, params: dict):
+        if api_method == "getMe":
+            return BOT_USER
+        if api_method in ("sendMessage", "sendDocument", "sendPhoto", "editMessageText"):
+            if api_method == "editMessageText":
+                message_id = int(params.get("message_id", 0))
+            else:
+                self._next_message_id += 1
+                message_id = self._next_message_id
+            message = {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                "from": BOT_USER,
+            }
+            if "text" in params:
+                message["text"] = params["text"]
+            if api_method == "sendDocument":
+                message["document"] = {"file_id": "sent", "file_unique_id": "sent"}
+            return message
+        if api_method == "getFile":
+            file_id = params.get("file_id", "")
+            size = int(file_id.split("-")[1]) if file_id.startswith("bench-") else 0
+            return {"file_id": file_id, "file_unique_id": file_id, "file_size": size, "file_path": f"documents/{file_id}"}
+        # deleteMessage, sendChatAction, answerCallbackQuery, ...
+        return True
+
+
+def _parse_params(content_type: str, body: bytes) -> dict:
+    if not body:
+        return {}
+    if content_type.startswith("application/json"):
+        return json.loads(body)
+    if content_type.startswith("application/x-www-form-urlencoded"):
+        return {k: v[0] for k, v in urllib.parse.parse_qs(body.decode("utf-8")).items()}
+    if content_type.startswith("multipart/form-data"):
+        return _parse_multipart(content_type, body)
+    return {}
+
+
+def _parse_multipart(content_type: str, body: bytes) -> dict:
+    boundary = content_type.split("boundary=")[-1].strip('"').encode("latin-1")
+    params = {}
+    for part in body.split(b"--" + boundary):
+        head, _, value = part.partition(b"\r\n\r\n")
+        if b'name="' not in head:
+            continue
+        name = head.split(b'name="')[1].split(b'"')[0].decode("utf-8")
+        if b"filename=" not in head:
+            params[name] = value.rstrip(b"\r\n").decode("utf-8", errors="replace")
+    return params
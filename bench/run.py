@@ -0,0 +1,165 @@
+"""End-to-end benchmark for kkabi.
+
+Copies the repo into a temp dir, puts bench/fake_claude.py on PATH as
+``claude`` and runs bench/driver.py once per combination of the swept
+parameters, against a local fake Telegram Bot API. Nothing touches the real
+data/ directory or config.json.
+
+    python bench/run.py --concurrency 1,4 --queue-size 10,50 --message-chars 200,4000
+
+Reports throughput, p50/p95/p99 end-to-end latency, event-loop lag and DB
+writes per scenario; ``--json`` also saves the raw results.
+"""
+import argparse
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _int_list(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def _mix(value: str) -> dict[str, int]:
+    mix = {}
+    for part in value.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in ("message", "file", "cron"):
+            raise argparse.ArgumentTypeError(f"unknown request kind: {kind}")
+        mix[kind] = int(weight or 1)
+    return mix
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="kkabi end-to-end benchmark")
+    sweep = parser.add_argument_group("swept (comma-separated)")
+    sweep.add_argument("--concurrency", type=_int_list, default=[1, 4], help="claude.max_concurrent")
+    sweep.add_argument("--queue-size", type=_int_list, default=[10], help="claude.queue_max_size")
+    sweep.add_argument("--message-chars", type=_int_list, default=[200], help="user message length")
+    load = parser.add_argument_group("load")
+    load.add_argument("--requests", type=int, default=40, help="requests per scenario")
+    load.add_argument("--clients", type=int, default=8, help="concurrent simulated chats")
+    load.add_argument("--mix", type=_mix, default={"message": 8, "file": 1, "cron": 1},
+                      help="request kinds and weights, e.g. message=8,file=1,cron=1")
+    load.add_argument("--file-bytes", type=int, default=64 * 1024, help="size of uploaded files")
+    stub = parser.add_argument_group("fake claude / telegram")
+    stub.add_argument("--startup-ms", type=int, default=300, help="fake claude process start-up")
+    stub.add_argument("--latency-ms", type=int, default=500, help="fake claude answer time")
+    stub.add_argument("--output-chars", type=int, default=1500, help="fake claude answer length")
+    stub.add_argument("--failure-rate", type=float, default=0.0, help="fraction of failed runs")
+    stub.add_argument("--failure", choices=("error", "rate_limit"), default="error")
+    stub.add_argument("--tg-latency-ms", type=int, default=20, help="fake Bot API latency per call")
+    bot = parser.add_argument_group("bot settings")
+    bot.add_argument("--no-streaming", action="store_true", help="disable streamed replies")
+    bot.add_argument("--warm-pool", type=int, default=0, help="claude.warm_pool_size")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write raw results to this file")
+    return parser.parse_args(argv)
+
+
+def _prepare(root: str) -> tuple[str, dict]:
+    """Copy the repo and create the fake ``claude`` shim. Returns (copy dir, env)."""
+    copy = os.path.join(root, "kkabi")
+    shutil.copytree(
+        REPO_DIR, copy,
+        ignore=shutil.ignore_patterns(".git", "data", "logs", "__pycache__", "config.json", "*.pyc"),
+    )
+    bin_dir = os.path.join(root, "bin")
+    os.makedirs(bin_dir)
+    shim = os.path.join(bin_dir, "claude")
+    with open(shim, "w", encoding="utf-8") as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.join(copy, "bench", "fake_claude.py")}" "$@"\n')
+    os.chmod(shim, 0o755)
+    env = {**os.environ, "PATH": bin_dir + os.pathsep + os.environ.get("PATH", "")}
+    return copy, env
+
+
+def _config(args, work_dir: str, concurrency: int, queue_size: int) -> dict:
+    return {
+        "telegram": {"bot_token": "123456:bench", "allowed_user_ids": []},
+        "claude": {
+            "timeout_sec": 120,
+            "max_concurrent": concurrency,
+            "queue_max_size": queue_size,
+            "default_work_dir": work_dir,
+            "streaming": not args.no_streaming,
+            "warm_pool_size": args.warm_pool,
+        },
+        "safety": {"confirm_keywords": []},
+        "cron": {"max_starts_per_minute": 0},
+        "retry": {"breaker_base_sec": 1, "breaker_max_sec": 2},
+    }
+
+
+def _row(s: dict, r: dict) -> str:
+    lat = r["latency"]["all"]
+    return (
+        f"{s['concurrency']:>4} {s['queue_size']:>5} {s['message_chars']:>6} | "
+        f"{r['requests']:>4} {r['errors']:>3} | {r['throughput_rps']:>7.2f} | "
+        f"{lat['p50']:>6.2f} {lat['p95']:>6.2f} {lat['p99']:>6.2f} | "
+        f"{r['loop_lag_ms']['p99']:>6.1f} {r['loop_lag_ms']['max']:>6.1f} | "
+        f"{r['db_rows_written']:>6g} {r['db_transactions']:>5} | {sum(r['telegram_calls'].values()):>6}"
+    )
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    header = (
+        "conc queue   msg  | reqs err |   req/s |    p50    p95    p99 | lag99 lagmax | "
+        "dbrows   dbtx | tgcalls"
+    )
+    results = []
+    with tempfile.TemporaryDirectory(prefix="kkabi-bench-") as root:
+        copy, env = _prepare(root)
+        work_dir = os.path.join(root, "work")
+        os.makedirs(work_dir)
+        env.update({
+            "BENCH_CLAUDE_STARTUP_MS": str(args.startup_ms),
+            "BENCH_CLAUDE_LATENCY_MS": str(args.latency_ms),
+            "BENCH_CLAUDE_OUTPUT_CHARS": str(args.output_chars),
+            "BENCH_CLAUDE_FAILURE_RATE": str(args.failure_rate),
+            "BENCH_CLAUDE_FAILURE": args.failure,
+        })
+        print(header)
+        for concurrency, queue_size, message_chars in itertools.product(
+            args.concurrency, args.queue_size, args.message_chars
+        ):
+            shutil.rmtree(os.path.join(copy, "data"), ignore_errors=True)
+            with open(os.path.join(copy, "config.json"), "w", encoding="utf-8") as f:
+                json.dump(_config(args, work_dir, concurrency, queue_size), f)
+            scenario = {
+                "concurrency": concurrency,
+                "queue_size": queue_size,
+                "message_chars": message_chars,
+                "requests": args.requests,
+                "clients": args.clients,
+                "mix": args.mix,
+                "file_bytes": args.file_bytes,
+                "tg_latency_ms": args.tg_latency_ms,
+                "warmup_sec": (args.startup_ms / 1000 + 0.5) if args.warm_pool else 0,
+                "seed": args.seed,
+            }
+            proc = subprocess.run(
+                [sys.executable, os.path.join("bench", "driver.py"), json.dumps(scenario)],
+                cwd=copy, env=env, capture_output=True, text=True,
+            )
+            if proc.returncode != 0:
+                print(f"scenario failed: {scenario}\n{proc.stderr[-2000:]}", file=sys.stderr)
+                continue
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            results.append({"scenario": scenario, "result": result})
+            print(_row(scenario, result), flush=True)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,63 +1,297 @@
+import asyncio
+import fnmatch
+import gzip
 import os
 import logging
+import tarfile
+import zipfile
 from telegram import Update
+from telegram.error import TelegramError
 from telegram.ext import ContextTypes
 
+from bot.outbox import outbox
+from bot.upload_store import upload_store
+from config import get_config
+from memory import file_cache
+
+try:
+    import zstandard
+except ImportError:  # optional: tar archives fall back to gzip
+    zstandard = None
+
 logger = logging.getLogger(__name__)
 
-UPLOAD_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "uploads")
-MAX_UPLOAD_BYTES = 50 * 1024 * 1024  # 50MB
+_COPY_CHUNK = 1024 * 1024
 
 
-def _ensure_upload_dir():
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
+def _max_upload_bytes() -> int:
+    return get_config().files.max_upload_mb * 1024 * 1024
 
 
-async def handle_file_upload(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str | None:
-    """Download a file sent by user, return local path."""
-    _ensure_upload_dir()
+def _discard(path: str):
+    if os.path.exists(path):
+        os.unlink(path)
+
+
+def _stat_target(path: str) -> tuple[bool, int] | None:
+    """(is_dir, size) for ``path``, or None if it doesn't exist."""
+    if not os.path.exists(path):
+        return None
+    return os.path.isdir(path), os.path.getsize(path)
+
+
+def _write_bytes(path: str, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
 
+async def handle_file_upload(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str | None:
+    """Download a file sent by user into the upload store, return local path."""
     doc = update.message.document
     photo = update.message.photo
 
     if doc:
-        if doc.file_size and doc.file_size > MAX_UPLOAD_BYTES:
-            await update.message.reply_text(f"파일이 너무 큽니다 (최대 {MAX_UPLOAD_BYTES // 1024 // 1024}MB)")
+        max_bytes = _max_upload_bytes()
+        if doc.file_size and doc.file_size > max_bytes:
+            await update.message.reply_text(f"파일이 너무 큽니다 (최대 {max_bytes // 1024 // 1024}MB)")
             return None
-        tg_file = await doc.get_file()
-        filename = doc.file_name or f"upload_{doc.file_id}"
+        attachment = doc
+        filename = doc.file_name or f"upload_{doc.file_unique_id}"
     elif photo:
         # Use the largest photo
-        largest = photo[-1]
-        tg_file = await largest.get_file()
-        filename = f"photo_{largest.file_id}.jpg"
+        attachment = photo[-1]
+        filename = f"photo_{attachment.file_unique_id}.jpg"
     else:
         return None
 
-    local_path = os.path.join(UPLOAD_DIR, filename)
-
-    # Avoid overwriting
-    base, ext = os.path.splitext(local_path)
-    counter = 1
-    while os.path.exists(local_path):
-        local_path = f"{base}_{counter}{ext}"
-        counter += 1
+    # Seen this exact file before: no download
+    local_path = await upload_store.lookup(attachment.file_unique_id, filename)
+    if local_path:
+        logger.info("파일 재사용: %s", local_path)
+        return local_path
 
-    await tg_file.download_to_drive(local_path)
+    tg_file = await attachment.get_file()
+    tmp_path = await upload_store.temp_path(filename)
+    try:
+        # download_to_drive writes the file on the event loop; write it from the I/O pool instead
+        data = await tg_file.download_as_bytearray()
+        await file_cache.run_io(_write_bytes, tmp_path, data)
+        local_path = await upload_store.add(tmp_path, filename, attachment.file_unique_id)
+    finally:
+        await file_cache.run_io(_discard, tmp_path)
     logger.info("파일 저장: %s", local_path)
     return local_path
 
 
-async def send_file(update: Update, file_path: str):
-    """Send a file from server to telegram."""
+def parse_getfile_args(args: list[str]) -> tuple[str, list[str], list[str], str]:
+    """``<path> [--include GLOB]... [--exclude GLOB]... [--zip|--tar]`` → (path, include, exclude, archive)."""
+    path_parts, include, exclude = [], [], []
+    archive = "zip"
+    tokens = iter(args)
+    for token in tokens:
+        if token in ("--include", "--exclude"):
+            pattern = next(tokens, None)
+            if pattern is None:
+                raise ValueError(f"{token} 뒤에 패턴이 필요합니다")
+            (include if token == "--include" else exclude).append(pattern)
+        elif token in ("--zip", "--tar"):
+            archive = token[2:]
+        else:
+            path_parts.append(token)
+    if not path_parts:
+        raise ValueError("경로가 필요합니다")
+    return " ".join(path_parts), include, exclude, archive
+
+
+def _matches(rel_path: str, patterns: list[str]) -> bool:
+    name = os.path.basename(rel_path)
+    return any(fnmatch.fnmatch(rel_path, p) or fnmatch.fnmatch(name, p) for p in patterns)
+
+
+def _select_files(root: str, include: list[str], exclude: list[str]) -> list[tuple[str, str]]:
+    """(absolute path, path inside the archive) for every regular file under ``root`` that passes the filters."""
+    top = os.path.basename(os.path.normpath(root))
+    selected = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = os.path.relpath(dirpath, root)
+        # Prune excluded directories instead of walking into them
+        dirnames[:] = sorted(
+            d for d in dirnames if not _matches(os.path.normpath(os.path.join(rel_dir, d)), exclude)
+        )
+        for filename in sorted(filenames):
+            rel = os.path.normpath(os.path.join(rel_dir, filename))
+            full = os.path.join(dirpath, filename)
+            if include and not _matches(rel, include):
+                continue
+            if _matches(rel, exclude) or not os.path.isfile(full):
+                continue
+            selected.append((full, os.path.join(top, rel)))
+    return selected
+
+
+class _PartUploadError(Exception):
+    """A part upload failed; parts before ``index`` were already sent."""
+
+    def __init__(self, index: int, filename: str, error: TelegramError):
+        super().__init__(f"{filename}: {error}")
+        self.index = index
+        self.filename = filename
+        self.error = error
+
+
+class _PartWriter:
+    """Write-only stream that cuts what it receives into ``part_size`` pieces.
+
+    Runs in a worker thread; each full piece is handed to ``emit(index, data)``
+    on the event loop and the thread waits for the upload, so at most about
+    one part is held in memory.
+    """
+
+    def __init__(self, part_size: int, emit, loop: asyncio.AbstractEventLoop, max_parts: int):
+        self._part_size = part_size
+        self._emit = emit
+        self._loop = loop
+        self._max_parts = max_parts
+        self._buffer = bytearray()
+        self.parts = 0
+
+    def write(self, data) -> int:
+        self._buffer += data
+        while len(self._buffer) > self._part_size:
+            self._send(bytes(self._buffer[:self._part_size]), last=False)
+            del self._buffer[:self._part_size]
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self._send(bytes(self._buffer), last=True)
+        self._buffer.clear()
+
+    def _send(self, data: bytes, last: bool):
+        if self.parts >= self._max_parts:
+            raise ValueError(f"분할 개수 제한 초과 (최대 {self._max_parts}개)")
+        self.parts += 1
+        asyncio.run_coroutine_threadsafe(self._emit(self.parts, data, last), self._loop).result()
+
+
+def _write_archive(files: list[tuple[str, str]], archive: str, out: _PartWriter):
+    if archive == "zip":
+        with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+            for full, arcname in files:
+                zf.write(full, arcname)
+    else:
+        if zstandard is not None:
+            stream = zstandard.ZstdCompressor(level=3).stream_writer(out, closefd=False)
+        else:
+            stream = gzip.GzipFile(fileobj=out, mode="wb", compresslevel=6)
+        with stream, tarfile.open(fileobj=stream, mode="w|") as tar:
+            for full, arcname in files:
+                tar.add(full, arcname, recursive=False)
+    out.close()
+
+
+def _copy_file(path: str, out: _PartWriter):
+    with open(path, "rb") as f:
+        while chunk := f.read(_COPY_CHUNK):
+            out.write(chunk)
+    out.close()
+
+
+def _archive_suffix(archive: str) -> str:
+    if archive == "zip":
+        return ".zip"
+    return ".tar.zst" if zstandard is not None else ".tar.gz"
+
+
+async def _send_parts(update: Update, name: str, producer, *producer_args) -> int:
+    """Run ``producer(*args, writer)`` in a thread and upload its output as one document or numbered parts."""
+    chat_id = update.effective_chat.id
+    config = get_config().files
+
+    async def emit(index: int, data: bytes, last: bool):
+        filename = name if index == 1 and last else f"{name}.part{index:03d}"
+        try:
+            await outbox.call(
+                chat_id,
+                lambda: update.message.reply_document(document=data, filename=filename),
+                method="document",
+            )
+        except TelegramError as e:
+            raise _PartUploadError(index, filename, e) from e
+
+    writer = _PartWriter(_max_upload_bytes(), emit, asyncio.get_running_loop(), config.getfile_max_parts)
+    # Not on the file_cache pool: the producer holds its thread for the whole transfer
+    await asyncio.to_thread(producer, *producer_args, writer)
+    return writer.parts
+
+
+async def send_file(
+    update: Update,
+    file_path: str,
+    base_dir: str | None = None,
+    include: list[str] | None = None,
+    exclude: list[str] | None = None,
+    archive: str = "zip",
+):
+    """Send a file or directory from server to telegram.
+
+    Directories are archived on the fly (zip, or tar.zst / tar.gz) without a
+    temp copy; anything over files.max_upload_mb goes out in numbered parts
+    (``cat name.part* > name`` to join).
+    """
     expanded = os.path.expanduser(file_path)
-    if not os.path.exists(expanded):
+    if base_dir and not os.path.isabs(expanded):
+        expanded = os.path.join(os.path.expanduser(base_dir), expanded)
+    target = await file_cache.run_io(_stat_target, expanded)
+    if target is None:
         await update.message.reply_text(f"파일을 찾을 수 없습니다: {file_path}")
         return
+    is_dir, file_size = target
 
-    file_size = os.path.getsize(expanded)
-    if file_size > MAX_UPLOAD_BYTES:
-        await update.message.reply_text(f"파일이 너무 큽니다 ({file_size // 1024 // 1024}MB, 최대 50MB)")
+    max_bytes = _max_upload_bytes()
+    max_parts = get_config().files.getfile_max_parts
+    try:
+        if is_dir:
+            files = await file_cache.run_io(_select_files, expanded, include or [], exclude or [])
+            if not files:
+                await update.message.reply_text("조건에 맞는 파일이 없습니다.")
+                return
+            name = os.path.basename(os.path.normpath(expanded)) + _archive_suffix(archive)
+            parts = await _send_parts(update, name, _write_archive, files, archive)
+        else:
+            if file_size <= max_bytes:
+                # Read once off the loop; a flood-control retry re-sends the same bytes
+                data = await file_cache.run_io(_read_bytes, expanded)
+                await outbox.call(
+                    update.effective_chat.id,
+                    lambda: update.message.reply_document(document=data, filename=os.path.basename(expanded)),
+                    method="document",
+                )
+                return
+            if -(-file_size // max_bytes) > max_parts:
+                await update.message.reply_text(
+                    f"파일이 너무 큽니다 ({file_size // 1024 // 1024}MB, "
+                    f"최대 {max_bytes // 1024 // 1024}MB × {max_parts}개)"
+                )
+                return
+            name = os.path.basename(expanded)
+            parts = await _send_parts(update, name, _copy_file, expanded)
+    except _PartUploadError as e:
+        logger.warning("분할 전송 실패: %s (%d번째)", expanded, e.index, exc_info=True)
+        sent = f"\n앞의 {e.index - 1}개 조각만 전송됨, 처음부터 다시 받아주세요." if e.index > 1 else ""
+        await update.message.reply_text(f"❌ {e.filename} 전송 실패: {e.error}{sent}")
+        return
+    except (OSError, ValueError, zipfile.LargeZipFile, TelegramError) as e:
+        logger.warning("파일 전송 실패: %s", expanded, exc_info=True)
+        await update.message.reply_text(f"❌ 파일 전송 실패: {e}")
         return
 
-    await update.message.reply_document(document=open(expanded, "rb"), filename=os.path.basename(expanded))
+    if parts > 1:
+        await update.message.reply_text(f"📦 {parts}개로 나눠 보냈습니다. 합치기: cat {name}.part* > {name}")
@@ -1,4 +1,3 @@
-import json
 import os
 import functools
 import logging
@@ -6,58 +5,122 @@ from telegram import Update
 from telegram.ext import ContextTypes
 
 from claude.runner import run_claude, cancel_task, is_running
-from claude.context import build_full_prompt, load_system_prompt, save_system_prompt
+from claude.context import build_full_prompt, load_system_prompt, refresh_prefix, save_system_prompt
+from claude.session import get_session, remember_session, forget_sessions
+from memory.prompts import estimate_tokens
+from memory import file_cache
 from memory.persona import load_persona_file, save_persona_file, VALID_NAMES
 from claude.queue import execution_queue
 from claude.retry import retry_queue
-from db.store import save_execution, save_conversation, get_recent_executions, get_recent_conversations
+from claude.breaker import rate_limit_breaker
+from claude.cache import response_cache
+from claude.pool import warm_pool
+from db.store import (
+    search_executions,
+    save_execution,
+    save_conversation,
+    get_recent_executions,
+    get_recent_conversations,
+    clear_conversations,
+)
 from memory.manager import load_memory, append_to_memory, clear_today_log, get_memory_summary
-from bot.sender import send_long_message, ProgressIndicator
-from bot.file_transfer import handle_file_upload, send_file
+from bot.outbox import outbox
+from bot.sender import send_long_message, ProgressIndicator, StreamingReply
+from bot.file_transfer import handle_file_upload, parse_getfile_args, send_file
 from bot.safety import needs_confirmation, request_confirmation
+from config import get_config
+from metrics import registry
 
 logger = logging.getLogger(__name__)
 
-CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "config.json")
-
 # Per-user working directory
 _work_dirs: dict[int, str] = {}
 
 
-def _load_config() -> dict:
-    if os.path.exists(CONFIG_PATH):
-        with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
-
-
 def _get_work_dir(user_id: int) -> str:
-    config = _load_config()
-    default = os.path.expanduser(config.get("claude", {}).get("default_work_dir", "~"))
-    return _work_dirs.get(user_id, default)
+    if user_id in _work_dirs:
+        return _work_dirs[user_id]
+    return os.path.expanduser(get_config().claude.default_work_dir)
 
 
 def _get_timeout() -> int:
-    config = _load_config()
-    return config.get("claude", {}).get("timeout_sec", 300)
+    return get_config().claude.timeout_sec
 
 
-def _get_max_turns() -> int:
-    config = _load_config()
-    return config.get("memory", {}).get("max_context_turns", 5)
+def _get_response_limit() -> int:
+    return get_config().memory.response_save_limit
+
+
+async def _build_prompt(user_message: str) -> str:
+    memory_config = get_config().memory
+    return await build_full_prompt(
+        user_message,
+        max_turns=memory_config.max_context_turns,
+        token_budget=memory_config.prompt_token_budget,
+        relevant_turns=memory_config.relevant_turns,
+        memory_chars=memory_config.memory_md_max_chars,
+        memory_top_k=memory_config.memory_top_k,
+    )
 
 
-def _get_response_limit() -> int:
-    config = _load_config()
-    return config.get("memory", {}).get("response_save_limit", 500)
+def _prompt_size(prompt: str) -> dict:
+    return {"prompt_chars": len(prompt), "prompt_tokens": estimate_tokens(prompt)}
+
+
+async def _run_in_session(
+    user_message: str, work_dir: str, chat_id: int, on_event=None, cache_source: str | None = None
+) -> dict:
+    """Resume the chat's Claude session with just the new message, or start one with the full prompt.
+
+    Only fresh full-prompt runs can be served from the response cache (``cache_source``).
+    """
+    claude_config = get_config().claude
+    _, _, version = await refresh_prefix()
+    session_id = None
+    if claude_config.session_reuse:
+        session_id = await get_session(chat_id, work_dir, version)
+
+    if session_id:
+        result = await run_claude(
+            user_message, work_dir, timeout_sec=claude_config.timeout_sec, chat_id=chat_id,
+            on_event=on_event, resume=session_id,
+        )
+        if result["status"] != "session_expired":
+            if result["status"] == "success" and result.get("session_id"):
+                await remember_session(chat_id, work_dir, result["session_id"], version, resumed=True)
+            return {**result, **_prompt_size(user_message)}
+        logger.info("세션 만료, 전체 맥락으로 다시 시작: %s", session_id)
+        await forget_sessions(chat_id, work_dir)
+
+    prompt = await _build_prompt(user_message)
+    result = await run_claude(
+        prompt, work_dir, timeout_sec=claude_config.timeout_sec, chat_id=chat_id, on_event=on_event,
+        cache_source=cache_source,
+    )
+    if claude_config.session_reuse and result["status"] == "success" and result.get("session_id"):
+        await remember_session(chat_id, work_dir, result["session_id"], version, resumed=False)
+    return {**result, **_prompt_size(prompt)}
+
+
+def _start_stream(update: Update, progress: ProgressIndicator) -> StreamingReply | None:
+    claude_config = get_config().claude
+    if not claude_config.streaming:
+        return None
+    return StreamingReply(update, progress, claude_config.stream_edit_interval_sec)
+
+
+async def _reply(update: Update, stream: StreamingReply | None, text: str):
+    if stream:
+        await stream.finish(text)
+    else:
+        await send_long_message(update, text)
 
 
 def authorized(func):
     """Decorator to check if user is in allowed_user_ids."""
     @functools.wraps(func)
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
-        config = _load_config()
-        allowed = config.get("telegram", {}).get("allowed_user_ids", [])
+        allowed = get_config().telegram.allowed_user_ids
         user_id = update.effective_user.id
         if allowed and user_id not in allowed:
             logger.warning("Unauthorized access from user %d", user_id)
@@ -82,20 +145,18 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not approved:
             return
 
-    # Queue check
-    pending = execution_queue.pending_count
-    if pending > 0:
-        await update.message.reply_text(f"📋 대기 중 (앞에 {pending}개 작업)")
-
-    async def _execute():
-        prompt = await build_full_prompt(user_message, max_turns=_get_max_turns())
-        return await run_claude(prompt, work_dir, timeout_sec=_get_timeout(), chat_id=chat_id)
-
     progress = ProgressIndicator(update, context)
     await progress.start()
+    stream = _start_stream(update, progress)
 
     try:
-        future = await execution_queue.submit(_execute)
+        future = await execution_queue.submit(
+            _run_in_session, user_message, work_dir, chat_id,
+            on_event=stream.on_event if stream else None,
+            cache_source="telegram",
+            owner=chat_id,
+        )
+        progress.track(future)
         result = await future
     finally:
         await progress.stop()
@@ -112,31 +173,24 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         work_dir=work_dir,
         status=result["status"],
         error_message=result.get("error"),
+        prompt_chars=result.get("prompt_chars"),
+        prompt_tokens=result.get("prompt_tokens"),
     )
 
     # Log to memory
     from memory.manager import log_conversation
-    log_conversation(user_message, response_text)
+    await file_cache.run_io(log_conversation, user_message, response_text)
 
     # Handle rate limit retry
     if result["status"] == "rate_limited":
-        await update.message.reply_text("⚠️ API 한도 초과. 5분 후 자동 재시도합니다.")
-
-        async def retry_callback(retry_result, error):
-            if error:
-                await update.message.reply_text(f"❌ 재시도 실패: {error}")
-            elif retry_result:
-                text = retry_result.get("result") or retry_result.get("error") or "(응답 없음)"
-                await send_long_message(update, f"🔄 재시도 결과:\n{text}")
-
-        async def retry_run(p, w):
-            return await run_claude(p, w, timeout_sec=_get_timeout(), chat_id=chat_id)
-
-        prompt = await build_full_prompt(user_message, max_turns=_get_max_turns())
-        asyncio.create_task(retry_queue.schedule_retry(retry_run, prompt, work_dir, retry_callback))
+        prompt = await _build_prompt(user_message)
+        delay = await retry_queue.schedule(
+            "telegram", prompt, work_dir, chat_id=chat_id, error=result.get("error")
+        )
+        await _reply(update, stream, f"⚠️ API 한도 초과. 약 {max(1, round(delay / 60))}분 후 자동 재시도합니다.")
         return
 
-    await send_long_message(update, response_text)
+    await _reply(update, stream, response_text)
 
 
 # ─── File handler ───
@@ -153,13 +207,17 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
     caption = update.message.caption or "이 파일을 확인해주세요"
     user_message = f"사용자가 파일을 보냈습니다: {local_path}\n{caption}"
 
-    prompt = await build_full_prompt(user_message, max_turns=_get_max_turns())
     progress = ProgressIndicator(update, context)
     await progress.start()
+    stream = _start_stream(update, progress)
     try:
         future = await execution_queue.submit(
-            run_claude, prompt, work_dir, _get_timeout(), chat_id
+            _run_in_session, user_message, work_dir, chat_id,
+            on_event=stream.on_event if stream else None,
+            owner=chat_id,
+            priority="file",
         )
+        progress.track(future)
         result = await future
     finally:
         await progress.stop()
@@ -167,10 +225,14 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
     response_text = result.get("result") or result.get("error") or "(응답 없음)"
     trimmed = response_text[:_get_response_limit()]
     await save_conversation(user_message, trimmed, work_dir, result["duration"])
-    await save_execution("telegram", user_message, response_text, result["duration"], work_dir, result["status"], result.get("error"))
+    await save_execution(
+        "telegram", user_message, response_text, result["duration"], work_dir, result["status"], result.get("error"),
+        prompt_chars=result.get("prompt_chars"),
+        prompt_tokens=result.get("prompt_tokens"),
+    )
     from memory.manager import log_conversation
-    log_conversation(caption, response_text)
-    await send_long_message(update, response_text)
+    await file_cache.run_io(log_conversation, caption, response_text)
+    await _reply(update, stream, response_text)
 
 
 # ─── Command handlers ───
@@ -181,7 +243,7 @@ async def cmd_cd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("사용법: /cd <경로>")
         return
     path = os.path.expanduser(" ".join(context.args))
-    if not os.path.isdir(path):
+    if not await file_cache.run_io(os.path.isdir, path):
         await update.message.reply_text(f"디렉토리가 존재하지 않습니다: {path}")
         return
     _work_dirs[update.effective_user.id] = path
@@ -217,7 +279,7 @@ async def cmd_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
         lines.append("🤖 Claude: (확인 불가)")
 
     # Memory
-    mem = load_memory()
+    mem = await file_cache.run_io(load_memory)
     lines.append(f"🧠 메모리: {len(mem)}자")
 
     # Work dir
@@ -226,6 +288,24 @@ async def cmd_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Queue
     lines.append(f"📋 대기 큐: {execution_queue.pending_count}개")
+    lines.append(f"⚙️ 실행 중: {execution_queue.running_count}/{execution_queue.max_concurrent}")
+    for priority, (pending, running) in execution_queue.class_counts().items():
+        if pending or running:
+            lines.append(f"   {priority}: 대기 {pending} / 실행 {running}")
+    if warm_pool.enabled():
+        lines.append(f"🔥 웜 프로세스: {warm_pool.idle_count()}개 대기")
+    if retry_queue.pending_count:
+        lines.append(f"🔄 재시도 대기: {retry_queue.pending_count}개")
+    cache_stats = response_cache.stats()
+    if get_config().cache.enabled or cache_stats["hits"] or cache_stats["misses"]:
+        lines.append(
+            f"💾 응답 캐시: 적중 {cache_stats['hits']} / 미스 {cache_stats['misses']}, "
+            f"{cache_stats['entries']}개 ({cache_stats['bytes'] // 1024}KB)"
+        )
+    if outbox.pending_count:
+        lines.append(f"📤 전송 대기: {outbox.pending_count}개")
+    if rate_limit_breaker.state != "closed":
+        lines.append(f"🚧 API 한도 차단 중 ({rate_limit_breaker.state}, {rate_limit_breaker.retry_in():.0f}초)")
 
     await update.message.reply_text("\n".join(lines))
 
@@ -252,9 +332,55 @@ async def cmd_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await send_long_message(update, "\n".join(lines))
 
 
+def _format_seconds(value: float) -> str:
+    if value == float("inf"):
+        return "∞"
+    return f"{value * 1000:.0f}ms" if value < 1 else f"{value:.1f}s"
+
+
+@authorized
+async def cmd_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    rows = registry.summary()
+    counters = registry.counters()
+    if not rows and not counters:
+        await update.message.reply_text("아직 수집된 지표가 없습니다.")
+        return
+    lines = ["📈 단계별 지연 시간 (p50/p95는 버킷 상한)\n"]
+    for row in rows:
+        name = row["name"].removeprefix("kkabi_").removesuffix("_seconds")
+        labels = ",".join(f"{k}={v}" for k, v in row["labels"].items())
+        lines.append(
+            f"{name}{f' [{labels}]' if labels else ''}: {row['count']}회, 평균 {_format_seconds(row['avg'])}, "
+            f"p50 ≤{_format_seconds(row['p50'])}, p95 ≤{_format_seconds(row['p95'])}"
+        )
+    for counter in counters:
+        lines.append(f"{counter['name'].removeprefix('kkabi_')}: {counter['value']:g}")
+    await send_long_message(update, "\n".join(lines))
+
+
+@authorized
+async def cmd_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not context.args:
+        await update.message.reply_text("사용법: /search <검색어>")
+        return
+    query = " ".join(context.args)
+    hits = await search_executions(query, limit=10)
+    if not hits:
+        await update.message.reply_text(f"검색 결과가 없습니다: {query}")
+        return
+    lines = [f"🔎 '{query}' 검색 결과 {len(hits)}개\n"]
+    for h in hits:
+        ts = h["timestamp"][:16]
+        status_icon = {"success": "✅", "error": "❌", "timeout": "⏰", "rate_limited": "🔄"}.get(h["status"], "❓")
+        source = f"cron:{h['cron_id']}" if h["cron_id"] else h["source"]
+        lines.append(f"{status_icon} [{ts}] ({source}) {h['prompt'][:40]}")
+        lines.append(f"   {h['snippet']}")
+    await send_long_message(update, "\n".join(lines))
+
+
 @authorized
 async def cmd_memory(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    summary = get_memory_summary()
+    summary = await file_cache.run_io(get_memory_summary)
     await send_long_message(update, f"🧠 메모리 내용:\n\n{summary}")
 
 
@@ -264,13 +390,13 @@ async def cmd_memory_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("사용법: /memory_add <내용>")
         return
     text = " ".join(context.args)
-    append_to_memory(text)
+    await file_cache.run_io(append_to_memory, text)
     await update.message.reply_text(f"✅ 메모리에 추가됨: {text}")
 
 
 @authorized
 async def cmd_memory_clear(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if clear_today_log():
+    if await file_cache.run_io(clear_today_log):
         await update.message.reply_text("🗑 오늘 로그 초기화 완료")
     else:
         await update.message.reply_text("오늘 로그가 없습니다.")
@@ -278,23 +404,21 @@ async def cmd_memory_clear(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 @authorized
 async def cmd_forget(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    # Clear conversation history by deleting all records
-    import aiosqlite
-    from db.store import DB_PATH
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("DELETE FROM conversations")
-        await db.commit()
+    # Clear conversation history by deleting all records, and drop Claude sessions that remember it
+    await clear_conversations()
+    await forget_sessions()
+    warm_pool.forget()
     await update.message.reply_text("🔄 대화 맥락 초기화 완료")
 
 
 @authorized
 async def cmd_system(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args:
-        current = load_system_prompt()
+        current = await file_cache.run_io(load_system_prompt)
         await send_long_message(update, f"현재 시스템 프롬프트:\n\n{current}")
         return
     new_prompt = " ".join(context.args)
-    save_system_prompt(new_prompt)
+    await file_cache.run_io(save_system_prompt, new_prompt)
     await update.message.reply_text(f"✅ 시스템 프롬프트 변경됨:\n{new_prompt}")
 
 
@@ -317,7 +441,7 @@ async def cmd_persona(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # View
     if len(context.args) == 1:
-        content = load_persona_file(name)
+        content = await file_cache.run_io(load_persona_file, name)
         if not content:
             await update.message.reply_text(f"[{name.upper()}] 파일이 비어있습니다.")
         else:
@@ -326,17 +450,23 @@ async def cmd_persona(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Edit
     new_content = " ".join(context.args[1:])
-    save_persona_file(name, new_content)
+    await file_cache.run_io(save_persona_file, name, new_content)
     await update.message.reply_text(f"✅ {name.upper()}.md 변경됨")
 
 
 @authorized
 async def cmd_getfile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    usage = "사용법: /getfile <경로> [--include 패턴] [--exclude 패턴] [--zip|--tar]"
     if not context.args:
-        await update.message.reply_text("사용법: /getfile <경로>")
+        await update.message.reply_text(usage)
+        return
+    try:
+        file_path, include, exclude, archive = parse_getfile_args(context.args)
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}\n{usage}")
         return
-    file_path = " ".join(context.args)
-    await send_file(update, file_path)
+    work_dir = _get_work_dir(update.effective_user.id)
+    await send_file(update, file_path, work_dir, include, exclude, archive)
 
 
 @authorized
@@ -368,16 +498,18 @@ async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /cd <경로> — 작업 디렉토리 변경
 /pwd — 현재 작업 디렉토리
 /status — 시스템 상태
+/stats — 단계별 지연 시간 통계
 /history [N] — 최근 실행 기록
+/search <검색어> — 실행 기록 전문 검색
 /memory — 메모리 내용
 /memory\\_add <내용> — 메모리에 추가
 /memory\\_clear — 오늘 로그 초기화
 /forget — 대화 맥락 초기화
 /system [프롬프트] — 시스템 프롬프트 확인/변경
 /persona <soul|user|mood> — 페르소나 조회/변경
-/getfile <경로> — 서버 파일 다운로드
+/getfile <경로> [--include/--exclude 패턴] [--zip|--tar] — 서버 파일/폴더 다운로드
 /cron list — 크론잡 목록
-/cron add <표현식> <설명> — 크론잡 추가
+/cron add <표현식> <설명> \\[옵션=값] — 크론잡 추가
 /cron remove <ID> — 크론잡 삭제
 /cron toggle <ID> — 크론잡 활성화/비활성화
 /cancel — 현재 작업 취소
@@ -390,7 +522,7 @@ async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 @authorized
 async def cmd_cron(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    from scheduler.cron import list_crons, add_cron, remove_cron, toggle_cron
+    from scheduler.cron import list_crons, add_cron, remove_cron, toggle_cron, parse_cron_options, CRON_OPTIONS
 
     if not context.args:
         await update.message.reply_text("사용법: /cron list | add | remove | toggle")
@@ -407,20 +539,35 @@ async def cmd_cron(update: Update, context: ContextTypes.DEFAULT_TYPE):
         for c in crons:
             status = "✅" if c.get("enabled", True) else "⏸"
             lines.append(f"{status} `{c['id']}` — {c.get('name', c['id'])}\n   {c['cron']} | {c['prompt'][:40]}...")
+            opts = " ".join(f"{k}={c[k]}" for k in CRON_OPTIONS if k in c)
+            if opts:
+                lines.append(f"   ⚙️ {opts}")
+            if c.get("last_run"):
+                lines.append(f"   🕘 최근: {c['last_run']} ({c.get('last_status')}, {c.get('last_duration')}초)")
+            if c.get("next_run"):
+                lines.append(f"   ⏭ 다음: {c['next_run']}")
         await send_long_message(update, "\n".join(lines))
 
     elif sub == "add":
-        # /cron add "*/5 * * * *" "설명"
+        # /cron add "*/5 * * * *" "설명" [jitter=30 max_instances=1 coalesce=true misfire=300 jitter_mode=hash]
         rest = " ".join(context.args[1:])
         parts = rest.split('"')
-        quoted = [p.strip() for p in parts if p.strip()]
+        quoted = [p.strip() for p in parts[1::2] if p.strip()]
         if len(quoted) < 2:
-            await update.message.reply_text('사용법: /cron add "표현식" "프롬프트/설명"')
+            await update.message.reply_text(
+                '사용법: /cron add "표현식" "프롬프트/설명" [옵션=값 ...]\n'
+                f"옵션: {', '.join(CRON_OPTIONS)}"
+            )
             return
         cron_expr = quoted[0]
         prompt = quoted[1]
+        try:
+            options = parse_cron_options(" ".join(parts[2::2]).split())
+        except ValueError as e:
+            await update.message.reply_text(f"❌ {e}")
+            return
         work_dir = _get_work_dir(update.effective_user.id)
-        cron_id = add_cron(cron_expr, prompt, work_dir)
+        cron_id = await add_cron(cron_expr, prompt, work_dir, options=options)
         await update.message.reply_text(f"✅ 크론잡 추가됨: `{cron_id}`\n{cron_expr} → {prompt}")
 
     elif sub == "remove":
@@ -428,7 +575,7 @@ async def cmd_cron(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("사용법: /cron remove <ID>")
             return
         cron_id = context.args[1]
-        if remove_cron(cron_id):
+        if await remove_cron(cron_id):
             await update.message.reply_text(f"🗑 크론잡 삭제됨: {cron_id}")
         else:
             await update.message.reply_text(f"크론잡을 찾을 수 없습니다: {cron_id}")
@@ -438,7 +585,7 @@ async def cmd_cron(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("사용법: /cron toggle <ID>")
             return
         cron_id = context.args[1]
-        new_state = toggle_cron(cron_id)
+        new_state = await toggle_cron(cron_id)
         if new_state is not None:
             icon = "✅ 활성화" if new_state else "⏸ 비활성화"
             await update.message.reply_text(f"{icon}: {cron_id}")
@@ -0,0 +1,249 @@
+import asyncio
+import bisect
+import datetime
+import itertools
+import logging
+import time
+
+from telegram.error import RetryAfter
+
+from config import get_config
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Lower value = sent first
+PRIORITIES = {"interactive": 0, "notify": 1, "progress": 2}
+
+# Drop idle per-chat buckets once there are this many
+_MAX_IDLE_BUCKETS = 256
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until one token is available (0 = now)."""
+        self._refill(now)
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def take(self):
+        self._tokens -= 1
+
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return self._tokens >= self.capacity
+
+
+class _Entry:
+    __slots__ = ("order", "chat_id", "factory", "method", "key", "future", "attempts")
+
+    def __init__(self, order, chat_id, factory, method, key, future):
+        self.order = order
+        self.chat_id = chat_id
+        self.factory = factory
+        self.method = method
+        self.key = key
+        self.future = future
+        self.attempts = 0
+
+    def __lt__(self, other: "_Entry") -> bool:
+        return self.order < other.order
+
+
+def _retry_seconds(error: RetryAfter) -> float:
+    value = error.retry_after
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+    return float(value)
+
+
+class Outbox:
+    """Single outbound path for Telegram sends and edits.
+
+    Calls are queued and dispatched under a global token bucket and one bucket
+    per chat (Telegram allows ~30 messages/s overall, ~1/s per private chat
+    and 20/min per group). ``interactive`` replies always go before
+    ``notify`` traffic such as cron results, and ``progress`` edits go last
+    (re-submitting a keyed edit at a higher priority promotes it); within a
+    chat, calls of the same
+    priority keep their order and only one is in flight at a time. A
+    ``RetryAfter`` from Telegram pauses that chat and puts the call back at
+    the head of its queue. Edits submitted with a ``key`` replace a
+    still-pending edit with the same key, so a busy chat only gets the latest
+    text.
+    """
+
+    def __init__(self):
+        self._pending: list[_Entry] = []
+        self._by_key: dict = {}
+        self._inflight: set[int] = set()
+        self._tasks: set[asyncio.Task] = set()
+        self._chat_buckets: dict[int, TokenBucket] = {}
+        self._global: TokenBucket | None = None
+        self._hold: dict[int, float] = {}
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._loop_task: asyncio.Task | None = None
+
+    def submit(self, chat_id: int, factory, priority: str = "interactive", method: str = "send", key=None):
+        """Queue ``factory()`` (a coroutine function making one Bot API call). Returns a future with its result."""
+        if key is not None and key in self._by_key:
+            entry = self._by_key[key]
+            entry.factory = factory
+            entry.method = method
+            rank = PRIORITIES[priority]
+            if rank < entry.order[0]:
+                self._pending.remove(entry)
+                entry.order = (rank, entry.order[1])
+                bisect.insort(self._pending, entry)
+                self._wakeup.set()
+            return entry.future
+        future = asyncio.get_running_loop().create_future()
+        entry = _Entry((PRIORITIES[priority], next(self._seq)), chat_id, factory, method, key, future)
+        bisect.insort(self._pending, entry)
+        if key is not None:
+            self._by_key[key] = entry
+        if self._loop_task is None or self._loop_task.done():
+            self._loop_task = asyncio.create_task(self._run())
+        self._wakeup.set()
+        return future
+
+    async def call(self, chat_id: int, factory, priority: str = "interactive", method: str = "send", key=None):
+        return await self.submit(chat_id, factory, priority, method, key)
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    async def stop(self, timeout: float = 5.0):
+        """Give queued sends up to ``timeout`` seconds to go out, then cancel the rest."""
+        deadline = time.monotonic() + timeout
+        while (self._pending or self._tasks) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        tasks = [t for t in (self._loop_task, *self._tasks) if t]
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        for entry in self._pending:
+            if not entry.future.done():
+                entry.future.cancel()
+        if self._pending:
+            logger.warning("보내지 못한 텔레그램 메시지 %d개 폐기", len(self._pending))
+        self._pending.clear()
+        self._by_key.clear()
+        self._tasks.clear()
+        self._inflight.clear()
+        self._loop_task = None
+
+    def _chat_bucket(self, chat_id: int, now: float) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= _MAX_IDLE_BUCKETS:
+                for cid in [c for c, b in self._chat_buckets.items() if b.idle(now)]:
+                    del self._chat_buckets[cid]
+            telegram_config = get_config().telegram
+            if chat_id < 0:
+                bucket = TokenBucket(telegram_config.group_rate_per_min / 60, 1)
+            else:
+                bucket = TokenBucket(telegram_config.chat_rate_per_sec, telegram_config.chat_burst)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _next_entry(self) -> tuple[_Entry | None, float | None]:
+        """Pop the next sendable entry, or return how long to wait (None = until woken)."""
+        now = time.monotonic()
+        telegram_config = get_config().telegram
+        if self._global is None:
+            self._global = TokenBucket(telegram_config.global_rate_per_sec, telegram_config.global_rate_per_sec)
+        self._global.rate = self._global.capacity = telegram_config.global_rate_per_sec
+        if not self._pending:
+            return None, None
+        global_wait = self._global.wait_time(now)
+        if global_wait > 0:
+            return None, global_wait
+
+        wait = None
+        seen: set[int] = set()
+        for i, entry in enumerate(self._pending):
+            chat_id = entry.chat_id
+            if chat_id in seen:
+                continue
+            seen.add(chat_id)
+            if chat_id in self._inflight:
+                continue
+            bucket = self._chat_bucket(chat_id, now)
+            chat_wait = max(self._hold.get(chat_id, 0.0) - now, bucket.wait_time(now))
+            if chat_wait <= 0:
+                self._hold.pop(chat_id, None)
+                bucket.take()
+                self._global.take()
+                del self._pending[i]
+                if entry.key is not None:
+                    self._by_key.pop(entry.key, None)
+                return entry, 0.0
+            wait = chat_wait if wait is None else min(wait, chat_wait)
+        return None, wait
+
+    async def _run(self):
+        while True:
+            entry, wait = self._next_entry()
+            if entry is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._inflight.add(entry.chat_id)
+            task = asyncio.create_task(self._send(entry))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, entry: _Entry):
+        try:
+            with registry.timer("kkabi_telegram_send_seconds", method=entry.method):
+                result = await entry.factory()
+        except RetryAfter as e:
+            delay = _retry_seconds(e)
+            registry.inc("kkabi_telegram_retry_after_total")
+            self._hold[entry.chat_id] = time.monotonic() + delay
+            entry.attempts += 1
+            if entry.attempts > get_config().telegram.send_max_retries:
+                logger.warning("텔레그램 전송 포기 (chat %s, 429 %d회)", entry.chat_id, entry.attempts)
+                entry.future.set_exception(e)
+            elif entry.key is not None and entry.key in self._by_key:
+                # A newer edit for the same message is already queued
+                entry.future.set_result(None)
+            else:
+                logger.info("텔레그램 flood control: chat %s %.0f초 대기", entry.chat_id, delay)
+                bisect.insort(self._pending, entry)
+                if entry.key is not None:
+                    self._by_key[entry.key] = entry
+        except asyncio.CancelledError:
+            entry.future.cancel()
+            raise
+        except Exception as e:
+            entry.future.set_exception(e)
+        else:
+            entry.future.set_result(result)
+        finally:
+            self._inflight.discard(entry.chat_id)
+            self._wakeup.set()
+
+
+outbox = Outbox()
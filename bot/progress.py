@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import time
+
+from bot.outbox import outbox
+from claude.queue import execution_queue
+from config import get_config
+
+logger = logging.getLogger(__name__)
+
+# How often the ticker looks at the tracked requests
+_TICK_SEC = 2
+# A running request's elapsed time is refreshed at most this often
+_REFRESH_SEC = 10
+
+
+def _format_wait(seconds: float) -> str:
+    if seconds < 60:
+        return f"{max(1, round(seconds))}초"
+    return f"{round(seconds / 60)}분"
+
+
+class ProgressTicker:
+    """One loop that keeps every in-flight progress message up to date.
+
+    Each tracked message shows the request's queue position and estimated
+    wait while it is queued, and the elapsed time once it runs. A message is
+    edited when what it shows changes (position, state) or every
+    ``_REFRESH_SEC`` for the elapsed time. Edits go through the outbox at
+    ``progress`` priority, keyed per message so a backed-up chat only gets
+    the latest text, and each tick edits at most half of the global send
+    budget, oldest-updated first.
+    """
+
+    def __init__(self):
+        self._tracked: dict = {}  # indicator -> state dict
+        self._task: asyncio.Task | None = None
+
+    def add(self, indicator, message):
+        self._tracked[indicator] = {
+            "message": message,
+            "future": None,
+            "started": time.monotonic(),
+            "shown": ("running",),
+            "edited": time.monotonic(),
+        }
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def track(self, indicator, future: asyncio.Future):
+        """Link a progress message to its execution-queue job."""
+        state = self._tracked.get(indicator)
+        if state is not None:
+            state["future"] = future
+
+    def discard(self, indicator):
+        self._tracked.pop(indicator, None)
+
+    @property
+    def tracked_count(self) -> int:
+        return len(self._tracked)
+
+    def _render(self, state: dict, now: float) -> tuple[tuple, str]:
+        """(what changed, text) for one message."""
+        elapsed = int(now - state["started"])
+        future = state["future"]
+        ahead = execution_queue.position(future) if future is not None else None
+        if ahead is not None:
+            wait = execution_queue.estimated_wait(ahead)
+            eta = f", 예상 대기 약 {_format_wait(wait)}" if wait is not None else ""
+            return ("queued", ahead), f"📋 대기 중 (앞에 {ahead}개 작업{eta})\n⏱ {elapsed}초 경과"
+        if elapsed < _REFRESH_SEC:
+            return ("running",), "⏳ 처리 중..."
+        return ("running",), f"⏳ 처리 중... ({elapsed}초 경과)"
+
+    def _tick(self):
+        now = time.monotonic()
+        due = []
+        for indicator, state in self._tracked.items():
+            shown, text = self._render(state, now)
+            if shown != state["shown"] or now - state["edited"] >= _REFRESH_SEC:
+                due.append((state["edited"], id(indicator), state, shown, text))
+        budget = max(1, int(get_config().telegram.global_rate_per_sec * _TICK_SEC / 2))
+        for _, _, state, shown, text in sorted(due)[:budget]:
+            message = state["message"]
+            state["shown"] = shown
+            state["edited"] = now
+            future = outbox.submit(
+                message.chat_id,
+                lambda message=message, text=text: message.edit_text(text),
+                priority="progress",
+                method="edit",
+                key=("edit", message.chat_id, message.message_id),
+            )
+            future.add_done_callback(_ignore_result)
+
+    async def _run(self):
+        while self._tracked:
+            await asyncio.sleep(_TICK_SEC)
+            try:
+                self._tick()
+            except Exception:
+                logger.exception("진행 표시 갱신 실패")
+
+
+def _ignore_result(future: asyncio.Future):
+    # Edits fail routinely (message deleted, text unchanged); nobody awaits them
+    if not future.cancelled():
+        future.exception()
+
+
+progress_ticker = ProgressTicker()
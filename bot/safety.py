@@ -1,30 +1,19 @@
-import json
-import os
 import asyncio
 import logging
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import ContextTypes
 
-logger = logging.getLogger(__name__)
+from config import get_config
 
-CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "config.json")
+logger = logging.getLogger(__name__)
 
 # Pending confirmations: callback_data_id -> asyncio.Future
 _pending: dict[str, asyncio.Future] = {}
 _counter = 0
 
 
-def _load_safety_config() -> dict:
-    if os.path.exists(CONFIG_PATH):
-        with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-            config = json.load(f)
-        return config.get("safety", {})
-    return {}
-
-
 def needs_confirmation(message: str) -> bool:
-    config = _load_safety_config()
-    keywords = config.get("confirm_keywords", [])
+    keywords = get_config().safety.confirm_keywords
     lower = message.lower()
     return any(kw.lower() in lower for kw in keywords)
 
@@ -34,8 +23,7 @@ async def request_confirmation(update: Update, context: ContextTypes.DEFAULT_TYP
     _counter += 1
     confirm_id = f"safety_{_counter}"
 
-    config = _load_safety_config()
-    confirm_msg = config.get("confirm_message", "⚠️ 위험할 수 있는 작업입니다. 실행할까요?")
+    confirm_msg = get_config().safety.confirm_message
 
     keyboard = InlineKeyboardMarkup([
         [
@@ -50,7 +38,7 @@ async def request_confirmation(update: Update, context: ContextTypes.DEFAULT_TYP
         parse_mode="Markdown",
     )
 
-    future = asyncio.get_event_loop().create_future()
+    future = asyncio.get_running_loop().create_future()
     _pending[confirm_id] = future
 
     try:
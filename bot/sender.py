@@ -1,76 +1,295 @@
 import asyncio
+import gzip
 import logging
+import re
+import time
 from telegram import Update
 from telegram.ext import ContextTypes
 
+from bot.outbox import outbox
+from bot.progress import progress_ticker
+from config import get_config
+from memory import file_cache
+
 logger = logging.getLogger(__name__)
 
 MAX_MESSAGE_LENGTH = 4096
+# Inline preview sent as the document caption (Telegram allows 1024 chars)
+PREVIEW_CHARS = 700
+
+_FENCE_LINE = re.compile(r"^[ \t]*(```[^\n]*)", re.MULTILINE)
+_CLOSE_FENCE = "\n```"
 
 
 async def send_long_message(update: Update, text: str):
-    """Send a message, splitting into chunks if needed."""
+    """Send a message, splitting into chunks if needed. Oversized text goes out as a document."""
     if not text:
         text = "(빈 응답)"
-    chunks = split_message(text)
-    for chunk in chunks:
-        await update.message.reply_text(chunk)
+    chat_id = update.effective_chat.id
+    if is_oversized(text):
+        await send_as_document(chat_id, text, update.message.reply_document)
+        return
+    futures = [
+        outbox.submit(chat_id, lambda chunk=chunk: update.message.reply_text(chunk))
+        for chunk in iter_chunks(text)
+    ]
+    await asyncio.gather(*futures)
+
+
+async def send_text(bot, chat_id: int, text: str, priority: str = "notify"):
+    """Send ``text`` to ``chat_id`` outside of a reply (cron results, retries)."""
+    if is_oversized(text):
+        async def send_document(**kwargs):
+            return await bot.send_document(chat_id=chat_id, **kwargs)
+
+        await send_as_document(chat_id, text, send_document, priority)
+        return
+    futures = [
+        outbox.submit(chat_id, lambda chunk=chunk: bot.send_message(chat_id=chat_id, text=chunk), priority)
+        for chunk in iter_chunks(text)
+    ]
+    await asyncio.gather(*futures)
+
+
+def iter_chunks(text: str, limit: int = MAX_MESSAGE_LENGTH):
+    """Yield message-sized pieces of ``text``, working on offsets (no copies of the remainder).
+
+    Splits at the last newline before ``limit`` when there is one. A piece
+    that ends inside a ``` block is closed with a fence, and the next piece
+    reopens it with the same opening line, so code stays formatted.
+    """
+    n = len(text)
+    if n <= limit:
+        yield text
+        return
+    start = 0
+    fence = None  # opening line of the code block we are inside
+    while start < n:
+        prefix = fence + "\n" if fence else ""
+        if n - start + len(prefix) <= limit:
+            yield prefix + text[start:]
+            return
+        end = start + limit - len(prefix) - len(_CLOSE_FENCE)
+        split = text.rfind("\n", start, end)
+        if split <= start:
+            split = end
+        for match in _FENCE_LINE.finditer(text, start, split):
+            fence = None if fence else match.group(1).strip()
+        if fence and len(fence) > limit // 4:
+            fence = None
+        yield prefix + text[start:split] + (_CLOSE_FENCE if fence else "")
+        start = split + 1 if text[split] == "\n" else split
 
 
 def split_message(text: str) -> list[str]:
-    if len(text) <= MAX_MESSAGE_LENGTH:
-        return [text]
-    chunks = []
-    while text:
-        if len(text) <= MAX_MESSAGE_LENGTH:
-            chunks.append(text)
-            break
-        # Try to split at newline
-        split_pos = text.rfind("\n", 0, MAX_MESSAGE_LENGTH)
-        if split_pos == -1:
-            split_pos = MAX_MESSAGE_LENGTH
-        chunks.append(text[:split_pos])
-        text = text[split_pos:].lstrip("\n")
-    return chunks
+    return list(iter_chunks(text))
+
+
+def is_oversized(text: str) -> bool:
+    """Whether ``text`` should be sent as a document instead of messages."""
+    threshold = get_config().telegram.document_threshold_chars
+    return threshold > 0 and len(text) > threshold
+
+
+def _preview(text: str) -> str:
+    cut = text.rfind("\n", 0, PREVIEW_CHARS)
+    head = text[:cut if cut > PREVIEW_CHARS // 2 else PREVIEW_CHARS].rstrip()
+    return f"{head}\n…\n\n📎 전체 결과 {len(text):,}자 — 첨부 파일 참고"
+
+
+def _encode_document(text: str, gzip_chars: int) -> tuple[bytes, str]:
+    """``text`` as document bytes (.md, or .txt.gz past ``gzip_chars``). Returns (data, filename)."""
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    data = text.encode("utf-8")
+    if len(text) > gzip_chars:
+        return gzip.compress(data, compresslevel=6), f"result-{stamp}.txt.gz"
+    return data, f"result-{stamp}.md"
+
+
+async def send_as_document(chat_id: int, text: str, send_document, priority: str = "interactive"):
+    """Send ``text`` as one document with a short preview caption.
+
+    ``send_document(document=, filename=, caption=)`` makes the Bot API call.
+    The document is built in memory on the I/O pool (no temp file), and a
+    flood-control retry re-sends the same bytes.
+    """
+    # Config is read here: a get_config in the worker thread could fire reload callbacks there
+    gzip_chars = get_config().telegram.document_gzip_chars
+    data, filename = await file_cache.run_io(_encode_document, text, gzip_chars)
+    caption = _preview(text)
+    await outbox.call(
+        chat_id,
+        lambda: send_document(document=data, filename=filename, caption=caption),
+        priority,
+        method="document",
+    )
+
+
+async def _delete_message(message):
+    """Delete through the outbox, under the message's edit key so a still-queued edit is dropped, not sent after."""
+    try:
+        await outbox.call(
+            message.chat_id,
+            message.delete,
+            method="delete",
+            key=("edit", message.chat_id, message.message_id),
+        )
+    except Exception:
+        pass
 
 
 class ProgressIndicator:
-    """Sends and updates a '⏳ 처리 중...' message periodically."""
+    """A '⏳ 처리 중...' message kept up to date by the shared progress ticker."""
 
     def __init__(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         self._update = update
         self._context = context
         self._message = None
-        self._task: asyncio.Task | None = None
-        self._elapsed = 0
 
     async def start(self):
-        self._message = await self._update.message.reply_text("⏳ 처리 중...")
-        self._task = asyncio.create_task(self._updater())
+        self._message = await outbox.call(
+            self._update.effective_chat.id, lambda: self._update.message.reply_text("⏳ 처리 중...")
+        )
+        progress_ticker.add(self, self._message)
+
+    def track(self, future: asyncio.Future):
+        """Show ``future``'s queue position and estimated wait until it starts running."""
+        progress_ticker.track(self, future)
 
     async def stop(self):
-        if self._task:
-            self._task.cancel()
-            try:
-                await self._task
-            except asyncio.CancelledError:
-                pass
+        progress_ticker.discard(self)
         if self._message:
+            await _delete_message(self._message)
+
+    async def release(self):
+        """Stop updating and hand the progress message over to the caller instead of deleting it."""
+        progress_ticker.discard(self)
+        message, self._message = self._message, None
+        return message
+
+
+class StreamingReply:
+    """Shows Claude output as it streams in by editing the reply message.
+
+    Edits are rate-limited to one per ``edit_interval`` seconds. Text past
+    MAX_MESSAGE_LENGTH rolls over into a new message. ``finish`` replaces the
+    live transcript with the final result.
+    """
+
+    def __init__(self, update: Update, progress: "ProgressIndicator", edit_interval: float = 1.5):
+        self._update = update
+        self._chat_id = update.effective_chat.id
+        self._progress = progress
+        self._interval = edit_interval
+        self._messages: list = []
+        self._texts: list[str] = []  # rendered text per message
+        self._transcript = ""
+        self._status = ""
+        self._dirty = False
+        self._last_edit = 0.0
+        self._flush_task: asyncio.Task | None = None
+        self._lock = asyncio.Lock()
+
+    async def on_event(self, event: dict):
+        if event["type"] == "text":
+            if self._transcript and not self._transcript.endswith("\n"):
+                self._transcript += "\n"
+            self._transcript += event["text"]
+            self._status = ""
+        elif event["type"] == "tool_use":
+            self._status = f"🔧 {event['name']} 실행 중..."
+        else:
+            return
+        self._dirty = True
+        delay = self._interval - (time.monotonic() - self._last_edit)
+        if delay <= 0:
+            await self._flush()
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush(delay))
+
+    async def finish(self, text: str):
+        """Replace the streamed messages with the final ``text``."""
+        if self._flush_task:
+            self._flush_task.cancel()
             try:
-                await self._message.delete()
-            except Exception:
+                await self._flush_task
+            except asyncio.CancelledError:
                 pass
+        if not text:
+            text = "(빈 응답)"
+        if not self._messages:
+            await self._progress.stop()
+            await send_long_message(self._update, text)
+            return
+        if is_oversized(text):
+            async with self._lock:
+                await self._render(["📎 결과가 길어 파일로 보냅니다."])
+            await send_as_document(self._chat_id, text, self._update.message.reply_document)
+            return
+        async with self._lock:
+            await self._render(split_message(text))
 
-    async def _updater(self):
-        try:
-            while True:
-                await asyncio.sleep(10)
-                self._elapsed += 10
+    async def _delayed_flush(self, delay: float):
+        await asyncio.sleep(delay)
+        await self._flush()
+
+    async def _flush(self):
+        async with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            self._last_edit = time.monotonic()
+            body = self._transcript
+            if self._status:
+                body = f"{body}\n\n{self._status}" if body else self._status
+            if is_oversized(body):
+                # The full result will go out as a document; only show the tail live
+                body = "…\n" + body[-(MAX_MESSAGE_LENGTH - 2):]
+            await self._render(split_message(body or "⏳ 처리 중..."), live=True)
+
+    async def _render(self, chunks: list[str], live: bool = False):
+        # The progress message becomes the first reply message
+        if not self._messages:
+            message = await self._progress.release()
+            if message is None:
+                message = await outbox.call(
+                    self._chat_id, lambda: self._update.message.reply_text("⏳ 처리 중...")
+                )
+            self._messages.append(message)
+            self._texts.append("")
+
+        stale = []
+        for i, chunk in enumerate(chunks):
+            if i < len(self._messages):
+                if self._texts[i] == chunk:
+                    continue
+                message = self._messages[i]
                 try:
-                    await self._message.edit_text(
-                        f"⏳ 처리 중... ({self._elapsed}초 경과)"
+                    await outbox.call(
+                        self._chat_id,
+                        lambda message=message, chunk=chunk: message.edit_text(chunk),
+                        method="edit",
+                        key=("edit", self._chat_id, message.message_id),
                     )
+                    self._texts[i] = chunk
+                    continue
                 except Exception:
-                    pass
-        except asyncio.CancelledError:
-            pass
+                    if live:
+                        logger.debug("스트리밍 메시지 수정 실패", exc_info=True)
+                        continue
+                    # The final answer must arrive: send the rest as new messages, in order
+                    logger.warning("결과 메시지 수정 실패, 새 메시지로 보냄", exc_info=True)
+                    stale = self._messages[i:]
+                    del self._messages[i:]
+                    del self._texts[i:]
+            self._messages.append(
+                await outbox.call(self._chat_id, lambda chunk=chunk: self._update.message.reply_text(chunk))
+            )
+            self._texts.append(chunk)
+
+        # Only the final render may shrink the reply (the live transcript only grows)
+        if not live:
+            for message in stale + self._messages[len(chunks):]:
+                await _delete_message(message)
+            del self._messages[len(chunks):]
+            del self._texts[len(chunks):]
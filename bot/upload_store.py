@@ -0,0 +1,193 @@
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import time
+
+from config import BASE_DIR, get_config
+from memory import file_cache
+
+logger = logging.getLogger(__name__)
+
+_HASH_CHUNK = 1024 * 1024
+
+
+def _sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(_HASH_CHUNK):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _unlink(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _make_temp(tmp_dir: str, suffix: str) -> str:
+    os.makedirs(tmp_dir, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=tmp_dir)
+    os.close(fd)
+    return path
+
+
+def _store_blob(tmp_path: str, blob_path: str) -> int:
+    """Move a download to its blob path, or drop it if that blob is already there. Returns the blob size."""
+    if os.path.exists(blob_path):
+        _unlink(tmp_path)
+    else:
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        os.replace(tmp_path, blob_path)
+    return os.path.getsize(blob_path)
+
+
+def _replace_symlink(target: str, link: str):
+    _unlink(link)
+    os.symlink(target, link)
+
+
+class UploadStore:
+    """Content-addressed store for files users send.
+
+    Each distinct file is kept once, as ``blobs/<sha[:2]>/<sha256><ext>``
+    under ``files.upload_dir``; the readable name handed to Claude is a
+    symlink next to the blobs. Telegram's ``file_unique_id`` is mapped to the
+    sha256, so a file sent again is served without downloading it. Blobs
+    past ``files.upload_cache_mb`` in total are evicted least recently used
+    first, together with their links. Paths in the DB are relative to the
+    upload dir. All disk access runs on the file_cache I/O pool.
+    """
+
+    def __init__(self):
+        self._blobs: dict[str, dict] = {}  # sha256 -> {"path", "size", "last_used"}
+        self._refs: dict[str, str] = {}  # file_unique_id -> sha256
+        self._links: dict[str, str] = {}  # link path -> sha256
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    @property
+    def root(self) -> str:
+        return os.path.join(BASE_DIR, os.path.expanduser(get_config().files.upload_dir))
+
+    def total_bytes(self) -> int:
+        return sum(b["size"] for b in self._blobs.values())
+
+    def stats(self) -> dict:
+        return {"files": len(self._blobs), "bytes": self.total_bytes()}
+
+    async def _ensure_loaded(self):
+        if self._loaded:
+            return
+        from db.store import load_uploads
+
+        blobs, refs, links = await load_uploads()
+        self._blobs = {b["sha256"]: b for b in blobs}
+        self._refs = {r["file_unique_id"]: r["sha256"] for r in refs}
+        self._links = {link["path"]: link["sha256"] for link in links}
+        self._loaded = True
+
+    async def temp_path(self, filename: str) -> str:
+        """A fresh file to download into, on the same filesystem as the blobs."""
+        return await file_cache.run_io(_make_temp, os.path.join(self.root, "tmp"), os.path.splitext(filename)[1])
+
+    async def lookup(self, file_unique_id: str | None, filename: str) -> str | None:
+        """Path for a file already stored under ``file_unique_id``, or None if it must be downloaded."""
+        if not file_unique_id:
+            return None
+        async with self._lock:
+            await self._ensure_loaded()
+            sha = self._refs.get(file_unique_id)
+            blob = self._blobs.get(sha) if sha else None
+            if blob is None:
+                return None
+            if not await file_cache.run_io(os.path.exists, os.path.join(self.root, blob["path"])):
+                await self._forget(sha)
+                return None
+            await self._touch(sha)
+            return await self._link(sha, filename)
+
+    async def add(self, tmp_path: str, filename: str, file_unique_id: str | None = None) -> str:
+        """Move a downloaded file into the store (or drop it if the content is known). Returns its path."""
+        from db.store import save_upload, save_upload_ref
+
+        sha = await file_cache.run_io(_sha256_file, tmp_path)
+        async with self._lock:
+            await self._ensure_loaded()
+            blob = self._blobs.get(sha)
+            if blob is None:
+                ext = os.path.splitext(filename)[1].lower()
+                blob = {"sha256": sha, "path": os.path.join("blobs", sha[:2], sha + ext)}
+            blob["size"] = await file_cache.run_io(_store_blob, tmp_path, os.path.join(self.root, blob["path"]))
+            self._blobs[sha] = blob
+            blob["last_used"] = time.time()
+            await save_upload(sha, blob["path"], blob["size"], blob["last_used"])
+            if file_unique_id:
+                self._refs[file_unique_id] = sha
+                await save_upload_ref(file_unique_id, sha)
+            path = await self._link(sha, filename)
+            await self._evict(keep=sha)
+        return path
+
+    async def _touch(self, sha: str):
+        from db.store import touch_upload
+
+        self._blobs[sha]["last_used"] = time.time()
+        await touch_upload(sha, self._blobs[sha]["last_used"])
+
+    async def _link(self, sha: str, filename: str) -> str:
+        """Readable symlink to the blob. Falls back to the blob path where symlinks aren't available."""
+        from db.store import save_upload_link
+
+        blob_path = os.path.join(self.root, self._blobs[sha]["path"])
+        name = os.path.basename(filename) or sha
+        if name in ("blobs", "tmp"):
+            name = f"{name}_{sha[:8]}"
+        link = os.path.join(self.root, name)
+        if self._links.get(name) != sha and await file_cache.run_io(os.path.lexists, link):
+            base, ext = os.path.splitext(name)
+            name = f"{base}_{sha[:8]}{ext}"
+            link = os.path.join(self.root, name)
+        if self._links.get(name) == sha and await file_cache.run_io(os.path.islink, link):
+            return link
+        try:
+            await file_cache.run_io(_replace_symlink, os.path.relpath(blob_path, self.root), link)
+        except OSError:
+            logger.warning("업로드 링크 생성 실패, 원본 경로 사용: %s", link)
+            return blob_path
+        self._links[name] = sha
+        await save_upload_link(name, sha)
+        return link
+
+    async def _forget(self, sha: str):
+        from db.store import delete_upload
+
+        blob = self._blobs.pop(sha, None)
+        if blob:
+            await file_cache.run_io(_unlink, os.path.join(self.root, blob["path"]))
+        for name in [n for n, s in self._links.items() if s == sha]:
+            await file_cache.run_io(_unlink, os.path.join(self.root, name))
+            del self._links[name]
+        for uid in [u for u, s in self._refs.items() if s == sha]:
+            del self._refs[uid]
+        await delete_upload(sha)
+
+    async def _evict(self, keep: str | None = None):
+        cap = get_config().files.upload_cache_mb * 1024 * 1024
+        if cap <= 0:
+            return
+        total = self.total_bytes()
+        for sha in sorted(self._blobs, key=lambda s: self._blobs[s]["last_used"]):
+            if total <= cap:
+                break
+            if sha == keep:
+                continue
+            total -= self._blobs[sha]["size"]
+            logger.info("업로드 정리 (LRU): %s", self._blobs[sha]["path"])
+            await self._forget(sha)
+
+
+upload_store = UploadStore()
@@ -0,0 +1,107 @@
+import contextvars
+import logging
+import random
+import time
+
+from config import get_config
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# The job the current task is running, as handed out by on_dispatch
+_dispatch: contextvars.ContextVar[dict | None] = contextvars.ContextVar("breaker_dispatch", default=None)
+
+
+def backoff_delay(attempt: int, base_sec: float, max_sec: float) -> float:
+    """Exponential backoff with jitter: somewhere in [d/2, d] for d = base * 2^(attempt-1), capped."""
+    delay = min(max_sec, base_sec * 2 ** max(0, attempt - 1))
+    return random.uniform(delay / 2, delay)
+
+
+class RateLimitBreaker:
+    """Shared circuit breaker for API rate limits.
+
+    Any ``rate_limited`` result opens it, and the execution queue stops
+    dispatching (interactive, retry and cron work alike) until the cool-down
+    passes. Then a single job goes through as a probe: if it isn't rate
+    limited the breaker closes, otherwise it re-opens with a doubled cool-down.
+    Only the probe's result closes it; results of runs dispatched before it
+    opened are ignored.
+    """
+
+    def __init__(self):
+        self._state = CLOSED
+        self._trips = 0
+        self._reopen_at = 0.0
+        self._opened_at = 0.0
+        self._probe_deadline = 0.0
+        self._probe: dict | None = None
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def retry_in(self) -> float:
+        """Seconds until the next probe may be dispatched (0 when closed)."""
+        if self._state == CLOSED:
+            return 0.0
+        deadline = self._reopen_at if self._state == OPEN else self._probe_deadline
+        return max(0.0, deadline - time.monotonic())
+
+    def ready(self) -> bool:
+        """Whether the queue may dispatch a job now."""
+        if self._state == CLOSED:
+            return True
+        # Half-open: wait for the probe, unless it got lost (cancelled, crashed)
+        return self.retry_in() == 0
+
+    def on_dispatch(self):
+        """Called by the queue's worker task for each dispatched job; the first one after a cool-down is the probe."""
+        dispatch = {"at": time.monotonic()}
+        _dispatch.set(dispatch)
+        if self._state == CLOSED:
+            return
+        self._state = HALF_OPEN
+        self._probe = dispatch
+        self._probe_deadline = time.monotonic() + get_config().claude.timeout_sec + 30
+        logger.info("API 한도 차단기: 시험 실행 시작")
+
+    def record(self, status: str):
+        dispatch = _dispatch.get()
+        dispatched_at = dispatch["at"] if dispatch is not None else time.monotonic()
+        is_probe = dispatch is not None and dispatch is self._probe
+        if is_probe:
+            self._probe = None
+        if dispatched_at < self._opened_at:
+            return
+        if status == "rate_limited":
+            self._trip()
+        elif is_probe and self._state == HALF_OPEN:
+            logger.info("API 한도 차단기 해제 (%s)", status)
+            self._state = CLOSED
+            self._trips = 0
+
+    def release(self):
+        """The current job ended without an API result (cache hit, error): let the next job be the probe."""
+        dispatch = _dispatch.get()
+        if dispatch is not None and dispatch is self._probe:
+            self._probe = None
+            self._probe_deadline = 0.0
+
+    def _trip(self):
+        # Runs already in flight when the breaker opened don't count as new trips
+        if self._state == OPEN:
+            return
+        self._trips += 1
+        retry_config = get_config().retry
+        delay = backoff_delay(self._trips, retry_config.breaker_base_sec, retry_config.breaker_max_sec)
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._reopen_at = self._opened_at + delay
+        logger.warning("API 한도 초과, 차단기 열림 (%d회째, %.0f초 후 시험 실행)", self._trips, delay)
+
+
+rate_limit_breaker = RateLimitBreaker()
@@ -0,0 +1,80 @@
+import collections
+import hashlib
+import logging
+import time
+
+from config import get_config
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """LRU cache of successful Claude results, bounded by total response bytes.
+
+    Keys hash the full prompt, the work_dir and the context version (system
+    prompt, memory and persona), so editing any of those misses naturally.
+    Entries expire after the TTL configured for their source. Callers take
+    the key once, before the run, so a context change mid-run can't file an
+    old-context answer under the new version.
+    """
+
+    def __init__(self):
+        # key -> (result, size, expires_at), least recently used first
+        self._entries: collections.OrderedDict[str, tuple[dict, int, float]] = collections.OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(prompt: str, work_dir: str) -> str:
+        from claude.context import context_version
+
+        raw = "\0".join((prompt, work_dir, context_version()))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _ttl(source: str) -> int:
+        cache_config = get_config().cache
+        return {"telegram": cache_config.telegram_ttl_sec, "cron": cache_config.cron_ttl_sec}.get(source, 0)
+
+    def enabled_for(self, source: str | None) -> bool:
+        return source is not None and get_config().cache.enabled and self._ttl(source) > 0
+
+    def get(self, key: str) -> dict | None:
+        entry = self._entries.get(key)
+        if entry is None or entry[2] <= time.monotonic():
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, source: str, key: str, result: dict):
+        if result.get("status") != "success" or not result.get("result"):
+            return
+        max_bytes = get_config().cache.max_bytes
+        size = len(result["result"].encode("utf-8"))
+        if size > max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (result, size, time.monotonic() + self._ttl(source))
+        self._bytes += size
+        while self._bytes > max_bytes:
+            self._drop(next(iter(self._entries)))
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+    def _drop(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+
+response_cache = ResponseCache()
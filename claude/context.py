@@ -1,7 +1,15 @@
+import hashlib
+import logging
 import os
-from memory.prompts import build_memory_block, build_conversation_block
-from memory.persona import build_persona_block
-from db.store import get_recent_conversations
+import time
+from memory import file_cache
+from memory.manager import MEMORY_PATH, load_memory
+from memory.prompts import build_memory_block, build_conversation_block, estimate_tokens
+from memory.persona import build_persona_block, persona_path
+from db.store import get_recent_conversations, search_conversations
+from metrics import registry
+
+logger = logging.getLogger(__name__)
 
 SYSTEM_PROMPT_PATH = os.path.join(
     os.path.dirname(os.path.dirname(__file__)), "data", "system_prompt.txt"
@@ -14,34 +22,128 @@ DEFAULT_SYSTEM_PROMPT = """너는 나의 개인 AI 비서다.
 작업 완료 후에는 결과를 간단히 요약해줘."""
 
 
+_PROMPT_FILES = (
+    SYSTEM_PROMPT_PATH,
+    MEMORY_PATH,
+    persona_path("soul"),
+    persona_path("user"),
+    persona_path("mood"),
+)
+
+# (key, parts, per-block token estimates, context version) for the system/persona part of the prompt
+_prefix_memo: tuple[tuple, list[str], dict[str, int], str] | None = None
+
+
 def load_system_prompt() -> str:
-    if os.path.exists(SYSTEM_PROMPT_PATH):
-        with open(SYSTEM_PROMPT_PATH, "r", encoding="utf-8") as f:
-            return f.read().strip()
-    return DEFAULT_SYSTEM_PROMPT
+    content = file_cache.read_text(SYSTEM_PROMPT_PATH)
+    if content is None:
+        return DEFAULT_SYSTEM_PROMPT
+    return content.strip()
 
 
 def save_system_prompt(prompt: str):
     os.makedirs(os.path.dirname(SYSTEM_PROMPT_PATH), exist_ok=True)
-    with open(SYSTEM_PROMPT_PATH, "w", encoding="utf-8") as f:
-        f.write(prompt)
+    file_cache.write_text(SYSTEM_PROMPT_PATH, prompt)
 
 
-async def build_full_prompt(user_message: str, max_turns: int = 5) -> str:
-    system_prompt = load_system_prompt()
-    memory_block = build_memory_block()
-    recent = await get_recent_conversations(max_turns)
-    conversation_block = build_conversation_block(recent)
+def _static_prefix() -> tuple[list[str], dict[str, int], str]:
+    """System and persona parts plus the context version, rebuilt only when one of their files changes.
+
+    Blocking (stats and reads): coroutines go through refresh_prefix. Memory
+    itself is picked per message (see build_memory_block); MEMORY.md only
+    feeds the version.
+    """
+    global _prefix_memo
+    key = (file_cache.generation(), tuple(file_cache.stamp(p) for p in _PROMPT_FILES))
+    memo = _prefix_memo
+    if memo is not None and memo[0] == key:
+        return memo[1], memo[2], memo[3]
 
+    system_prompt = load_system_prompt()
     persona_block = build_persona_block()
 
     parts = [f"[시스템] {system_prompt}"]
     if persona_block:
         parts.append(f"\n{persona_block}")
+    tokens = {
+        "system": estimate_tokens(system_prompt),
+        "persona": estimate_tokens(persona_block),
+    }
+    memory_digest = hashlib.sha1(load_memory().encode("utf-8")).hexdigest()
+    version = hashlib.sha1("\n".join([*parts, memory_digest]).encode("utf-8")).hexdigest()[:16]
+    _prefix_memo = (key, parts, tokens, version)
+    return parts, tokens, version
+
+
+async def refresh_prefix() -> tuple[list[str], dict[str, int], str]:
+    """Re-check the prompt files on the I/O pool and return the (possibly rebuilt) prefix."""
+    return await file_cache.run_io(_static_prefix)
+
+
+def context_version() -> str:
+    """Short hash of the system/persona prefix and MEMORY.md, as of the last refresh_prefix."""
+    memo = _prefix_memo
+    if memo is None:
+        return _static_prefix()[2]
+    return memo[3]
+
+
+async def build_full_prompt(
+    user_message: str,
+    max_turns: int = 5,
+    token_budget: int | None = None,
+    relevant_turns: int = 0,
+    memory_chars: int = 2000,
+    memory_top_k: int = 20,
+) -> str:
+    """Assemble the prompt.
+
+    Memory entries relevant to the message are included within ``memory_chars``.
+    With ``token_budget``, the conversation blocks get whatever the rest leaves.
+    With ``relevant_turns``, up to that many older turns matching the message
+    (full-text search) are added ahead of the recent ones.
+    """
+    started = time.perf_counter()
+    prefix, tokens, _ = await refresh_prefix()
+    memory_block = await build_memory_block(user_message, memory_chars, memory_top_k)
+    tokens = {**tokens, "memory": estimate_tokens(memory_block)}
+    current = f"\n[현재 메시지]\n{user_message}"
+
+    conversation_budget = None
+    related_budget = None
+    if token_budget:
+        used = sum(tokens.values()) + estimate_tokens(current)
+        conversation_budget = max(0, token_budget - used)
+
+    recent = await get_recent_conversations(max_turns)
+    related = []
+    if relevant_turns > 0:
+        recent_ids = {t["id"] for t in recent if t.get("id") is not None}
+        related = await search_conversations(user_message, relevant_turns, exclude_ids=recent_ids)
+        related.sort(key=lambda t: t["id"])
+        if conversation_budget is not None and related:
+            # Related turns get at most a third; recent turns matter more
+            related_budget = conversation_budget // 3
+
+    related_block = build_conversation_block(related, related_budget, header="[관련 과거 대화]")
+    if conversation_budget is not None:
+        conversation_budget -= estimate_tokens(related_block)
+    conversation_block = build_conversation_block(recent, conversation_budget)
+
+    parts = list(prefix)
     if memory_block:
         parts.append(f"\n{memory_block}")
+    if related_block:
+        parts.append(f"\n{related_block}")
     if conversation_block:
         parts.append(f"\n{conversation_block}")
-    parts.append(f"\n[현재 메시지]\n{user_message}")
+    parts.append(current)
 
-    return "\n".join(parts)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "프롬프트 토큰 추정: %s, 관련 대화 %d, 대화 %d, 현재 메시지 %d",
+            tokens, estimate_tokens(related_block), estimate_tokens(conversation_block), estimate_tokens(current),
+        )
+    prompt = "\n".join(parts)
+    registry.observe("kkabi_prompt_build_seconds", time.perf_counter() - started)
+    return prompt
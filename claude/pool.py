@@ -0,0 +1,231 @@
+import asyncio
+import collections
+import json
+import logging
+import os
+import time
+
+from config import get_config
+
+logger = logging.getLogger(__name__)
+
+# Keep this much of each warm process's stderr for error messages
+_STDERR_TAIL = 64 * 1024
+
+# How often idle processes are checked for expiry
+_REAP_INTERVAL_SEC = 30
+
+
+def _warm_args() -> list[str]:
+    return [
+        "claude", "-p", "--dangerously-skip-permissions",
+        "--input-format", "stream-json", "--output-format", "stream-json", "--verbose",
+    ]
+
+
+def user_message_line(prompt: str) -> bytes:
+    """One stream-json input line carrying ``prompt`` as the user turn."""
+    message = {"type": "user", "message": {"role": "user", "content": [{"type": "text", "text": prompt}]}}
+    return (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+class WarmProcess:
+    """A ``claude`` process started ahead of time, waiting for input on stdin."""
+
+    def __init__(self, proc: asyncio.subprocess.Process, work_dir: str):
+        self.proc = proc
+        self.work_dir = work_dir
+        self.uses = 0
+        self.owner = None
+        self.session_id = None  # CLI session the process holds after its last successful run
+        self.epoch = 0
+        self.last_used = time.monotonic()
+        self._stderr = bytearray()
+        self._stderr_task = asyncio.create_task(self._drain_stderr())
+
+    @property
+    def alive(self) -> bool:
+        return self.proc.returncode is None
+
+    def stderr_text(self) -> str:
+        return self._stderr.decode("utf-8", errors="replace").strip()
+
+    async def wait_stderr(self, timeout: float = 1.0):
+        """Give a dead process's remaining stderr a moment to arrive."""
+        if not self.alive:
+            await asyncio.wait({self._stderr_task}, timeout=timeout)
+
+    async def _drain_stderr(self):
+        # An undrained stderr pipe would eventually block the process
+        while True:
+            chunk = await self.proc.stderr.read(4096)
+            if not chunk:
+                return
+            self._stderr += chunk
+            del self._stderr[:-_STDERR_TAIL]
+
+    async def close(self):
+        if self.alive:
+            try:
+                self.proc.stdin.close()
+                await asyncio.wait_for(self.proc.wait(), timeout=5)
+            except (asyncio.TimeoutError, OSError):
+                self.proc.kill()
+                await self.proc.wait()
+        self._stderr_task.cancel()
+
+
+class WarmPool:
+    """Pre-spawned Claude CLI processes in streaming-input mode, per work_dir.
+
+    Node start-up and MCP initialisation happen while the process sits idle,
+    so a request only pays for the model call. A process keeps its
+    conversation, so by default each one serves a single request and a fresh
+    one is spawned behind it; with ``warm_pool_max_uses`` > 1 it is only
+    handed back to its owner (a chat or cron job) to resume the session it
+    holds, with just the new message. Idle processes are recycled after
+    ``warm_pool_idle_ttl_sec``. Pools are kept for the most recently used
+    ``warm_pool_max_work_dirs`` directories.
+    """
+
+    def __init__(self):
+        self._idle: collections.OrderedDict[str, list[WarmProcess]] = collections.OrderedDict()
+        self._spawning: collections.Counter = collections.Counter()
+        self._tasks: set[asyncio.Task] = set()
+        self._reaper: asyncio.Task | None = None
+        self._started = False
+        self._epoch = 0  # bumped by forget; processes busy at that point aren't reused
+
+    @staticmethod
+    def enabled() -> bool:
+        return get_config().claude.warm_pool_size > 0
+
+    async def start(self, work_dirs: list[str] = ()):
+        self._started = True
+        self._reaper = asyncio.create_task(self._reap_loop())
+        if self.enabled():
+            for work_dir in work_dirs:
+                self._refill(work_dir)
+
+    async def stop(self):
+        self._started = False
+        tasks = [t for t in (self._reaper, *self._tasks) if t]
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks.clear()
+        for procs in self._idle.values():
+            for wp in procs:
+                await wp.close()
+        self._idle.clear()
+
+    def idle_count(self) -> int:
+        return sum(len(procs) for procs in self._idle.values())
+
+    def acquire(self, work_dir: str, owner=None, session_id: str | None = None) -> WarmProcess | None:
+        """Take an idle process for ``work_dir``, or None (the caller falls back to a cold start).
+
+        Without ``session_id`` only a fresh process is handed out. With it,
+        only ``owner``'s process holding that session is.
+        """
+        if not self._started or not self.enabled():
+            return None
+        procs = self._idle.get(work_dir)
+        if procs is None:
+            self._idle[work_dir] = []
+        else:
+            self._idle.move_to_end(work_dir)
+        for wp in [wp for wp in procs or () if not wp.alive]:
+            procs.remove(wp)
+        if session_id is not None:
+            candidates = [wp for wp in procs or () if wp.owner == owner and wp.session_id == session_id]
+        else:
+            candidates = [wp for wp in procs or () if not wp.uses]
+        picked = candidates[0] if candidates else None
+        if picked is not None:
+            procs.remove(picked)
+            picked.epoch = self._epoch
+        self._refill(work_dir)
+        return picked
+
+    def forget(self, owner=None):
+        """Close used processes of ``owner`` (all owners if None), e.g. after /clear dropped their history."""
+        self._epoch += 1
+        for procs in self._idle.values():
+            for wp in [wp for wp in procs if wp.uses and (owner is None or wp.owner == owner)]:
+                procs.remove(wp)
+                self._track(wp.close())
+
+    def release(self, wp: WarmProcess, reusable: bool):
+        """Return a process after a request; it is closed unless it can serve its owner again."""
+        wp.last_used = time.monotonic()
+        claude_config = get_config().claude
+        max_uses = claude_config.warm_pool_max_uses
+        # Only worth keeping if its session can be resumed later
+        reusable = reusable and claude_config.session_reuse and wp.epoch == self._epoch and wp.session_id is not None
+        if reusable and self._started and wp.alive and wp.uses < max_uses and wp.work_dir in self._idle:
+            self._idle[wp.work_dir].append(wp)
+        else:
+            self._track(wp.close())
+        self._refill(wp.work_dir)
+
+    def _refill(self, work_dir: str):
+        claude_config = get_config().claude
+        if not self._started or claude_config.warm_pool_size <= 0:
+            return
+        self._idle.setdefault(work_dir, [])
+        while len(self._idle) > max(1, claude_config.warm_pool_max_work_dirs):
+            _, evicted = self._idle.popitem(last=False)
+            for wp in evicted:
+                self._track(wp.close())
+        fresh = sum(1 for wp in self._idle[work_dir] if wp.uses == 0)
+        for _ in range(claude_config.warm_pool_size - fresh - self._spawning[work_dir]):
+            self._spawning[work_dir] += 1
+            self._track(self._spawn(work_dir))
+
+    async def _spawn(self, work_dir: str):
+        from claude.runner import STREAM_LINE_LIMIT
+
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *_warm_args(),
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=os.path.expanduser(work_dir),
+                limit=STREAM_LINE_LIMIT,
+            )
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            logger.warning("웜 프로세스 시작 실패: %s", work_dir)
+            return
+        finally:
+            self._spawning[work_dir] -= 1
+        wp = WarmProcess(proc, work_dir)
+        if work_dir in self._idle and self._started:
+            self._idle[work_dir].append(wp)
+        else:
+            await wp.close()
+
+    def _track(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _reap_loop(self):
+        while True:
+            await asyncio.sleep(_REAP_INTERVAL_SEC)
+            ttl = get_config().claude.warm_pool_idle_ttl_sec
+            now = time.monotonic()
+            for work_dir, procs in list(self._idle.items()):
+                for wp in list(procs):
+                    if not wp.alive or (ttl > 0 and now - wp.last_used > ttl):
+                        procs.remove(wp)
+                        self._track(wp.close())
+                self._refill(work_dir)
+
+
+warm_pool = WarmPool()
@@ -1,48 +1,287 @@
 import asyncio
+import collections
 import logging
+import os
+import time
+
+from claude.breaker import rate_limit_breaker
+from metrics import registry
 
 logger = logging.getLogger(__name__)
 
+# Dispatch order: earlier classes always go first
+PRIORITIES = ("interactive", "file", "retry", "cron")
+
+# Classes that wait while the bot or the machine is busy
+_BACKGROUND = ("cron",)
+
+# How often idle workers re-check deferred background jobs
+_DEFER_POLL_SEC = 5
+
+# Weight of the newest job in the running average of job durations
+_RUN_EMA_ALPHA = 0.2
+
 
 class ExecutionQueue:
+    """Worker pool that runs up to ``max_concurrent`` jobs at once.
+
+    Each job has a priority class (see PRIORITIES); higher classes are always
+    dispatched first and each class can be capped separately. Within a class,
+    jobs are grouped into per-owner lanes (usually the chat_id) and dispatched
+    round-robin, so one busy chat cannot starve the others. Jobs with the same
+    owner run one at a time, in submission order.
+
+    Cron jobs are held back while interactive/file work is queued or running,
+    or the load average is above ``cron_max_load`` per CPU, for at most
+    ``cron_max_defer_sec``. Nothing is dispatched while the rate-limit
+    breaker is open.
+    """
+
     def __init__(self, max_concurrent: int = 1, max_size: int = 10):
-        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
-        self._semaphore = asyncio.Semaphore(max_concurrent)
-        self._worker_task: asyncio.Task | None = None
+        self._max_concurrent = max(1, max_concurrent)
+        self._max_size = max_size
+        self._lanes: dict[str, dict] = {p: {} for p in PRIORITIES}
+        self._order: dict[str, collections.deque] = {p: collections.deque() for p in PRIORITIES}
+        self._busy: set = set()
+        self._pending: collections.Counter = collections.Counter()
+        self._running: collections.Counter = collections.Counter()
+        self._class_limits: dict[str, int] = {}
+        self._cron_max_load = 0.0
+        self._cron_max_defer = 900.0
+        self._cond = asyncio.Condition()
+        self._workers: set[asyncio.Task] = set()
+        self._started = False
+        self._avg_run_sec: float | None = None
+
+    def start(self, max_concurrent: int | None = None, max_size: int | None = None):
+        if max_concurrent is not None:
+            self._max_concurrent = max(1, max_concurrent)
+        if max_size is not None:
+            self._max_size = max_size
+        self._started = True
+        self._spawn_workers()
+        logger.info("실행 큐 시작 (동시 실행 %d, 큐 크기 %d)", self._max_concurrent, self._max_size)
 
-    def start(self):
-        self._worker_task = asyncio.create_task(self._worker())
+    def set_policy(
+        self,
+        class_limits: dict[str, int] | None = None,
+        cron_max_load: float | None = None,
+        cron_max_defer_sec: float | None = None,
+    ):
+        """Per-class concurrency caps (0 = no cap) and cron deferral settings."""
+        if class_limits is not None:
+            self._class_limits = {k: v for k, v in class_limits.items() if v > 0}
+        if cron_max_load is not None:
+            self._cron_max_load = cron_max_load
+        if cron_max_defer_sec is not None:
+            self._cron_max_defer = cron_max_defer_sec
 
     async def stop(self):
-        if self._worker_task:
-            self._worker_task.cancel()
+        self._started = False
+        workers = list(self._workers)
+        for task in workers:
+            task.cancel()
+        for task in workers:
             try:
-                await self._worker_task
+                await task
             except asyncio.CancelledError:
                 pass
+        self._workers.clear()
+        for lanes in self._lanes.values():
+            for lane in lanes.values():
+                for job in lane:
+                    if not job[3].done():
+                        job[3].cancel()
+            lanes.clear()
+        for order in self._order.values():
+            order.clear()
+        self._pending.clear()
+
+    async def resize(self, max_concurrent: int):
+        """Change the pool size at runtime. Surplus workers exit after their current job."""
+        max_concurrent = max(1, max_concurrent)
+        if max_concurrent == self._max_concurrent:
+            return
+        logger.info("실행 큐 크기 변경: %d → %d", self._max_concurrent, max_concurrent)
+        self._max_concurrent = max_concurrent
+        if self._started:
+            self._spawn_workers()
+        async with self._cond:
+            self._cond.notify_all()
+
+    @property
+    def max_concurrent(self) -> int:
+        return self._max_concurrent
 
     @property
     def pending_count(self) -> int:
-        return self._queue.qsize()
+        return sum(self._pending.values())
+
+    @property
+    def running_count(self) -> int:
+        return sum(self._running.values())
 
-    async def submit(self, coro_func, *args, **kwargs) -> asyncio.Future:
-        future = asyncio.get_event_loop().create_future()
-        await self._queue.put((coro_func, args, kwargs, future))
+    def class_counts(self) -> dict[str, tuple[int, int]]:
+        """priority class -> (pending, running)"""
+        return {p: (self._pending[p], self._running[p]) for p in PRIORITIES}
+
+    def position(self, future: asyncio.Future) -> int | None:
+        """How many queued jobs will be dispatched before ``future``'s job (None = not waiting).
+
+        Approximate: earlier classes go first, and within a class owners take
+        turns in round-robin order, one job each.
+        """
+        ahead = 0
+        for priority in PRIORITIES:
+            lanes = self._lanes[priority]
+            for owner, lane in lanes.items():
+                for i, job in enumerate(lane):
+                    if job[3] is future:
+                        order = list(self._order[priority])
+                        mine = order.index(owner)
+                        others = sum(
+                            min(len(lanes[o]), i + 1 if k < mine else i)
+                            for k, o in enumerate(order)
+                            if o != owner
+                        )
+                        return ahead + i + others
+            ahead += self._pending[priority]
+        return None
+
+    def estimated_wait(self, ahead: int) -> float | None:
+        """Rough seconds until a job with ``ahead`` jobs in front of it starts (None = no history yet)."""
+        if self._avg_run_sec is None:
+            return None
+        return (ahead + 1) * self._avg_run_sec / self._max_concurrent
+
+    async def submit(self, coro_func, *args, owner=None, priority: str = "interactive", **kwargs) -> asyncio.Future:
+        """Enqueue ``coro_func(*args, **kwargs)``; waits while the queue is full."""
+        if priority not in self._lanes:
+            raise ValueError(f"unknown priority class: {priority}")
+        future = asyncio.get_running_loop().create_future()
+        async with self._cond:
+            while self._max_size > 0 and self.pending_count >= self._max_size:
+                await self._cond.wait()
+            lanes = self._lanes[priority]
+            if owner not in lanes:
+                lanes[owner] = collections.deque()
+                self._order[priority].append(owner)
+            lanes[owner].append((coro_func, args, kwargs, future, time.monotonic()))
+            self._pending[priority] += 1
+            self._cond.notify_all()
         return future
 
+    def _record_run(self, elapsed: float):
+        if self._avg_run_sec is None:
+            self._avg_run_sec = elapsed
+        else:
+            self._avg_run_sec += _RUN_EMA_ALPHA * (elapsed - self._avg_run_sec)
+
+    def _spawn_workers(self):
+        while len(self._workers) < self._max_concurrent:
+            task = asyncio.create_task(self._worker())
+            self._workers.add(task)
+
+    def _surplus(self) -> bool:
+        return len(self._workers) > self._max_concurrent
+
+    def _class_full(self, priority: str) -> bool:
+        limit = self._class_limits.get(priority)
+        return limit is not None and self._running[priority] >= limit
+
+    def _should_defer(self, priority: str, enqueued_at: float) -> bool:
+        if priority not in _BACKGROUND:
+            return False
+        if time.monotonic() - enqueued_at >= self._cron_max_defer:
+            return False
+        foreground = ("interactive", "file")
+        if any(self._pending[p] or self._running[p] for p in foreground):
+            return True
+        if self._cron_max_load > 0 and hasattr(os, "getloadavg"):
+            load_per_cpu = os.getloadavg()[0] / (os.cpu_count() or 1)
+            if load_per_cpu > self._cron_max_load:
+                return True
+        return False
+
+    def _next_job(self):
+        """Pick the next runnable job. Returns (priority, owner, job), "deferred" or None."""
+        if not rate_limit_breaker.ready():
+            return "deferred" if self.pending_count else None
+        deferred = False
+        for priority in PRIORITIES:
+            if self._class_full(priority):
+                continue
+            order = self._order[priority]
+            lanes = self._lanes[priority]
+            # Round-robin over owners, skipping owners that already have a job running
+            for _ in range(len(order)):
+                owner = order.popleft()
+                if owner is not None and owner in self._busy:
+                    order.append(owner)
+                    continue
+                lane = lanes[owner]
+                if self._should_defer(priority, lane[0][4]):
+                    order.append(owner)
+                    deferred = True
+                    continue
+                job = lane.popleft()
+                if lane:
+                    order.append(owner)
+                else:
+                    del lanes[owner]
+                rate_limit_breaker.on_dispatch()
+                return priority, owner, job
+        return "deferred" if deferred else None
+
     async def _worker(self):
+        me = asyncio.current_task()
         while True:
-            coro_func, args, kwargs, future = await self._queue.get()
+            async with self._cond:
+                while True:
+                    if self._surplus():
+                        self._workers.discard(me)
+                        return
+                    picked = self._next_job()
+                    if isinstance(picked, tuple):
+                        break
+                    if picked == "deferred":
+                        # Nothing signals when the machine calms down, so poll
+                        try:
+                            await asyncio.wait_for(self._cond.wait(), timeout=_DEFER_POLL_SEC)
+                        except asyncio.TimeoutError:
+                            pass
+                    else:
+                        await self._cond.wait()
+                priority, owner, (coro_func, args, kwargs, future, enqueued_at) = picked
+                registry.observe("kkabi_queue_wait_seconds", time.monotonic() - enqueued_at, priority=priority)
+                self._pending[priority] -= 1
+                self._running[priority] += 1
+                if owner is not None:
+                    self._busy.add(owner)
+                self._cond.notify_all()
+
+            started = None
             try:
-                async with self._semaphore:
+                if not future.done():
+                    started = time.monotonic()
                     result = await coro_func(*args, **kwargs)
                     if not future.done():
                         future.set_result(result)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
             except Exception as e:
                 if not future.done():
                     future.set_exception(e)
             finally:
-                self._queue.task_done()
+                if started is not None:
+                    self._record_run(time.monotonic() - started)
+                # A probe job that never reported a result must not hold the breaker half-open
+                rate_limit_breaker.release()
+                async with self._cond:
+                    self._running[priority] -= 1
+                    self._busy.discard(owner)
+                    self._cond.notify_all()
 
 
 execution_queue = ExecutionQueue()
@@ -1,31 +1,196 @@
 import asyncio
 import logging
+import time
 
-logger = logging.getLogger(__name__)
+from claude.breaker import backoff_delay
+from config import get_config
 
-RETRY_DELAY_SEC = 300  # 5 minutes
-MAX_RETRIES = 3
+logger = logging.getLogger(__name__)
 
 
 class RetryQueue:
+    """Durable retries for rate-limited runs.
+
+    Each pending retry is a row in the ``retries`` table (mirrored in memory),
+    so a restart picks up where it left off. Attempts are spaced with
+    exponential backoff and jitter, and go through the execution queue as
+    ``retry`` jobs, which the rate-limit breaker holds back while it is open.
+    The outcome is sent with ``send_func(chat_id, text)``; cron retries have
+    no chat and go to the default chat.
+    """
+
     def __init__(self):
-        self._pending: list[dict] = []
+        self._retries: dict[int, dict] = {}
+        self._inflight: set[int] = set()
+        self._tasks: set[asyncio.Task] = set()
+        self._wakeup = asyncio.Event()
+        self._loop_task: asyncio.Task | None = None
+        self._send = None
 
-    async def schedule_retry(self, run_func, prompt: str, work_dir: str, callback, attempt: int = 1):
-        if attempt > MAX_RETRIES:
-            logger.warning("최대 재시도 횟수 초과: %s", prompt[:50])
-            await callback(None, f"최대 재시도 횟수({MAX_RETRIES}회) 초과")
-            return
+    async def start(self, send_func=None):
+        from db.store import load_retries
+
+        self._send = send_func
+        self._retries = {r["id"]: r for r in await load_retries()}
+        self._loop_task = asyncio.create_task(self._run())
+        if self._retries:
+            logger.info("대기 중인 재시도 %d개 복원", len(self._retries))
+
+    async def stop(self):
+        tasks = [t for t in (self._loop_task, *self._tasks) if t]
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._loop_task = None
+        self._tasks.clear()
+        self._inflight.clear()
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._retries)
+
+    def _delay(self, attempt: int) -> float:
+        retry_config = get_config().retry
+        return backoff_delay(attempt, retry_config.base_delay_sec, retry_config.max_delay_sec)
 
-        logger.info("재시도 예약 (%d/%d), %d초 후: %s", attempt, MAX_RETRIES, RETRY_DELAY_SEC, prompt[:50])
-        await asyncio.sleep(RETRY_DELAY_SEC)
+    async def schedule(
+        self,
+        source: str,
+        prompt: str,
+        work_dir: str,
+        chat_id: int | None = None,
+        cron_id: str | None = None,
+        error: str | None = None,
+    ) -> float:
+        """Persist a retry for a rate-limited run. Returns the delay in seconds until the first attempt."""
+        from db.store import add_retry
+
+        delay = self._delay(1)
+        next_at = time.time() + delay
+        retry_id = await add_retry(source, prompt, work_dir, next_at, chat_id, cron_id, error)
+        self._retries[retry_id] = {
+            "id": retry_id,
+            "source": source,
+            "chat_id": chat_id,
+            "cron_id": cron_id,
+            "prompt": prompt,
+            "work_dir": work_dir,
+            "attempt": 1,
+            "next_attempt_at": next_at,
+            "last_error": error,
+        }
+        logger.info("재시도 예약 (1/%d), %.0f초 후: %s", get_config().retry.max_attempts, delay, prompt[:50])
+        self._wakeup.set()
+        return delay
+
+    async def _run(self):
+        while True:
+            now = time.time()
+            waiting = [r for r in self._retries.values() if r["id"] not in self._inflight]
+            for retry in waiting:
+                if retry["next_attempt_at"] <= now:
+                    self._inflight.add(retry["id"])
+                    task = asyncio.create_task(self._attempt(retry))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+            upcoming = [r["next_attempt_at"] for r in waiting if r["next_attempt_at"] > now]
+            timeout = max(0.0, min(upcoming) - now) if upcoming else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _attempt(self, retry: dict):
+        from claude.queue import execution_queue
+        from claude.runner import run_claude
+        from db.store import delete_retry, update_retry
+
+        max_attempts = get_config().retry.max_attempts
+        deleted = False
+        try:
+            owner = retry["chat_id"] if retry["chat_id"] is not None else f"cron:{retry['cron_id']}"
+            future = await execution_queue.submit(
+                run_claude, retry["prompt"], retry["work_dir"], get_config().claude.timeout_sec, retry["chat_id"],
+                owner=owner, priority="retry",
+            )
+            result = await future
+
+            if result["status"] == "rate_limited" and retry["attempt"] < max_attempts:
+                retry["attempt"] += 1
+                delay = self._delay(retry["attempt"])
+                retry["next_attempt_at"] = time.time() + delay
+                retry["last_error"] = result.get("error")
+                await update_retry(retry["id"], retry["attempt"], retry["next_attempt_at"], retry["last_error"])
+                logger.info(
+                    "재시도 예약 (%d/%d), %.0f초 후: %s", retry["attempt"], max_attempts, delay, retry["prompt"][:50]
+                )
+                return
+
+            await delete_retry(retry["id"])
+            self._retries.pop(retry["id"], None)
+            deleted = True
+            await self._finish(retry, result, max_attempts)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if deleted:
+                # The run itself is done; re-running the prompt just to re-send the result isn't worth it
+                logger.exception("재시도 결과 기록/전달 실패: %s", retry["id"])
+                return
+            logger.exception("재시도 실행 실패: %s", retry["id"])
+            await self._reschedule_failed(retry, e, max_attempts)
+        finally:
+            self._inflight.discard(retry["id"])
+            self._wakeup.set()
+
+    async def _reschedule_failed(self, retry: dict, error: Exception, max_attempts: int):
+        """Back off after an attempt that raised, so a broken retry isn't re-run in a hot loop."""
+        from db.store import delete_retry, update_retry
+
+        if retry["attempt"] >= max_attempts:
+            logger.warning("재시도 포기 (%d회 실패): %s", retry["attempt"], retry["prompt"][:50])
+            self._retries.pop(retry["id"], None)
+            try:
+                await delete_retry(retry["id"])
+            except Exception:
+                logger.exception("재시도 삭제 실패: %s", retry["id"])
+            return
+        retry["attempt"] += 1
+        retry["last_error"] = str(error)
+        # Set in memory first: even if the DB update fails, the run loop waits
+        retry["next_attempt_at"] = time.time() + self._delay(retry["attempt"])
+        try:
+            await update_retry(retry["id"], retry["attempt"], retry["next_attempt_at"], retry["last_error"])
+        except Exception:
+            logger.exception("재시도 예약 갱신 실패: %s", retry["id"])
 
-        result = await run_func(prompt, work_dir)
+    async def _finish(self, retry: dict, result: dict, max_attempts: int):
+        from db.store import save_execution
 
+        await save_execution(
+            source=retry["source"],
+            prompt=retry["prompt"],
+            result=result.get("result"),
+            duration_sec=result["duration"],
+            work_dir=retry["work_dir"],
+            status=result["status"],
+            error_message=result.get("error"),
+            cron_id=retry["cron_id"],
+        )
         if result["status"] == "rate_limited":
-            await self.schedule_retry(run_func, prompt, work_dir, callback, attempt + 1)
+            logger.warning("최대 재시도 횟수 초과: %s", retry["prompt"][:50])
+            text = f"❌ 재시도 실패: 최대 재시도 횟수({max_attempts}회) 초과"
         else:
-            await callback(result, None)
+            text = f"🔄 재시도 결과:\n{result.get('result') or result.get('error') or '(응답 없음)'}"
+        if retry["cron_id"]:
+            text = f"⏰ 크론잡 `{retry['cron_id']}` {text}"
+        if self._send:
+            await self._send(retry["chat_id"], text)
 
 
 retry_queue = RetryQueue()
@@ -1,21 +1,88 @@
 import asyncio
+import json
 import time
 import logging
 
+from claude.breaker import rate_limit_breaker
+from claude.cache import response_cache
+from claude.pool import user_message_line, warm_pool
+from metrics import registry
+
 logger = logging.getLogger(__name__)
 
 # Currently running Claude processes, keyed by chat_id
 running_tasks: dict[int, asyncio.subprocess.Process] = {}
 
+# stream-json lines carry whole tool results, so allow much longer lines than the 64KB default
+STREAM_LINE_LIMIT = 16 * 1024 * 1024
+
+
+async def run_claude(
+    prompt: str,
+    work_dir: str,
+    timeout_sec: int = 300,
+    chat_id: int | None = None,
+    on_event=None,
+    resume: str | None = None,
+    cache_source: str | None = None,
+    pool_owner=None,
+) -> dict:
+    """Run Claude Code CLI and return result dict.
+
+    If ``on_event`` is given, output is read as stream-json and each text or
+    tool-use event is passed to ``await on_event(event)`` as it arrives.
+    ``resume`` continues an existing CLI session; the result carries the
+    ``session_id`` to resume next time. Every result is reported to the
+    rate-limit breaker; a run that ends without one releases its probe slot.
+
+    Fresh runs use an idle process from the warm pool when one is available;
+    a resumed run uses the warm process that still holds its session, if any.
+    ``pool_owner`` (default: ``chat_id``) is who may resume a warm process.
+    ``cache_source`` ("telegram", "cron") opts a fresh (non-resumed) run into
+    the response cache; a hit returns without starting the CLI at all.
+    """
+    try:
+        use_cache = resume is None and response_cache.enabled_for(cache_source)
+        if use_cache:
+            from claude.context import refresh_prefix
+
+            # The cache key includes the context version; re-check the prompt files off the loop
+            await refresh_prefix()
+            cache_key = response_cache.key(prompt, work_dir)
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                logger.info("응답 캐시 적중 (%s)", cache_source)
+                return {**cached, "duration": 0.0, "session_id": None, "cached": True}
+
+        if pool_owner is None:
+            pool_owner = chat_id
+        warm = warm_pool.acquire(work_dir, pool_owner, session_id=resume)
+        if warm is not None:
+            mode = "warm"
+            result = await _run_claude_warm(warm, prompt, timeout_sec, chat_id, on_event, pool_owner)
+        elif on_event is not None:
+            mode = "stream"
+            result = await _run_claude_streaming(prompt, work_dir, timeout_sec, chat_id, on_event, resume)
+        else:
+            mode = "json"
+            result = await _run_claude_json(prompt, work_dir, timeout_sec, chat_id, resume)
+        registry.observe("kkabi_claude_run_seconds", result["duration"], mode=mode, status=result["status"])
+        rate_limit_breaker.record(result["status"])
+        if use_cache:
+            response_cache.put(cache_source, cache_key, result)
+        return result
+    finally:
+        # No-op once the result is recorded; a probe that made no API call (cache hit, error) is freed
+        rate_limit_breaker.release()
+
 
-async def run_claude(prompt: str, work_dir: str, timeout_sec: int = 300, chat_id: int | None = None) -> dict:
-    """Run Claude Code CLI and return result dict."""
+async def _run_claude_json(
+    prompt: str, work_dir: str, timeout_sec: int, chat_id: int | None, resume: str | None
+) -> dict:
     start = time.time()
     try:
         proc = await asyncio.create_subprocess_exec(
-            "claude", "-p", prompt,
-            "--dangerously-skip-permissions",
-            "--output-format", "text",
+            *_claude_args(prompt, "json", resume),
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
             cwd=work_dir,
@@ -53,12 +120,30 @@ async def run_claude(prompt: str, work_dir: str, timeout_sec: int = 300, chat_id
                 "duration": duration,
             }
 
-        result_text = stdout.decode("utf-8", errors="replace").strip()
+        final = next((e for e in parse_stream_line(stdout) if e["type"] == "result"), None)
+        if final is None:
+            # Not JSON (older CLI?): treat stdout as the plain answer
+            return {
+                "status": "success",
+                "result": stdout.decode("utf-8", errors="replace").strip(),
+                "error": None,
+                "duration": duration,
+                "session_id": None,
+            }
+        if final["is_error"]:
+            error_info = classify_error(final["text"])
+            return {
+                "status": error_info["status"],
+                "result": None,
+                "error": error_info["message"],
+                "duration": duration,
+            }
         return {
             "status": "success",
-            "result": result_text,
+            "result": final["text"].strip(),
             "error": None,
             "duration": duration,
+            "session_id": final["session_id"],
         }
 
     except FileNotFoundError:
@@ -80,8 +165,230 @@ async def run_claude(prompt: str, work_dir: str, timeout_sec: int = 300, chat_id
         }
 
 
+def _claude_args(prompt: str, output_format: str, resume: str | None) -> list[str]:
+    args = ["claude", "-p", prompt, "--dangerously-skip-permissions", "--output-format", output_format]
+    if output_format == "stream-json":
+        args.append("--verbose")
+    if resume:
+        args += ["--resume", resume]
+    return args
+
+
+async def _run_claude_streaming(
+    prompt: str, work_dir: str, timeout_sec: int, chat_id: int | None, on_event, resume: str | None
+) -> dict:
+    start = time.time()
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *_claude_args(prompt, "stream-json", resume),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=work_dir,
+            limit=STREAM_LINE_LIMIT,
+        )
+    except FileNotFoundError:
+        return {
+            "status": "error",
+            "result": None,
+            "error": "claude CLI가 설치되지 않았습니다. `npm install -g @anthropic-ai/claude-code`로 설치하세요.",
+            "duration": time.time() - start,
+        }
+
+    if chat_id is not None:
+        running_tasks[chat_id] = proc
+
+    texts: list[str] = []
+    final: dict | None = None
+    stderr_task = asyncio.create_task(proc.stderr.read())
+
+    async def _consume():
+        nonlocal final
+        first_line = True
+        async for raw in proc.stdout:
+            if first_line:
+                first_line = False
+                registry.observe("kkabi_claude_first_byte_seconds", time.time() - start, mode="stream")
+            for event in parse_stream_line(raw):
+                if event["type"] == "result":
+                    final = event
+                    continue
+                if event["type"] == "text":
+                    texts.append(event["text"])
+                try:
+                    await on_event(event)
+                except Exception:
+                    logger.exception("스트림 이벤트 처리 실패")
+        await proc.wait()
+
+    try:
+        await asyncio.wait_for(_consume(), timeout=timeout_sec)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return {
+            "status": "timeout",
+            "result": None,
+            "error": f"타임아웃: {timeout_sec}초 초과",
+            "duration": time.time() - start,
+        }
+    except Exception as e:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        logger.exception("Claude 실행 중 예외")
+        return {
+            "status": "error",
+            "result": None,
+            "error": f"예기치 않은 오류: {e}",
+            "duration": time.time() - start,
+        }
+    finally:
+        if chat_id is not None:
+            running_tasks.pop(chat_id, None)
+        stderr = await stderr_task
+    duration = time.time() - start
+    stderr_text = stderr.decode("utf-8", errors="replace").strip()
+
+    if proc.returncode != 0 or (final and final.get("is_error")):
+        detail = stderr_text or (final or {}).get("text", "")
+        error_info = classify_error(detail)
+        return {
+            "status": error_info["status"],
+            "result": None,
+            "error": error_info["message"],
+            "duration": duration,
+        }
+
+    result_text = (final or {}).get("text") or "\n".join(texts)
+    return {
+        "status": "success",
+        "result": result_text.strip(),
+        "error": None,
+        "duration": duration,
+        "session_id": (final or {}).get("session_id"),
+    }
+
+
+async def _run_claude_warm(warm, prompt: str, timeout_sec: int, chat_id: int | None, on_event, owner) -> dict:
+    """Send ``prompt`` to a pre-spawned process and read its stream until the result event."""
+    start = time.time()
+    proc = warm.proc
+    warm.uses += 1
+    warm.owner = owner
+    warm.session_id = None
+    if chat_id is not None:
+        running_tasks[chat_id] = proc
+
+    texts: list[str] = []
+    final: dict | None = None
+
+    async def _consume():
+        nonlocal final
+        proc.stdin.write(user_message_line(prompt))
+        await proc.stdin.drain()
+        first_line = True
+        # The process stays alive after answering, so stop at the result instead of EOF
+        async for raw in proc.stdout:
+            if first_line:
+                first_line = False
+                registry.observe("kkabi_claude_first_byte_seconds", time.time() - start, mode="warm")
+            for event in parse_stream_line(raw):
+                if event["type"] == "result":
+                    final = event
+                    return
+                if event["type"] == "text":
+                    texts.append(event["text"])
+                if on_event is not None:
+                    try:
+                        await on_event(event)
+                    except Exception:
+                        logger.exception("스트림 이벤트 처리 실패")
+
+    try:
+        await asyncio.wait_for(_consume(), timeout=timeout_sec)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return {
+            "status": "timeout",
+            "result": None,
+            "error": f"타임아웃: {timeout_sec}초 초과",
+            "duration": time.time() - start,
+        }
+    except Exception as e:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        logger.exception("Claude 실행 중 예외")
+        return {
+            "status": "error",
+            "result": None,
+            "error": f"예기치 않은 오류: {e}",
+            "duration": time.time() - start,
+        }
+    finally:
+        if chat_id is not None:
+            running_tasks.pop(chat_id, None)
+        if final is not None and not final["is_error"]:
+            warm.session_id = final["session_id"]
+        warm_pool.release(warm, reusable=final is not None and not final["is_error"])
+    duration = time.time() - start
+
+    if final is None or final["is_error"]:
+        # Cancelled via /cancel or the process died: the reason, if any, is on stderr
+        if final is None:
+            await warm.wait_stderr()
+        detail = (final or {}).get("text") or warm.stderr_text() or "프로세스가 응답 없이 종료되었습니다."
+        error_info = classify_error(detail)
+        return {
+            "status": error_info["status"],
+            "result": None,
+            "error": error_info["message"],
+            "duration": duration,
+        }
+
+    return {
+        "status": "success",
+        "result": (final["text"] or "\n".join(texts)).strip(),
+        "error": None,
+        "duration": duration,
+        "session_id": final["session_id"],
+    }
+
+
+def parse_stream_line(raw: bytes) -> list[dict]:
+    """Turn one stream-json line into text / tool_use / result events."""
+    line = raw.decode("utf-8", errors="replace").strip()
+    if not line:
+        return []
+    try:
+        data = json.loads(line)
+    except ValueError:
+        return []
+
+    kind = data.get("type")
+    if kind == "assistant":
+        events = []
+        for block in data.get("message", {}).get("content", []):
+            if block.get("type") == "text" and block.get("text"):
+                events.append({"type": "text", "text": block["text"]})
+            elif block.get("type") == "tool_use":
+                events.append({"type": "tool_use", "name": block.get("name", "?"), "input": block.get("input", {})})
+        return events
+    if kind == "result":
+        return [{
+            "type": "result",
+            "text": data.get("result") or "",
+            "is_error": bool(data.get("is_error")) or data.get("subtype") not in (None, "success"),
+            "session_id": data.get("session_id"),
+        }]
+    return []
+
+
 def classify_error(stderr: str) -> dict:
     lower = stderr.lower()
+    if "no conversation found" in lower:
+        return {"status": "session_expired", "message": "이전 세션을 찾을 수 없습니다."}
     if "auth" in lower or "login" in lower:
         return {"status": "error", "message": "인증 만료. 서버에서 `claude login`을 다시 실행하세요."}
     if "rate limit" in lower or "rate_limit" in lower:
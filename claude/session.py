@@ -0,0 +1,58 @@
+import logging
+from datetime import datetime
+
+from config import get_config
+from db.store import delete_sessions, load_sessions, save_session
+
+logger = logging.getLogger(__name__)
+
+# (chat_id, work_dir) -> session row; loaded from SQLite on first use
+_sessions: dict[tuple[int, str], dict] | None = None
+
+
+async def _get_sessions() -> dict[tuple[int, str], dict]:
+    global _sessions
+    if _sessions is None:
+        _sessions = {(r["chat_id"], r["work_dir"]): r for r in await load_sessions()}
+    return _sessions
+
+
+async def get_session(chat_id: int, work_dir: str, context_version: str) -> str | None:
+    """Session ID to resume for this chat and work_dir, or None if a fresh one is needed."""
+    entry = (await _get_sessions()).get((chat_id, work_dir))
+    if entry is None:
+        return None
+    claude_config = get_config().claude
+    if entry["context_version"] != context_version:
+        logger.info("시스템/페르소나/메모리 변경으로 새 세션 시작 (chat %s)", chat_id)
+        return None
+    idle = (datetime.now() - datetime.fromisoformat(entry["updated_at"])).total_seconds()
+    if idle > claude_config.session_idle_ttl_sec:
+        return None
+    if entry["turns"] >= claude_config.session_max_turns:
+        return None
+    return entry["session_id"]
+
+
+async def remember_session(chat_id: int, work_dir: str, session_id: str, context_version: str, resumed: bool):
+    sessions = await _get_sessions()
+    previous = sessions.get((chat_id, work_dir))
+    turns = previous["turns"] + 1 if resumed and previous else 1
+    entry = {
+        "chat_id": chat_id,
+        "work_dir": work_dir,
+        "session_id": session_id,
+        "context_version": context_version,
+        "turns": turns,
+        "updated_at": datetime.now().isoformat(),
+    }
+    sessions[(chat_id, work_dir)] = entry
+    await save_session(chat_id, work_dir, session_id, context_version, turns, entry["updated_at"])
+
+
+async def forget_sessions(chat_id: int | None = None, work_dir: str | None = None):
+    sessions = await _get_sessions()
+    for key in list(sessions):
+        if (chat_id is None or key[0] == chat_id) and (work_dir is None or key[1] == work_dir):
+            del sessions[key]
+    await delete_sessions(chat_id, work_dir)
@@ -0,0 +1,272 @@
+import asyncio
+import dataclasses
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_PATH = os.path.join(BASE_DIR, "config.json")
+EXAMPLE_CONFIG_PATH = os.path.join(BASE_DIR, "config.example.json")
+
+
+@dataclasses.dataclass(frozen=True)
+class TelegramConfig:
+    bot_token: str = ""
+    allowed_user_ids: tuple[int, ...] = ()
+    global_rate_per_sec: float = 30.0
+    chat_rate_per_sec: float = 1.0
+    chat_burst: int = 3
+    group_rate_per_min: int = 20
+    send_max_retries: int = 5
+    document_threshold_chars: int = 12000
+    document_gzip_chars: int = 200000
+
+
+@dataclasses.dataclass(frozen=True)
+class ClaudeConfig:
+    timeout_sec: int = 300
+    max_concurrent: int = 1
+    queue_max_size: int = 10
+    default_work_dir: str = "~"
+    streaming: bool = True
+    stream_edit_interval_sec: float = 1.5
+    session_reuse: bool = True
+    session_idle_ttl_sec: int = 21600
+    session_max_turns: int = 50
+    file_max_concurrent: int = 0
+    retry_max_concurrent: int = 1
+    cron_max_concurrent: int = 1
+    cron_max_load: float = 0.8
+    cron_max_defer_sec: int = 900
+    warm_pool_size: int = 0
+    warm_pool_max_uses: int = 1
+    warm_pool_idle_ttl_sec: int = 600
+    warm_pool_max_work_dirs: int = 3
+
+
+@dataclasses.dataclass(frozen=True)
+class MemoryConfig:
+    max_context_turns: int = 5
+    response_save_limit: int = 500
+    memory_md_max_chars: int = 2000
+    memory_top_k: int = 20
+    log_retention_days: int = 30
+    prompt_token_budget: int = 6000
+    relevant_turns: int = 0
+
+
+@dataclasses.dataclass(frozen=True)
+class DbConfig:
+    flush_interval_ms: int = 200
+    flush_max_rows: int = 50
+    retention_days: int = 90
+    retention_mode: str = "delete"
+    retention_batch_size: int = 500
+    maintenance_interval_min: int = 60
+    vacuum_pages: int = 1000
+
+
+@dataclasses.dataclass(frozen=True)
+class FilesConfig:
+    max_upload_mb: int = 50
+    upload_cache_mb: int = 1024
+    getfile_max_parts: int = 20
+    upload_dir: str = "data/uploads"
+
+
+@dataclasses.dataclass(frozen=True)
+class SafetyConfig:
+    confirm_keywords: tuple[str, ...] = ()
+    confirm_message: str = "⚠️ 위험할 수 있는 작업입니다. 실행할까요?"
+    auto_approve_cron: bool = False
+
+
+@dataclasses.dataclass(frozen=True)
+class CronConfig:
+    max_starts_per_minute: int = 10
+    default_max_instances: int = 1
+    default_coalesce: bool = True
+    default_misfire_grace_sec: int = 300
+    default_jitter_sec: int = 0
+    default_jitter_mode: str = "random"
+    catch_up: str = "once"
+    catch_up_max_age_sec: int = 86400
+
+
+@dataclasses.dataclass(frozen=True)
+class RetryConfig:
+    max_attempts: int = 3
+    base_delay_sec: int = 300
+    max_delay_sec: int = 3600
+    breaker_base_sec: int = 60
+    breaker_max_sec: int = 900
+
+
+@dataclasses.dataclass(frozen=True)
+class CacheConfig:
+    enabled: bool = False
+    max_bytes: int = 5242880
+    telegram_ttl_sec: int = 300
+    cron_ttl_sec: int = 900
+
+
+@dataclasses.dataclass(frozen=True)
+class MetricsConfig:
+    enabled: bool = False
+    port: int = 9464
+
+
+@dataclasses.dataclass(frozen=True)
+class Config:
+    telegram: TelegramConfig = TelegramConfig()
+    claude: ClaudeConfig = ClaudeConfig()
+    memory: MemoryConfig = MemoryConfig()
+    db: DbConfig = DbConfig()
+    files: FilesConfig = FilesConfig()
+    safety: SafetyConfig = SafetyConfig()
+    cron: CronConfig = CronConfig()
+    retry: RetryConfig = RetryConfig()
+    cache: CacheConfig = CacheConfig()
+    metrics: MetricsConfig = MetricsConfig()
+
+
+_config: Config | None = None
+_stamp: tuple[int, int] | None = None
+_checked_at = 0.0
+_example: dict | None = None
+_reload_callbacks: list = []
+# Loop the reload callbacks run on; get_config may be called from worker threads
+_reload_loop: asyncio.AbstractEventLoop | None = None
+
+# get_config runs on the event loop many times per message; stat config.json at most this often
+_STAT_INTERVAL_SEC = 1.0
+
+
+def _file_stamp(path: str) -> tuple[int, int] | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _load_example() -> dict:
+    global _example
+    if _example is None:
+        try:
+            with open(EXAMPLE_CONFIG_PATH, "r", encoding="utf-8") as f:
+                _example = json.load(f)
+        except (OSError, ValueError):
+            _example = {}
+    return _example
+
+
+def _same_type(value, reference) -> bool:
+    if isinstance(reference, bool) or isinstance(value, bool):
+        return isinstance(value, bool) and isinstance(reference, bool)
+    if isinstance(reference, (int, float)):
+        return isinstance(value, (int, float))
+    return isinstance(value, type(reference))
+
+
+def _build_section(cls, name: str, raw: dict):
+    """Build one section dataclass, dropping keys that are unknown or of the wrong type."""
+    example = _load_example().get(name, {})
+    values = {}
+    fields = {f.name: f for f in dataclasses.fields(cls)}
+    for key, value in raw.items():
+        if key not in fields:
+            logger.warning("config.json: 알 수 없는 키 무시: %s.%s", name, key)
+            continue
+        reference = example.get(key, fields[key].default)
+        if not _same_type(value, reference):
+            logger.warning("config.json: %s.%s 타입 오류 (%r), 기본값 사용", name, key, value)
+            continue
+        if isinstance(value, list):
+            value = tuple(value)
+        values[key] = value
+    return cls(**values)
+
+
+def parse_config(raw: dict) -> Config:
+    if not isinstance(raw, dict):
+        logger.warning("config.json: 최상위가 객체가 아닙니다, 기본값 사용")
+        raw = {}
+    sections = {}
+    for field in dataclasses.fields(Config):
+        section_raw = raw.get(field.name, {})
+        if not isinstance(section_raw, dict):
+            logger.warning("config.json: %s 섹션이 객체가 아닙니다, 기본값 사용", field.name)
+            section_raw = {}
+        sections[field.name] = _build_section(field.default.__class__, field.name, section_raw)
+    for name in raw:
+        if name not in sections:
+            logger.warning("config.json: 알 수 없는 섹션 무시: %s", name)
+    return Config(**sections)
+
+
+def config_exists() -> bool:
+    return os.path.exists(CONFIG_PATH)
+
+
+def get_config() -> Config:
+    """Return the current config, re-reading config.json only if its mtime/size changed."""
+    global _config, _stamp, _checked_at
+    now = time.monotonic()
+    if _config is not None and now - _checked_at < _STAT_INTERVAL_SEC:
+        return _config
+    _checked_at = now
+    stamp = _file_stamp(CONFIG_PATH)
+    if _config is not None and stamp == _stamp:
+        return _config
+
+    previous = _config
+    if stamp is None:
+        _config = Config()
+    else:
+        try:
+            with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            _config = parse_config(raw)
+        except (OSError, ValueError):
+            logger.exception("config.json 읽기 실패")
+            if _config is None:
+                _config = Config()
+            # Remember the stamp anyway so a broken file isn't re-parsed every call
+            _stamp = stamp
+            return _config
+    _stamp = stamp
+
+    if previous is not None and previous != _config:
+        logger.info("config.json 변경 감지, 다시 읽음")
+        for callback in _reload_callbacks:
+            if _reload_loop is None:
+                _run_reload_callback(callback, previous, _config)
+                continue
+            try:
+                _reload_loop.call_soon_threadsafe(_run_reload_callback, callback, previous, _config)
+            except RuntimeError:
+                logger.warning("이벤트 루프가 닫혀 설정 변경 콜백을 건너뜀")
+    return _config
+
+
+def _run_reload_callback(callback, old: Config, new: Config):
+    try:
+        callback(old, new)
+    except Exception:
+        logger.exception("설정 변경 콜백 실패")
+
+
+def on_reload(callback):
+    """Register ``callback(old, new)`` to run when config.json changes (on the loop set by set_reload_loop)."""
+    _reload_callbacks.append(callback)
+    return callback
+
+
+def set_reload_loop(loop: asyncio.AbstractEventLoop):
+    """Run reload callbacks on ``loop``, whichever thread notices the change."""
+    global _reload_loop
+    _reload_loop = loop
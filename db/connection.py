@@ -0,0 +1,97 @@
+import asyncio
+import contextlib
+import logging
+import os
+import time
+
+import aiosqlite
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "assistant.db")
+
+# Applied to every connection. WAL lets the reader run alongside the writer,
+# synchronous=NORMAL drops the per-commit fsync (still crash-safe under WAL).
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+# sqlite3 keeps this many prepared statements per connection, keyed by SQL text
+_CACHED_STATEMENTS = 256
+
+
+class ConnectionManager:
+    """Long-lived SQLite connections: one serialized writer and one reader."""
+
+    def __init__(self, path: str):
+        self._path = path
+        self._writer: aiosqlite.Connection | None = None
+        self._reader: aiosqlite.Connection | None = None
+        self._write_lock = asyncio.Lock()
+        self._open_lock = asyncio.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._writer is not None
+
+    async def open(self):
+        async with self._open_lock:
+            if self._writer is not None:
+                return
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            self._writer = await self._connect()
+            self._reader = await self._connect()
+            logger.info("DB 연결 열림: %s", self._path)
+
+    async def close(self):
+        async with self._open_lock:
+            for conn in (self._reader, self._writer):
+                if conn is None:
+                    continue
+                try:
+                    await conn.close()
+                except Exception:
+                    logger.exception("DB 연결 종료 실패")
+            self._writer = None
+            self._reader = None
+            logger.info("DB 연결 닫힘")
+
+    async def _connect(self) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(self._path, cached_statements=_CACHED_STATEMENTS)
+        conn.row_factory = aiosqlite.Row
+        for pragma in _PRAGMAS:
+            await conn.execute(pragma)
+        return conn
+
+    @contextlib.asynccontextmanager
+    async def write(self):
+        """Yield the writer connection inside a transaction; commit on success."""
+        if self._writer is None:
+            await self.open()
+        async with self._write_lock:
+            started = time.perf_counter()
+            try:
+                yield self._writer
+                await self._writer.commit()
+            except BaseException:
+                await self._writer.rollback()
+                raise
+            finally:
+                registry.observe("kkabi_db_write_seconds", time.perf_counter() - started)
+
+    @contextlib.asynccontextmanager
+    async def read(self):
+        """Yield the reader connection."""
+        if self._reader is None:
+            await self.open()
+        yield self._reader
+
+
+database = ConnectionManager(DB_PATH)
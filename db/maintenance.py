@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+
+from config import get_config
+from db.connection import DB_PATH, database
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_PATH = os.path.join(os.path.dirname(DB_PATH), "assistant-archive.db")
+
+# Upper bound per run so one maintenance pass never holds the writer for long
+_MAX_BATCHES_PER_RUN = 20
+
+
+async def _expired_ids(cutoff: str, limit: int) -> list[int]:
+    async with database.read() as db:
+        cursor = await db.execute(
+            "SELECT id FROM executions WHERE timestamp < ? ORDER BY timestamp LIMIT ?", (cutoff, limit)
+        )
+        rows = await cursor.fetchall()
+        await cursor.close()
+    return [r[0] for r in rows]
+
+
+async def _table_columns(db, schema: str) -> list[str]:
+    cursor = await db.execute(f"PRAGMA {schema}.table_info(executions)")
+    columns = [row["name"] for row in await cursor.fetchall()]
+    await cursor.close()
+    return columns
+
+
+async def _attach_archive():
+    # ATTACH/DETACH must run outside a transaction; write() only opens one on DML
+    async with database.write() as db:
+        await db.execute("ATTACH DATABASE ? AS archive", (ARCHIVE_PATH,))
+        await db.execute("CREATE TABLE IF NOT EXISTS archive.executions AS SELECT * FROM main.executions WHERE 0")
+        # Columns added to the main table after the archive was created
+        archived = set(await _table_columns(db, "archive"))
+        for column in await _table_columns(db, "main"):
+            if column not in archived:
+                await db.execute(f"ALTER TABLE archive.executions ADD COLUMN {column}")
+
+
+async def _archive_batch(ids: list[int], columns: str):
+    marks = ", ".join("?" * len(ids))
+    async with database.write() as db:
+        await db.execute(
+            f"INSERT INTO archive.executions ({columns}) SELECT {columns} FROM main.executions WHERE id IN ({marks})",
+            ids,
+        )
+        await db.execute(f"DELETE FROM main.executions WHERE id IN ({marks})", ids)
+
+
+async def _delete_batch(ids: list[int]):
+    marks = ", ".join("?" * len(ids))
+    async with database.write() as db:
+        await db.execute(f"DELETE FROM executions WHERE id IN ({marks})", ids)
+
+
+async def prune_executions() -> int:
+    """Archive or delete executions older than db.retention_days, in small batches. Returns rows moved."""
+    db_config = get_config().db
+    if db_config.retention_days <= 0:
+        return 0
+    archive = db_config.retention_mode == "archive"
+    cutoff = (datetime.now() - timedelta(days=db_config.retention_days)).isoformat()
+
+    columns = ""
+    if archive:
+        await _attach_archive()
+        async with database.read() as db:
+            columns = ", ".join(await _table_columns(db, "main"))
+
+    moved = 0
+    try:
+        for _ in range(_MAX_BATCHES_PER_RUN):
+            ids = await _expired_ids(cutoff, db_config.retention_batch_size)
+            if not ids:
+                break
+            if archive:
+                await _archive_batch(ids, columns)
+            else:
+                await _delete_batch(ids)
+            moved += len(ids)
+            # Let interactive writes in between batches
+            await asyncio.sleep(0.05)
+    finally:
+        if archive:
+            async with database.write() as db:
+                await db.execute("DETACH DATABASE archive")
+    return moved
+
+
+async def incremental_vacuum(pages: int):
+    async with database.write() as db:
+        # execute() steps the pragma only once (one page); executescript runs it to completion
+        await db.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+
+
+async def run_maintenance():
+    """Scheduled job: retention pass followed by an incremental VACUUM."""
+    try:
+        moved = await prune_executions()
+        if moved:
+            action = "보관" if get_config().db.retention_mode == "archive" else "삭제"
+            logger.info("오래된 실행 기록 %d개 %s", moved, action)
+        await incremental_vacuum(get_config().db.vacuum_pages)
+    except Exception:
+        logger.exception("DB 유지보수 실패")
@@ -1,9 +1,9 @@
-import aiosqlite
-import os
+import json
+import re
 from datetime import datetime
 
-
-DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "assistant.db")
+from db.connection import database
+from db.writer import batch_writer
 
 _SCHEMA = """
 CREATE TABLE IF NOT EXISTS executions (
@@ -16,7 +16,9 @@ CREATE TABLE IF NOT EXISTS executions (
     duration_sec REAL,
     work_dir TEXT,
     status TEXT NOT NULL,
-    error_message TEXT
+    error_message TEXT,
+    prompt_chars INTEGER,
+    prompt_tokens INTEGER
 );
 
 CREATE TABLE IF NOT EXISTS conversations (
@@ -27,14 +29,252 @@ CREATE TABLE IF NOT EXISTS conversations (
     work_dir TEXT,
     duration_sec REAL
 );
+
+CREATE TABLE IF NOT EXISTS claude_sessions (
+    chat_id INTEGER NOT NULL,
+    work_dir TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    context_version TEXT,
+    turns INTEGER NOT NULL DEFAULT 1,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (chat_id, work_dir)
+);
+
+CREATE TABLE IF NOT EXISTS crons (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    cron TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    work_dir TEXT,
+    enabled INTEGER NOT NULL DEFAULT 1,
+    silent_on_success INTEGER NOT NULL DEFAULT 0,
+    options TEXT,
+    created_at TEXT,
+    last_run TEXT,
+    next_run TEXT,
+    last_status TEXT,
+    last_duration REAL
+);
+
+CREATE TABLE IF NOT EXISTS scheduler_jobs (
+    id TEXT PRIMARY KEY,
+    next_run_time REAL,
+    job_state BLOB NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS retries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL,
+    chat_id INTEGER,
+    cron_id TEXT,
+    prompt TEXT NOT NULL,
+    work_dir TEXT,
+    attempt INTEGER NOT NULL DEFAULT 1,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    created_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS uploads (
+    sha256 TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS upload_refs (
+    file_unique_id TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS upload_links (
+    path TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS memory_entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    position INTEGER NOT NULL,
+    section TEXT NOT NULL DEFAULT '',
+    text TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_executions_timestamp ON executions (timestamp);
+CREATE INDEX IF NOT EXISTS idx_executions_source_cron ON executions (source, cron_id);
+CREATE INDEX IF NOT EXISTS idx_executions_status ON executions (status);
+"""
+
+# Full-text indexes over the text columns, kept in sync by triggers.
+# Terms are matched as prefixes so Korean words still match with particles attached (날씨 → 날씨는).
+_FTS_TABLES = {
+    "conversations_fts": ("conversations", ("user_message", "assistant_response")),
+    "executions_fts": ("executions", ("prompt", "result")),
+    "memory_fts": ("memory_entries", ("section", "text")),
+}
+
+
+def _fts_schema(fts: str, table: str, columns: tuple[str, ...]) -> str:
+    cols = ", ".join(columns)
+    new_vals = ", ".join(f"new.{c}" for c in columns)
+    old_vals = ", ".join(f"old.{c}" for c in columns)
+    return f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+    {cols}, content='{table}', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS {table}_fts_ai AFTER INSERT ON {table} BEGIN
+    INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_vals});
+END;
+CREATE TRIGGER IF NOT EXISTS {table}_fts_ad AFTER DELETE ON {table} BEGIN
+    INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_vals});
+END;
+CREATE TRIGGER IF NOT EXISTS {table}_fts_au AFTER UPDATE ON {table} BEGIN
+    INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_vals});
+    INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_vals});
+END;
 """
 
 
-async def init_db():
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    async with aiosqlite.connect(DB_PATH) as db:
+# Shorter prefixes match too much to be useful
+_MIN_FTS_TERM = 2
+
+# Columns added after the first release: (table, column, type). Applied on startup.
+_ADDED_COLUMNS = (
+    ("executions", "prompt_chars", "INTEGER"),
+    ("executions", "prompt_tokens", "INTEGER"),
+)
+
+_INSERT_EXECUTION = """INSERT INTO executions
+    (timestamp, source, cron_id, prompt, result, duration_sec, work_dir, status, error_message,
+     prompt_chars, prompt_tokens)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+
+_INSERT_CONVERSATION = """INSERT INTO conversations
+    (timestamp, user_message, assistant_response, work_dir, duration_sec)
+    VALUES (?, ?, ?, ?, ?)"""
+
+_SELECT_RECENT_CONVERSATIONS = "SELECT * FROM conversations ORDER BY id DESC LIMIT ?"
+
+_SELECT_RECENT_EXECUTIONS = "SELECT * FROM executions ORDER BY id DESC LIMIT ?"
+
+
+_UPSERT_SESSION = """INSERT INTO claude_sessions
+    (chat_id, work_dir, session_id, context_version, turns, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (chat_id, work_dir) DO UPDATE SET
+        session_id = excluded.session_id,
+        context_version = excluded.context_version,
+        turns = excluded.turns,
+        updated_at = excluded.updated_at"""
+
+_UPSERT_CRON = """INSERT INTO crons
+    (id, name, cron, prompt, work_dir, enabled, silent_on_success, options, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (id) DO UPDATE SET
+        name = excluded.name,
+        cron = excluded.cron,
+        prompt = excluded.prompt,
+        work_dir = excluded.work_dir,
+        enabled = excluded.enabled,
+        silent_on_success = excluded.silent_on_success,
+        options = excluded.options"""
+
+_UPDATE_CRON_STATE = """UPDATE crons
+    SET last_run = ?, next_run = ?, last_status = ?, last_duration = ?
+    WHERE id = ?"""
+
+_UPSERT_UPLOAD = """INSERT INTO uploads (sha256, path, size, last_used) VALUES (?, ?, ?, ?)
+    ON CONFLICT (sha256) DO UPDATE SET path = excluded.path, size = excluded.size, last_used = excluded.last_used"""
+
+_SEARCH_EXECUTIONS = """SELECT e.id, e.timestamp, e.source, e.cron_id, e.status, e.prompt,
+           snippet(executions_fts, -1, '«', '»', '…', 24) AS snippet
+    FROM executions_fts JOIN executions e ON e.id = executions_fts.rowid
+    WHERE executions_fts MATCH ?
+    ORDER BY rank LIMIT ?"""
+
+_SEARCH_CONVERSATIONS = """SELECT c.*
+    FROM conversations_fts JOIN conversations c ON c.id = conversations_fts.rowid
+    WHERE conversations_fts MATCH ?
+    ORDER BY rank LIMIT ?"""
+
+_SEARCH_MEMORY = """SELECT m.position
+    FROM memory_fts JOIN memory_entries m ON m.id = memory_fts.rowid
+    WHERE memory_fts MATCH ?
+    ORDER BY rank LIMIT ?"""
+
+_CONVERSATION_COLUMNS = ("timestamp", "user_message", "assistant_response", "work_dir", "duration_sec")
+
+
+async def init_db(flush_interval_ms: int = 200, flush_max_rows: int = 50):
+    await database.open()
+    await _enable_incremental_vacuum()
+    async with database.write() as db:
         await db.executescript(_SCHEMA)
-        await db.commit()
+        await _add_missing_columns(db)
+        await _create_fts(db)
+    batch_writer.start(flush_interval_ms, flush_max_rows)
+
+
+async def _enable_incremental_vacuum():
+    """Switch the DB to auto_vacuum=INCREMENTAL so maintenance can hand free pages back to the OS."""
+    async with database.write() as db:
+        cursor = await db.execute("PRAGMA auto_vacuum")
+        mode = (await cursor.fetchone())[0]
+        await cursor.close()
+        if mode == 2:
+            return
+        await db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        # The mode only takes effect after a full VACUUM (one-time cost; the WAL pragma already initialized the file)
+        await db.execute("VACUUM")
+
+
+async def _add_missing_columns(db):
+    for table, column, col_type in _ADDED_COLUMNS:
+        cursor = await db.execute(f"PRAGMA table_info({table})")
+        existing = {row["name"] for row in await cursor.fetchall()}
+        await cursor.close()
+        if column not in existing:
+            await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {col_type}")
+
+
+async def _create_fts(db):
+    cursor = await db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    existing = {row["name"] for row in await cursor.fetchall()}
+    await cursor.close()
+    for fts, (table, columns) in _FTS_TABLES.items():
+        await db.executescript(_fts_schema(fts, table, columns))
+        if fts not in existing:
+            # Index rows written before the FTS table existed
+            await db.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def _fts_query(text: str, any_term: bool = False, max_terms: int = 16) -> str | None:
+    """Quote each term so user input can't inject FTS syntax. AND by default, OR with ``any_term``."""
+    terms = []
+    for term in re.split(r"\s+", text):
+        term = term.strip("\"'.,!?()[]{}<>:;")
+        if len(term) >= _MIN_FTS_TERM and term not in terms:
+            terms.append(term)
+        if len(terms) >= max_terms:
+            break
+    if not terms:
+        return None
+    quoted = ['"' + t.replace('"', '""') + '"*' for t in terms]
+    return (" OR " if any_term else " ").join(quoted)
+
+
+async def close_db():
+    await batch_writer.stop()
+    await database.close()
+
+
+async def _insert(sql: str, params: tuple):
+    """Hand the row to the write-behind buffer, or write it directly if that isn't running."""
+    if batch_writer.running:
+        batch_writer.add(sql, params)
+        return
+    async with database.write() as db:
+        await db.execute(sql, params)
 
 
 async def save_execution(
@@ -46,25 +286,25 @@ async def save_execution(
     status: str,
     error_message: str | None = None,
     cron_id: str | None = None,
+    prompt_chars: int | None = None,
+    prompt_tokens: int | None = None,
 ):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            """INSERT INTO executions
-               (timestamp, source, cron_id, prompt, result, duration_sec, work_dir, status, error_message)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (
-                datetime.now().isoformat(),
-                source,
-                cron_id,
-                prompt,
-                result,
-                duration_sec,
-                work_dir,
-                status,
-                error_message,
-            ),
-        )
-        await db.commit()
+    await _insert(
+        _INSERT_EXECUTION,
+        (
+            datetime.now().isoformat(),
+            source,
+            cron_id,
+            prompt,
+            result,
+            duration_sec,
+            work_dir,
+            status,
+            error_message,
+            prompt_chars,
+            prompt_tokens,
+        ),
+    )
 
 
 async def save_conversation(
@@ -73,37 +313,272 @@ async def save_conversation(
     work_dir: str,
     duration_sec: float,
 ):
-    async with aiosqlite.connect(DB_PATH) as db:
+    await _insert(
+        _INSERT_CONVERSATION,
+        (
+            datetime.now().isoformat(),
+            user_message,
+            assistant_response,
+            work_dir,
+            duration_sec,
+        ),
+    )
+
+
+async def get_recent_conversations(n: int = 5) -> list[dict]:
+    async with database.read() as db:
+        cursor = await db.execute(_SELECT_RECENT_CONVERSATIONS, (n,))
+        rows = await cursor.fetchall()
+        await cursor.close()
+    turns = [dict(r) for r in reversed(rows)]
+
+    # Read-your-writes: include turns still sitting in the write-behind buffer.
+    # A batch may commit while we read, so skip rows the SELECT already returned.
+    seen = {t["timestamp"] for t in turns}
+    for params in batch_writer.pending(_INSERT_CONVERSATION):
+        if params[0] not in seen:
+            turns.append({"id": None, **dict(zip(_CONVERSATION_COLUMNS, params))})
+    return turns[-n:] if n > 0 else []
+
+
+async def get_recent_executions(n: int = 10) -> list[dict]:
+    async with database.read() as db:
+        cursor = await db.execute(_SELECT_RECENT_EXECUTIONS, (n,))
+        rows = await cursor.fetchall()
+        await cursor.close()
+        return [dict(r) for r in reversed(rows)]
+
+
+async def clear_conversations():
+    await batch_writer.flush()
+    async with database.write() as db:
+        await db.execute("DELETE FROM conversations")
+
+
+async def search_executions(query: str, limit: int = 10) -> list[dict]:
+    """Ranked full-text search over execution prompts and results, with snippets."""
+    match = _fts_query(query)
+    if match is None:
+        return []
+    async with database.read() as db:
+        cursor = await db.execute(_SEARCH_EXECUTIONS, (match, limit))
+        rows = await cursor.fetchall()
+        await cursor.close()
+    return [dict(r) for r in rows]
+
+
+async def search_conversations(text: str, limit: int = 3, exclude_ids: set[int] | None = None) -> list[dict]:
+    """Past turns most relevant to ``text`` (any term matches, best first)."""
+    match = _fts_query(text, any_term=True)
+    if match is None or limit <= 0:
+        return []
+    exclude_ids = exclude_ids or set()
+    async with database.read() as db:
+        cursor = await db.execute(_SEARCH_CONVERSATIONS, (match, limit + len(exclude_ids)))
+        rows = await cursor.fetchall()
+        await cursor.close()
+    return [dict(r) for r in rows if r["id"] not in exclude_ids][:limit]
+
+
+async def load_sessions() -> list[dict]:
+    async with database.read() as db:
+        cursor = await db.execute("SELECT * FROM claude_sessions")
+        rows = await cursor.fetchall()
+        await cursor.close()
+    return [dict(r) for r in rows]
+
+
+async def save_session(chat_id: int, work_dir: str, session_id: str, context_version: str, turns: int, updated_at: str):
+    await _insert(_UPSERT_SESSION, (chat_id, work_dir, session_id, context_version, turns, updated_at))
+
+
+async def delete_sessions(chat_id: int | None = None, work_dir: str | None = None):
+    await batch_writer.flush()
+    async with database.write() as db:
+        if chat_id is None:
+            await db.execute("DELETE FROM claude_sessions")
+        elif work_dir is None:
+            await db.execute("DELETE FROM claude_sessions WHERE chat_id = ?", (chat_id,))
+        else:
+            await db.execute(
+                "DELETE FROM claude_sessions WHERE chat_id = ? AND work_dir = ?", (chat_id, work_dir)
+            )
+
+
+async def load_crons() -> list[dict]:
+    """All cron definitions with their run state; ``options`` is decoded to a dict."""
+    async with database.read() as db:
+        cursor = await db.execute("SELECT * FROM crons ORDER BY created_at, id")
+        rows = await cursor.fetchall()
+        await cursor.close()
+    crons = []
+    for row in rows:
+        cron = dict(row)
+        cron["enabled"] = bool(cron["enabled"])
+        cron["silent_on_success"] = bool(cron["silent_on_success"])
+        cron["options"] = json.loads(cron["options"]) if cron["options"] else {}
+        crons.append(cron)
+    return crons
+
+
+async def save_cron(
+    cron_id: str,
+    name: str,
+    cron_expr: str,
+    prompt: str,
+    work_dir: str,
+    enabled: bool,
+    silent_on_success: bool,
+    options: dict,
+    created_at: str | None = None,
+):
+    """Insert or update a cron definition. Written directly: definitions must survive a crash."""
+    async with database.write() as db:
         await db.execute(
-            """INSERT INTO conversations
-               (timestamp, user_message, assistant_response, work_dir, duration_sec)
-               VALUES (?, ?, ?, ?, ?)""",
+            _UPSERT_CRON,
             (
-                datetime.now().isoformat(),
-                user_message,
-                assistant_response,
+                cron_id,
+                name,
+                cron_expr,
+                prompt,
                 work_dir,
-                duration_sec,
+                int(enabled),
+                int(silent_on_success),
+                json.dumps(options, ensure_ascii=False),
+                created_at or datetime.now().isoformat(),
             ),
         )
-        await db.commit()
 
 
-async def get_recent_conversations(n: int = 5) -> list[dict]:
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+async def delete_cron(cron_id: str):
+    async with database.write() as db:
+        await db.execute("DELETE FROM crons WHERE id = ?", (cron_id,))
+
+
+async def update_cron_state(
+    cron_id: str,
+    last_run: str | None,
+    next_run: str | None,
+    last_status: str | None,
+    last_duration: float | None,
+):
+    await _insert(_UPDATE_CRON_STATE, (last_run, next_run, last_status, last_duration, cron_id))
+
+
+async def load_scheduler_jobs() -> list[tuple[str, bytes]]:
+    """Saved APScheduler jobs as (id, pickled job state)."""
+    async with database.read() as db:
+        cursor = await db.execute("SELECT id, job_state FROM scheduler_jobs")
+        rows = await cursor.fetchall()
+        await cursor.close()
+    return [(r["id"], r["job_state"]) for r in rows]
+
+
+async def load_retries() -> list[dict]:
+    async with database.read() as db:
+        cursor = await db.execute("SELECT * FROM retries ORDER BY next_attempt_at")
+        rows = await cursor.fetchall()
+        await cursor.close()
+    return [dict(r) for r in rows]
+
+
+async def add_retry(
+    source: str,
+    prompt: str,
+    work_dir: str,
+    next_attempt_at: float,
+    chat_id: int | None = None,
+    cron_id: str | None = None,
+    last_error: str | None = None,
+) -> int:
+    """Persist a pending retry right away (not via the write-behind buffer) and return its id."""
+    async with database.write() as db:
         cursor = await db.execute(
-            "SELECT * FROM conversations ORDER BY id DESC LIMIT ?", (n,)
+            """INSERT INTO retries
+                (source, chat_id, cron_id, prompt, work_dir, attempt, next_attempt_at, last_error, created_at)
+                VALUES (?, ?, ?, ?, ?, 1, ?, ?, ?)""",
+            (source, chat_id, cron_id, prompt, work_dir, next_attempt_at, last_error, datetime.now().isoformat()),
         )
+        retry_id = cursor.lastrowid
+        await cursor.close()
+    return retry_id
+
+
+async def update_retry(retry_id: int, attempt: int, next_attempt_at: float, last_error: str | None):
+    async with database.write() as db:
+        await db.execute(
+            "UPDATE retries SET attempt = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+            (attempt, next_attempt_at, last_error, retry_id),
+        )
+
+
+async def delete_retry(retry_id: int):
+    async with database.write() as db:
+        await db.execute("DELETE FROM retries WHERE id = ?", (retry_id,))
+
+
+async def load_uploads() -> tuple[list[dict], list[dict], list[dict]]:
+    """Stored upload blobs, file_unique_id references and name links."""
+    tables = []
+    async with database.read() as db:
+        for table in ("uploads", "upload_refs", "upload_links"):
+            cursor = await db.execute(f"SELECT * FROM {table}")
+            tables.append([dict(r) for r in await cursor.fetchall()])
+            await cursor.close()
+    return tables[0], tables[1], tables[2]
+
+
+async def save_upload(sha256: str, path: str, size: int, last_used: float):
+    async with database.write() as db:
+        await db.execute(_UPSERT_UPLOAD, (sha256, path, size, last_used))
+
+
+async def touch_upload(sha256: str, last_used: float):
+    await _insert("UPDATE uploads SET last_used = ? WHERE sha256 = ?", (last_used, sha256))
+
+
+async def save_upload_ref(file_unique_id: str, sha256: str):
+    await _insert("INSERT OR REPLACE INTO upload_refs (file_unique_id, sha256) VALUES (?, ?)", (file_unique_id, sha256))
+
+
+async def save_upload_link(path: str, sha256: str):
+    await _insert("INSERT OR REPLACE INTO upload_links (path, sha256) VALUES (?, ?)", (path, sha256))
+
+
+async def delete_upload(sha256: str):
+    """Forget a blob together with its references and links."""
+    await batch_writer.flush()
+    async with database.write() as db:
+        await db.execute("DELETE FROM upload_refs WHERE sha256 = ?", (sha256,))
+        await db.execute("DELETE FROM upload_links WHERE sha256 = ?", (sha256,))
+        await db.execute("DELETE FROM uploads WHERE sha256 = ?", (sha256,))
+
+
+async def load_memory_entries() -> list[dict]:
+    async with database.read() as db:
+        cursor = await db.execute("SELECT position, section, text FROM memory_entries ORDER BY position")
         rows = await cursor.fetchall()
-        return [dict(r) for r in reversed(rows)]
+        await cursor.close()
+    return [dict(r) for r in rows]
 
 
-async def get_recent_executions(n: int = 10) -> list[dict]:
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute(
-            "SELECT * FROM executions ORDER BY id DESC LIMIT ?", (n,)
+async def replace_memory_entries(entries: list[dict]):
+    """Rebuild the memory index from MEMORY.md's entries (the FTS table follows via triggers)."""
+    async with database.write() as db:
+        await db.execute("DELETE FROM memory_entries")
+        await db.executemany(
+            "INSERT INTO memory_entries (position, section, text) VALUES (?, ?, ?)",
+            [(i, e["section"], e["text"]) for i, e in enumerate(entries)],
         )
+
+
+async def search_memory_entries(text: str, limit: int = 20) -> list[int]:
+    """Positions of the memory entries that best match ``text`` (any term, BM25 order)."""
+    match = _fts_query(text, any_term=True)
+    if match is None or limit <= 0:
+        return []
+    async with database.read() as db:
+        cursor = await db.execute(_SEARCH_MEMORY, (match, limit))
         rows = await cursor.fetchall()
-        return [dict(r) for r in reversed(rows)]
+        await cursor.close()
+    return [r["position"] for r in rows]
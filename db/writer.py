@@ -0,0 +1,116 @@
+import asyncio
+import logging
+
+from db.connection import database
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+class BatchWriter:
+    """Write-behind buffer that group-commits INSERTs in one transaction.
+
+    Rows are flushed every ``flush_interval_ms`` or as soon as ``max_rows``
+    are buffered, whichever comes first. Callers never wait on disk.
+    """
+
+    def __init__(self, flush_interval_ms: int = 200, max_rows: int = 50):
+        self._interval = flush_interval_ms / 1000
+        self._max_rows = max_rows
+        self._buffer: list[tuple[str, tuple]] = []
+        self._inflight: list[tuple[str, tuple]] = []
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+        self._flush_lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self, flush_interval_ms: int | None = None, max_rows: int | None = None):
+        if flush_interval_ms is not None:
+            self._interval = flush_interval_ms / 1000
+        if max_rows is not None:
+            self._max_rows = max_rows
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background task and flush whatever is still buffered.
+
+        The task is not cancelled: a flush in progress finishes its write first.
+        """
+        if self._task:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def add(self, sql: str, params: tuple):
+        self._buffer.append((sql, params))
+        if len(self._buffer) >= self._max_rows:
+            self._wakeup.set()
+
+    def pending(self, sql: str) -> list[tuple]:
+        """Params of rows for ``sql`` that are not yet visible in the database."""
+        return [p for s, p in self._inflight + self._buffer if s == sql]
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._buffer:
+                return
+            self._inflight, self._buffer = self._buffer, []
+            try:
+                await self._write_batch(self._inflight)
+            except asyncio.CancelledError:
+                # Interrupted mid-write (rolled back): keep the rows for the next flush
+                self._buffer[:0] = self._inflight
+                raise
+            finally:
+                self._inflight = []
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("DB 일괄 기록 실패")
+
+    async def _write_batch(self, rows: list[tuple[str, tuple]]):
+        try:
+            async with database.write() as db:
+                for sql, group in _group_by_statement(rows):
+                    await db.executemany(sql, group)
+            registry.inc("kkabi_db_rows_written_total", len(rows))
+        except Exception:
+            # One bad row must not take the whole batch down with it
+            logger.exception("DB 일괄 기록 실패, 행 단위로 재시도 (%d행)", len(rows))
+            for sql, params in rows:
+                try:
+                    async with database.write() as db:
+                        await db.execute(sql, params)
+                    registry.inc("kkabi_db_rows_written_total")
+                except Exception:
+                    logger.exception("DB 기록 실패, 행 버림: %s", sql.split("(")[0].strip())
+
+
+def _group_by_statement(rows: list[tuple[str, tuple]]):
+    """Split rows into consecutive runs of the same statement, preserving order."""
+    groups: list[tuple[str, list[tuple]]] = []
+    for sql, params in rows:
+        if groups and groups[-1][0] == sql:
+            groups[-1][1].append(params)
+        else:
+            groups.append((sql, [params]))
+    return groups
+
+
+batch_writer = BatchWriter()
@@ -1,5 +1,4 @@
 import asyncio
-import json
 import logging
 import os
 import signal
@@ -21,6 +20,7 @@ from bot.handlers import (
     cmd_pwd,
     cmd_status,
     cmd_history,
+    cmd_search,
     cmd_memory,
     cmd_memory_add,
     cmd_memory_clear,
@@ -32,11 +32,19 @@ from bot.handlers import (
     cmd_running,
     cmd_help,
     cmd_cron,
+    cmd_stats,
 )
+from bot.outbox import outbox
 from bot.safety import handle_safety_callback
+from bot.sender import send_text
+from claude.pool import warm_pool
 from claude.queue import execution_queue
-from db.store import init_db
+from claude.retry import retry_queue
+from config import Config, config_exists, get_config, on_reload, set_reload_loop
+from db.store import init_db, close_db
+from memory import file_cache
 from memory.manager import cleanup_old_logs
+from metrics import metrics_server
 from scheduler.cron import init_scheduler, shutdown_scheduler
 
 # Logging
@@ -53,27 +61,47 @@ logging.basicConfig(
 )
 logger = logging.getLogger("kkabi")
 
-CONFIG_PATH = os.path.join(os.path.dirname(__file__), "config.json")
 
-
-def load_config() -> dict:
-    if not os.path.exists(CONFIG_PATH):
+def load_config() -> Config:
+    if not config_exists():
         logger.error("config.json이 없습니다. config.example.json을 복사해서 만드세요.")
         sys.exit(1)
-    with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return get_config()
+
+
+def _apply_queue_policy(config: Config):
+    claude_config = config.claude
+    execution_queue.set_policy(
+        class_limits={
+            "file": claude_config.file_max_concurrent,
+            "retry": claude_config.retry_max_concurrent,
+            "cron": claude_config.cron_max_concurrent,
+        },
+        cron_max_load=claude_config.cron_max_load,
+        cron_max_defer_sec=claude_config.cron_max_defer_sec,
+    )
+
+
+@on_reload
+def _apply_config_changes(old: Config, new: Config):
+    _apply_queue_policy(new)
+    if new.claude.max_concurrent != old.claude.max_concurrent:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        loop.create_task(execution_queue.resize(new.claude.max_concurrent))
 
 
 def main():
     config = load_config()
-    token = config["telegram"]["bot_token"]
+    token = config.telegram.bot_token
     if not token or token == "YOUR_BOT_TOKEN_HERE":
         logger.error("config.json에 유효한 bot_token을 설정하세요.")
         sys.exit(1)
 
     # Ensure runtime dirs
     os.makedirs(os.path.join(os.path.dirname(__file__), "logs"), exist_ok=True)
-    os.makedirs(os.path.join(os.path.dirname(__file__), "data", "uploads"), exist_ok=True)
     os.makedirs(os.path.join(os.path.dirname(__file__), "data", "memory", "logs"), exist_ok=True)
     os.makedirs(os.path.join(os.path.dirname(__file__), "data", "memory", "projects"), exist_ok=True)
     os.makedirs(os.path.join(os.path.dirname(__file__), "data", "persona"), exist_ok=True)
@@ -86,6 +114,7 @@ def main():
     app.add_handler(CommandHandler("pwd", cmd_pwd))
     app.add_handler(CommandHandler("status", cmd_status))
     app.add_handler(CommandHandler("history", cmd_history))
+    app.add_handler(CommandHandler("search", cmd_search))
     app.add_handler(CommandHandler("memory", cmd_memory))
     app.add_handler(CommandHandler("memory_add", cmd_memory_add))
     app.add_handler(CommandHandler("memory_clear", cmd_memory_clear))
@@ -98,6 +127,7 @@ def main():
     app.add_handler(CommandHandler("help", cmd_help))
     app.add_handler(CommandHandler("start", cmd_help))
     app.add_handler(CommandHandler("cron", cmd_cron))
+    app.add_handler(CommandHandler("stats", cmd_stats))
 
     # Callback query (safety confirmation)
     app.add_handler(CallbackQueryHandler(handle_safety_callback))
@@ -110,24 +140,43 @@ def main():
 
     # Post-init: start scheduler, DB, queue
     async def post_init(application: Application):
-        await init_db()
-        execution_queue.start()
+        set_reload_loop(asyncio.get_running_loop())
+        await init_db(
+            flush_interval_ms=config.db.flush_interval_ms,
+            flush_max_rows=config.db.flush_max_rows,
+        )
+        _apply_queue_policy(config)
+        execution_queue.start(
+            max_concurrent=config.claude.max_concurrent,
+            max_size=config.claude.queue_max_size,
+        )
+        await warm_pool.start([os.path.expanduser(config.claude.default_work_dir)])
+        if config.metrics.enabled:
+            try:
+                await metrics_server.start(config.metrics.port)
+            except OSError:
+                logger.exception("메트릭 엔드포인트 시작 실패 (포트 %d)", config.metrics.port)
 
         # Telegram send function for cron results
-        allowed = config.get("telegram", {}).get("allowed_user_ids", [])
+        allowed = config.telegram.allowed_user_ids
         chat_id = allowed[0] if allowed else None
 
         async def send_to_telegram(text: str):
             if chat_id:
-                from bot.sender import split_message
-                for chunk in split_message(text):
-                    await application.bot.send_message(chat_id=chat_id, text=chunk)
+                await send_text(application.bot, chat_id, text)
+
+        async def send_to_chat(target_chat_id: int | None, text: str):
+            if target_chat_id is None:
+                await send_to_telegram(text)
+                return
+            await send_text(application.bot, target_chat_id, text)
 
-        init_scheduler(send_func=send_to_telegram if chat_id else None)
+        await init_scheduler(send_func=send_to_telegram if chat_id else None)
+        await retry_queue.start(send_func=send_to_chat)
 
         # Cleanup old logs
-        retention = config.get("memory", {}).get("log_retention_days", 30)
-        removed = cleanup_old_logs(retention)
+        retention = config.memory.log_retention_days
+        removed = await file_cache.run_io(cleanup_old_logs, retention)
         if removed:
             logger.info("오래된 로그 %d개 삭제", removed)
 
@@ -135,7 +184,12 @@ def main():
 
     async def post_shutdown(application: Application):
         shutdown_scheduler()
+        await retry_queue.stop()
         await execution_queue.stop()
+        await warm_pool.stop()
+        await outbox.stop()
+        await metrics_server.stop()
+        await close_db()
         logger.info("Kkabi 종료됨")
 
     app.post_init = post_init
@@ -0,0 +1,71 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# path -> ((mtime_ns, size) or None, content or None)
+_entries: dict[str, tuple[tuple[int, int] | None, str | None]] = {}
+
+# Bumped on every write/invalidate so values memoized from cached files know to rebuild
+_generation = 0
+_generation_lock = threading.Lock()
+
+# Disk access from coroutines runs here, so a slow disk (or WSL) never stalls the event loop
+_IO_WORKERS = 4
+_executor: ThreadPoolExecutor | None = None
+
+
+async def run_io(func, *args, **kwargs):
+    """Run a blocking file function on the bounded I/O pool and return its result."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=_IO_WORKERS, thread_name_prefix="kkabi-io")
+    return await asyncio.get_running_loop().run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+def stamp(path: str) -> tuple[int, int] | None:
+    """(mtime_ns, size) of ``path``, or None if it doesn't exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def read_text(path: str) -> str | None:
+    """Return the file's content, re-reading only when its mtime/size changed."""
+    current = stamp(path)
+    entry = _entries.get(path)
+    if entry is not None and entry[0] == current:
+        return entry[1]
+    content = None
+    if current is not None:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                content = f.read()
+        except FileNotFoundError:
+            current = None
+    _entries[path] = (current, content)
+    return content
+
+
+def write_text(path: str, content: str):
+    """Write through the cache so the next read doesn't hit the disk."""
+    global _generation
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    _entries[path] = (stamp(path), content)
+    with _generation_lock:
+        _generation += 1
+
+
+def invalidate(path: str):
+    global _generation
+    _entries.pop(path, None)
+    with _generation_lock:
+        _generation += 1
+
+
+def generation() -> int:
+    return _generation
@@ -0,0 +1,117 @@
+import asyncio
+import re
+
+from memory import file_cache
+from memory.manager import load_memory
+
+# Top-level list item: "- ...", "* ...", "1. ..."
+_ITEM_RE = re.compile(r"^(?:[-*+]|\d+[.)])\s+(.*)$")
+
+# Per-entry overhead in the rendered block ("- " + newline)
+_ENTRY_OVERHEAD = 3
+
+_lock = asyncio.Lock()
+_indexed_content: str | None = None
+_entries: list[dict] = []
+
+
+def parse_entries(content: str) -> list[dict]:
+    """Split MEMORY.md into entries: {"section", "text"}.
+
+    Every top-level list item is an entry; indented lines belong to the item
+    above them. Other text becomes one entry per paragraph. ``#`` headings
+    set the section of the entries below them.
+    """
+    entries = []
+    section = ""
+    current = None
+    for line in content.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            current = None
+            continue
+        if stripped.startswith("#"):
+            section = stripped.lstrip("#").strip()
+            current = None
+            continue
+        match = _ITEM_RE.match(line)
+        if match:
+            current = {"section": section, "text": match.group(1).strip()}
+            entries.append(current)
+        elif current is not None:
+            current["text"] += "\n" + stripped
+        else:
+            current = {"section": section, "text": stripped}
+            entries.append(current)
+    return entries
+
+
+async def sync_memory_index() -> list[dict]:
+    """Re-index MEMORY.md if it changed since the last call. Returns its entries in file order."""
+    global _indexed_content, _entries
+    from db.store import load_memory_entries, replace_memory_entries
+
+    content = await file_cache.run_io(load_memory)
+    if content is _indexed_content or content == _indexed_content:
+        return _entries
+    async with _lock:
+        if content == _indexed_content:
+            return _entries
+        entries = parse_entries(content)
+        if _indexed_content is None:
+            # First call since start: the index may already match the file
+            stored = await load_memory_entries()
+            indexed = [{"section": e["section"], "text": e["text"]} for e in stored]
+        else:
+            indexed = _entries
+        if indexed != entries:
+            await replace_memory_entries(entries)
+        _indexed_content, _entries = content, entries
+    return _entries
+
+
+async def select_memory_entries(query: str, max_chars: int, top_k: int) -> list[dict]:
+    """Entries to put in the prompt for ``query``, in file order, within ``max_chars``.
+
+    If the whole memory fits it is used as is. Otherwise the ``top_k`` best
+    full-text (BM25) matches go in first and the rest of the budget is filled
+    with the newest entries.
+    """
+    from db.store import search_memory_entries
+
+    entries = await sync_memory_index()
+    costs = [len(e["text"]) + _ENTRY_OVERHEAD for e in entries]
+    if sum(costs) <= max_chars:
+        return entries
+
+    chosen: set[int] = set()
+    used = 0
+
+    def take(position: int):
+        nonlocal used
+        if position in chosen or used + costs[position] > max_chars:
+            return
+        chosen.add(position)
+        used += costs[position]
+
+    if top_k > 0 and query:
+        for position in await search_memory_entries(query, top_k):
+            if position < len(entries):
+                take(position)
+    for position in range(len(entries) - 1, -1, -1):
+        if max_chars - used < _ENTRY_OVERHEAD + 1:
+            break
+        take(position)
+    return [entries[p] for p in sorted(chosen)]
+
+
+def format_entries(entries: list[dict]) -> str:
+    lines = []
+    section = ""
+    for entry in entries:
+        if entry["section"] != section:
+            section = entry["section"]
+            if section:
+                lines.append(f"## {section}")
+        lines.append(f"- {entry['text']}")
+    return "\n".join(lines)
@@ -1,29 +1,33 @@
 import os
 from datetime import datetime, timedelta
 
+from memory import file_cache
+
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "memory")
 MEMORY_PATH = os.path.join(DATA_DIR, "MEMORY.md")
 LOGS_DIR = os.path.join(DATA_DIR, "logs")
 PROJECTS_DIR = os.path.join(DATA_DIR, "projects")
 
 
+_dirs_ready = False
+
+
 def _ensure_dirs():
+    global _dirs_ready
+    if _dirs_ready:
+        return
     os.makedirs(LOGS_DIR, exist_ok=True)
     os.makedirs(PROJECTS_DIR, exist_ok=True)
+    _dirs_ready = True
 
 
 def load_memory() -> str:
-    _ensure_dirs()
-    if os.path.exists(MEMORY_PATH):
-        with open(MEMORY_PATH, "r", encoding="utf-8") as f:
-            return f.read()
-    return ""
+    return file_cache.read_text(MEMORY_PATH) or ""
 
 
 def save_memory(content: str):
     _ensure_dirs()
-    with open(MEMORY_PATH, "w", encoding="utf-8") as f:
-        f.write(content)
+    file_cache.write_text(MEMORY_PATH, content)
 
 
 def append_to_memory(text: str):
@@ -75,9 +79,8 @@ def cleanup_old_logs(retention_days: int = 30):
 
 
 def get_memory_summary() -> str:
+    """MEMORY.md as a whole, for /memory (the prompt only gets the relevant entries)."""
     content = load_memory()
-    if not content:
+    if not content.strip():
         return "(메모리 없음)"
-    if len(content) > 2000:
-        return content[:2000] + "\n...(생략)"
     return content
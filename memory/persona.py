@@ -1,12 +1,25 @@
 import os
 
+from memory import file_cache
+
 PERSONA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "persona")
 
 VALID_NAMES = {"soul", "user", "mood"}
 
 
+_dir_ready = False
+
+
 def _ensure_dir():
+    global _dir_ready
+    if _dir_ready:
+        return
     os.makedirs(PERSONA_DIR, exist_ok=True)
+    _dir_ready = True
+
+
+def persona_path(name: str) -> str:
+    return os.path.join(PERSONA_DIR, f"{name.upper()}.md")
 
 
 def load_persona_file(name: str) -> str:
@@ -14,12 +27,8 @@ def load_persona_file(name: str) -> str:
     name = name.lower()
     if name not in VALID_NAMES:
         return ""
-    _ensure_dir()
-    path = os.path.join(PERSONA_DIR, f"{name.upper()}.md")
-    if os.path.exists(path):
-        with open(path, "r", encoding="utf-8") as f:
-            return f.read().strip()
-    return ""
+    content = file_cache.read_text(persona_path(name))
+    return content.strip() if content else ""
 
 
 def save_persona_file(name: str, content: str):
@@ -28,9 +37,7 @@ def save_persona_file(name: str, content: str):
     if name not in VALID_NAMES:
         return
     _ensure_dir()
-    path = os.path.join(PERSONA_DIR, f"{name.upper()}.md")
-    with open(path, "w", encoding="utf-8") as f:
-        f.write(content)
+    file_cache.write_text(persona_path(name), content)
 
 
 def build_persona_block() -> str:
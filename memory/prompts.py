@@ -1,20 +1,87 @@
-from memory.manager import get_memory_summary
+import re
 
+from memory.index import format_entries, select_memory_entries
 
-def build_memory_block() -> str:
-    summary = get_memory_summary()
-    if summary == "(메모리 없음)":
+_CODE_BLOCK_RE = re.compile(r"```.*?(```|$)", re.DOTALL)
+
+# Minimum room for a turn; below this it's dropped instead of truncated
+_MIN_TURN_TOKENS = 40
+
+_ELLIPSIS = "...(생략)"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count without a tokenizer: ~4 ASCII chars per token, 1 per other char (e.g. Hangul)."""
+    if not text:
+        return 0
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    max_tokens -= estimate_tokens(_ELLIPSIS)
+    # Binary search on the prefix length that fits
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo].rstrip() + _ELLIPSIS
+
+
+def _compact_turn_text(text: str, age: int) -> str:
+    """Older turns keep less: code blocks are dropped and the text is cut shorter with age."""
+    if age == 0:
+        return text
+    text = _CODE_BLOCK_RE.sub("[코드 생략]", text)
+    return _truncate_to_tokens(text, max(_MIN_TURN_TOKENS, 400 // age))
+
+
+async def build_memory_block(query: str, max_chars: int = 2000, top_k: int = 20) -> str:
+    """Memory entries relevant to ``query`` (see select_memory_entries), within ``max_chars``."""
+    entries = await select_memory_entries(query, max_chars, top_k)
+    if not entries:
         return ""
-    return f"[메모리 요약]\n{summary}"
+    return f"[메모리 요약]\n{format_entries(entries)}"
 
 
-def build_conversation_block(recent_turns: list[dict]) -> str:
+def build_conversation_block(
+    recent_turns: list[dict],
+    token_budget: int | None = None,
+    header: str = "[최근 대화]",
+) -> str:
+    """Format recent turns, oldest first.
+
+    With ``token_budget``, turns are taken newest-first until the budget is
+    used up; older turns are compacted before they are dropped.
+    """
     if not recent_turns:
         return ""
-    lines = ["[최근 대화]"]
-    for turn in recent_turns:
-        user_msg = turn.get("user_message", "")
-        assistant_msg = turn.get("assistant_response", "")
-        lines.append(f"나: {user_msg}")
-        lines.append(f"Claude: {assistant_msg}")
-    return "\n".join(lines)
+    if token_budget is None:
+        lines = [header]
+        for turn in recent_turns:
+            lines.append(f"나: {turn.get('user_message', '')}")
+            lines.append(f"Claude: {turn.get('assistant_response', '')}")
+        return "\n".join(lines)
+
+    remaining = token_budget - estimate_tokens(header)
+    entries: list[str] = []
+    for age, turn in enumerate(reversed(recent_turns)):
+        user_msg = _compact_turn_text(turn.get("user_message", ""), age)
+        assistant_msg = _compact_turn_text(turn.get("assistant_response", ""), age)
+        entry = f"나: {user_msg}\nClaude: {assistant_msg}"
+        cost = estimate_tokens(entry) + 1
+        if cost > remaining:
+            if remaining < _MIN_TURN_TOKENS:
+                break
+            entry = _truncate_to_tokens(entry, remaining - 1)
+            cost = remaining
+        entries.append(entry)
+        remaining -= cost
+    if not entries:
+        return ""
+    return "\n".join([header, *reversed(entries)])
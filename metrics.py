@@ -0,0 +1,177 @@
+import asyncio
+import bisect
+import contextlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) shared by every latency histogram
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_HELP = {
+    "kkabi_queue_wait_seconds": "Time a job waited in the execution queue before a worker picked it up",
+    "kkabi_prompt_build_seconds": "Time spent in build_full_prompt",
+    "kkabi_claude_first_byte_seconds": "Claude CLI spawn (or request) to first stdout line",
+    "kkabi_claude_run_seconds": "Claude CLI total runtime",
+    "kkabi_db_write_seconds": "Time holding the DB writer for one transaction",
+    "kkabi_db_rows_written_total": "Rows written by the write-behind batch writer",
+    "kkabi_telegram_send_seconds": "Telegram Bot API call latency (send/edit)",
+    "kkabi_telegram_retry_after_total": "Telegram 429 (RetryAfter) responses",
+    "kkabi_cron_lateness_seconds": "Delay between a cron's scheduled time and its actual start",
+}
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Bucket upper bound below which ``q`` of observations fall (what Prometheus would estimate, roughly)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else float("inf")
+        return float("inf")
+
+
+class Registry:
+    """In-process counters and histograms, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._histograms: dict[str, dict[tuple, Histogram]] = {}
+        self._counters: dict[str, dict[tuple, float]] = {}
+
+    def observe(self, name: str, seconds: float, **labels):
+        series = self._histograms.setdefault(name, {})
+        key = _label_key(labels)
+        if key not in series:
+            series[key] = Histogram()
+        series[key].observe(seconds)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        series = self._counters.setdefault(name, {})
+        key = _label_key(labels)
+        series[key] = series.get(key, 0) + amount
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def render(self) -> str:
+        lines = []
+        for name, series in sorted(self._counters.items()):
+            lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in series.items():
+                lines.append(f"{name}{_format_labels(key)} {value:g}")
+        for name, series in sorted(self._histograms.items()):
+            lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, hist in series.items():
+                cumulative = 0
+                for bound, n in zip(BUCKETS + (float("inf"),), hist.counts):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f"{name}_bucket{_format_labels(key, (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(key)} {hist.total:.6f}")
+                lines.append(f"{name}_count{_format_labels(key)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> list[dict]:
+        """One row per histogram series: name, labels, count, avg, p50, p95, p99."""
+        rows = []
+        for name, series in sorted(self._histograms.items()):
+            for key, hist in sorted(series.items()):
+                rows.append({
+                    "name": name,
+                    "labels": dict(key),
+                    "count": hist.count,
+                    "avg": hist.total / hist.count if hist.count else 0.0,
+                    "p50": hist.quantile(0.5),
+                    "p95": hist.quantile(0.95),
+                    "p99": hist.quantile(0.99),
+                })
+        return rows
+
+    def counters(self) -> list[dict]:
+        return [
+            {"name": name, "labels": dict(key), "value": value}
+            for name, series in sorted(self._counters.items())
+            for key, value in sorted(series.items())
+        ]
+
+    def reset(self):
+        self._histograms.clear()
+        self._counters.clear()
+
+
+registry = Registry()
+
+
+class MetricsServer:
+    """Minimal HTTP server answering ``GET /metrics``, bound to 127.0.0.1 only."""
+
+    def __init__(self):
+        self._server: asyncio.base_events.Server | None = None
+
+    async def start(self, port: int):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", port)
+        logger.info("메트릭 엔드포인트: http://127.0.0.1:%d/metrics", port)
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Skip the request headers
+            while (await asyncio.wait_for(reader.readline(), timeout=5)).strip():
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", registry.render().encode("utf-8")
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            else:
+                status, body, content_type = "404 Not Found", b"not found\n", "text/plain"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+metrics_server = MetricsServer()
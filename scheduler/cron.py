@@ -1,37 +1,148 @@
+import asyncio
+import collections
+import hashlib
 import json
 import os
+import time
 import uuid
 import logging
+from datetime import datetime, timedelta
+
+from apscheduler.events import EVENT_JOB_SUBMITTED
+from apscheduler.jobstores.base import JobLookupError
+from apscheduler.jobstores.memory import MemoryJobStore
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.date import DateTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+
+from config import get_config
+from memory import file_cache
+from metrics import registry
+from scheduler.jobstore import PersistentJobStore
 
 logger = logging.getLogger(__name__)
 
+MAINTENANCE_JOB_ID = "_db_maintenance"
+
+# Upper bound on missed occurrences counted per job (e.g. a */1 cron after a long outage)
+_MAX_CATCH_UP_RUNS = 100
+
+# Legacy JSON registry, imported into the crons table on first start
 CRONS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "crons.json")
 
 _scheduler: AsyncIOScheduler | None = None
 _send_telegram_func = None  # Will be set by main.py
 
+# In-memory index of the crons table (id -> entry), loaded by init_scheduler
+_crons: dict[str, dict] = {}
+
+# Per-cron scheduling options accepted by /cron add (key=value), stored in crons.options
+CRON_OPTIONS = {
+    "max_instances": int,
+    "coalesce": bool,
+    "misfire_grace_time": int,
+    "jitter": int,
+    "jitter_mode": str,
+}
+_OPTION_ALIASES = {"misfire": "misfire_grace_time", "instances": "max_instances"}
+JITTER_MODES = ("random", "hash")
+
+# Monotonic timestamps of cron starts in the last minute (global rate limit)
+_recent_starts: collections.deque = collections.deque()
+
+
+def _entry_from_row(row: dict) -> dict:
+    """Flatten a crons row into the entry dict used everywhere else (options become top-level keys)."""
+    options = row.pop("options", None) or {}
+    return {**row, **{k: v for k, v in options.items() if k in CRON_OPTIONS}}
+
+
+def _read_crons_json() -> list[dict] | None:
+    if not os.path.exists(CRONS_PATH):
+        return None
+    with open(CRONS_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
 
-def _load_crons() -> list[dict]:
-    if os.path.exists(CRONS_PATH):
-        with open(CRONS_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return []
+async def _migrate_json():
+    """One-time import of the old data/crons.json into the crons table."""
+    from db.store import save_cron
 
+    try:
+        entries = await file_cache.run_io(_read_crons_json)
+    except (OSError, ValueError):
+        logger.exception("crons.json 읽기 실패, 마이그레이션 건너뜀")
+        return
+    if entries is None:
+        return
+    for entry in entries:
+        if entry["id"] in _crons:
+            continue
+        await save_cron(
+            entry["id"],
+            entry.get("name") or entry["prompt"][:30],
+            entry["cron"],
+            entry["prompt"],
+            entry.get("work_dir", "~"),
+            entry.get("enabled", True),
+            entry.get("silent_on_success", False),
+            {k: entry[k] for k in CRON_OPTIONS if k in entry},
+        )
+    await file_cache.run_io(os.replace, CRONS_PATH, CRONS_PATH + ".migrated")
+    logger.info("crons.json → DB 마이그레이션 완료 (%d개)", len(entries))
+
+
+async def _load_registry():
+    from db.store import load_crons
 
-def _save_crons(crons: list[dict]):
-    os.makedirs(os.path.dirname(CRONS_PATH), exist_ok=True)
-    with open(CRONS_PATH, "w", encoding="utf-8") as f:
-        json.dump(crons, f, indent=2, ensure_ascii=False)
+    _crons.clear()
+    for row in await load_crons():
+        _crons[row["id"]] = _entry_from_row(row)
 
 
 def list_crons() -> list[dict]:
-    return _load_crons()
+    return list(_crons.values())
 
 
-def add_cron(cron_expr: str, prompt: str, work_dir: str, name: str | None = None) -> str:
-    crons = _load_crons()
+def parse_cron_options(tokens: list[str]) -> dict:
+    """Parse ``key=value`` tokens into cron options. Raises ValueError on bad input."""
+    options = {}
+    for token in tokens:
+        key, sep, value = token.partition("=")
+        key = _OPTION_ALIASES.get(key.strip().lower(), key.strip().lower())
+        if not sep or key not in CRON_OPTIONS:
+            raise ValueError(f"알 수 없는 옵션: {token} (가능: {', '.join(CRON_OPTIONS)})")
+        value = value.strip()
+        kind = CRON_OPTIONS[key]
+        if kind is bool:
+            if value.lower() not in ("true", "false", "1", "0", "yes", "no", "on", "off"):
+                raise ValueError(f"{key}는 true/false 여야 합니다: {value}")
+            options[key] = value.lower() in ("true", "1", "yes", "on")
+        elif kind is int:
+            try:
+                number = int(value)
+            except ValueError:
+                raise ValueError(f"{key}는 정수여야 합니다: {value}") from None
+            if number < 0 or (key in ("max_instances", "misfire_grace_time") and number < 1):
+                raise ValueError(f"{key} 값이 범위를 벗어났습니다: {value}")
+            options[key] = number
+        else:
+            if key == "jitter_mode" and value not in JITTER_MODES:
+                raise ValueError(f"jitter_mode는 {'/'.join(JITTER_MODES)} 중 하나여야 합니다: {value}")
+            options[key] = value
+    return options
+
+
+async def add_cron(
+    cron_expr: str,
+    prompt: str,
+    work_dir: str,
+    name: str | None = None,
+    options: dict | None = None,
+) -> str:
+    from db.store import save_cron
+
     cron_id = str(uuid.uuid4())[:8]
     entry = {
         "id": cron_id,
@@ -41,84 +152,248 @@ def add_cron(cron_expr: str, prompt: str, work_dir: str, name: str | None = None
         "work_dir": work_dir,
         "enabled": True,
         "silent_on_success": False,
+        "created_at": datetime.now().isoformat(),
+        **(options or {}),
     }
-    crons.append(entry)
-    _save_crons(crons)
+    await save_cron(
+        cron_id, entry["name"], cron_expr, prompt, work_dir, True, False, options or {}, entry["created_at"]
+    )
+    _crons[cron_id] = entry
     # Register with scheduler if running
     if _scheduler:
         _register_job(entry)
+        await _save_state(entry)
     return cron_id
 
 
-def remove_cron(cron_id: str) -> bool:
-    crons = _load_crons()
-    original_len = len(crons)
-    crons = [c for c in crons if c["id"] != cron_id]
-    if len(crons) == original_len:
+async def remove_cron(cron_id: str) -> bool:
+    from db.store import delete_cron
+
+    if cron_id not in _crons:
         return False
-    _save_crons(crons)
-    if _scheduler:
-        try:
-            _scheduler.remove_job(cron_id)
-        except Exception:
-            pass
+    await delete_cron(cron_id)
+    del _crons[cron_id]
+    _unregister_job(cron_id)
     return True
 
 
-def toggle_cron(cron_id: str) -> bool | None:
-    crons = _load_crons()
-    for c in crons:
-        if c["id"] == cron_id:
-            c["enabled"] = not c.get("enabled", True)
-            _save_crons(crons)
-            if _scheduler:
-                if c["enabled"]:
-                    _register_job(c)
-                else:
-                    try:
-                        _scheduler.remove_job(cron_id)
-                    except Exception:
-                        pass
-            return c["enabled"]
-    return None
+async def toggle_cron(cron_id: str) -> bool | None:
+    from db.store import save_cron
+
+    c = _crons.get(cron_id)
+    if c is None:
+        return None
+    c["enabled"] = not c.get("enabled", True)
+    await save_cron(
+        cron_id, c["name"], c["cron"], c["prompt"], c["work_dir"], c["enabled"], c["silent_on_success"],
+        {k: c[k] for k in CRON_OPTIONS if k in c}, c.get("created_at"),
+    )
+    if _scheduler:
+        if c["enabled"]:
+            _register_job(c)
+        else:
+            _unregister_job(cron_id)
+        await _save_state(c)
+    return c["enabled"]
+
+
+def _unregister_job(cron_id: str):
+    if not _scheduler:
+        return
+    try:
+        _scheduler.remove_job(cron_id)
+    except JobLookupError:
+        pass
+
+
+def cron_option(entry: dict, key: str):
+    """Entry's own option, falling back to the cron.* defaults in config.json."""
+    if key in entry:
+        return entry[key]
+    defaults = get_config().cron
+    return {
+        "max_instances": defaults.default_max_instances,
+        "coalesce": defaults.default_coalesce,
+        "misfire_grace_time": defaults.default_misfire_grace_sec,
+        "jitter": defaults.default_jitter_sec,
+        "jitter_mode": defaults.default_jitter_mode,
+    }[key]
+
+
+def _hash_jitter(entry: dict) -> int:
+    """Stable per-job offset in [0, jitter] so the same job always starts at the same second."""
+    jitter = cron_option(entry, "jitter")
+    if jitter <= 0:
+        return 0
+    digest = hashlib.sha1(entry["id"].encode("utf-8")).hexdigest()
+    return int(digest, 16) % (jitter + 1)
+
+
+def _build_trigger(entry: dict) -> CronTrigger | None:
+    parts = entry["cron"].split()
+    if len(parts) != 5:
+        logger.warning("잘못된 크론 표현식: %s", entry["cron"])
+        return None
+    jitter = cron_option(entry, "jitter")
+    random_jitter = jitter if jitter > 0 and cron_option(entry, "jitter_mode") == "random" else None
+    return CronTrigger(
+        minute=parts[0],
+        hour=parts[1],
+        day=parts[2],
+        month=parts[3],
+        day_of_week=parts[4],
+        jitter=random_jitter,
+    )
+
+
+def _job_options(entry: dict) -> dict:
+    return {
+        "max_instances": cron_option(entry, "max_instances"),
+        "coalesce": cron_option(entry, "coalesce"),
+        # APScheduler reads None as unlimited grace; 0 from an older entry or config means "none" instead
+        "misfire_grace_time": max(1, cron_option(entry, "misfire_grace_time")),
+    }
 
 
 def _register_job(entry: dict):
     if not _scheduler or not entry.get("enabled", True):
         return
     try:
-        parts = entry["cron"].split()
-        if len(parts) == 5:
-            trigger = CronTrigger(
-                minute=parts[0],
-                hour=parts[1],
-                day=parts[2],
-                month=parts[3],
-                day_of_week=parts[4],
-            )
-        else:
-            logger.warning("잘못된 크론 표현식: %s", entry["cron"])
+        trigger = _build_trigger(entry)
+        if trigger is None:
             return
-
         _scheduler.add_job(
             _run_cron_job,
             trigger=trigger,
             id=entry["id"],
             replace_existing=True,
-            kwargs={"entry": entry},
+            kwargs={"cron_id": entry["id"]},
+            **_job_options(entry),
         )
         logger.info("크론잡 등록: %s (%s)", entry["id"], entry["cron"])
     except Exception:
         logger.exception("크론잡 등록 실패: %s", entry["id"])
 
 
-async def _run_cron_job(entry: dict):
+def _job_matches(job, entry: dict) -> bool:
+    """True if the stored job was registered from this exact definition."""
+    trigger = _build_trigger(entry)
+    if trigger is None or repr(job.trigger) != repr(trigger) or job.kwargs != {"cron_id": entry["id"]}:
+        return False
+    return all(getattr(job, key) == value for key, value in _job_options(entry).items())
+
+
+def _missed_runs(job, now: datetime) -> list[datetime]:
+    """Fire times between the stored next_run_time and now, newest ``catch_up_max_age_sec`` only."""
+    max_age = get_config().cron.catch_up_max_age_sec
+    missed = []
+    run_time = job.next_run_time
+    while run_time is not None and run_time <= now and len(missed) < _MAX_CATCH_UP_RUNS:
+        if max_age <= 0 or (now - run_time).total_seconds() <= max_age:
+            missed.append(run_time)
+        run_time = job.trigger.get_next_fire_time(run_time, run_time + timedelta(microseconds=1))
+    return missed
+
+
+def _restore_jobs():
+    """Reconcile the persistent job store with the registry and catch up runs missed while stopped.
+
+    Jobs whose definition is unchanged keep their stored next_run_time, which
+    is how missed runs are detected. ``cron.catch_up`` decides what happens to
+    them: ``skip`` drops them, ``once`` runs each job once, ``all`` runs every
+    missed occurrence (bounded by ``catch_up_max_age_sec``).
+    """
+    policy = get_config().cron.catch_up
+    now = datetime.now(_scheduler.timezone)
+    stored = {job.id: job for job in _scheduler.get_jobs(jobstore="default")}
+
+    for job_id in stored.keys() - {c["id"] for c in _crons.values() if c.get("enabled", True)}:
+        _scheduler.remove_job(job_id, jobstore="default")
+
+    for entry in _crons.values():
+        if not entry.get("enabled", True):
+            continue
+        job = stored.get(entry["id"])
+        if job is None or not _job_matches(job, entry):
+            _register_job(entry)
+            continue
+        if job.next_run_time is None or job.next_run_time > now:
+            continue
+        missed = _missed_runs(job, now)
+        # The regular schedule resumes from now; catch-up runs are separate one-off jobs
+        job.modify(next_run_time=job.trigger.get_next_fire_time(None, now))
+        if policy == "skip" or not missed:
+            logger.info("크론잡 %s: 놓친 실행 %d회 건너뜀", entry["id"], len(missed))
+            continue
+        count = len(missed) if policy == "all" else 1
+        logger.info("크론잡 %s: 놓친 실행 %d회 중 %d회 보충 실행", entry["id"], len(missed), count)
+        for i in range(count):
+            _scheduler.add_job(
+                _run_cron_job,
+                trigger=DateTrigger(run_date=now),
+                id=f"{entry['id']}:catchup:{i}",
+                jobstore="memory",
+                replace_existing=True,
+                kwargs={"cron_id": entry["id"]},
+                misfire_grace_time=None,
+            )
+
+
+async def _wait_for_start_slot():
+    """Global limit on cron starts per minute, so a burst of same-minute jobs is spread out."""
+    limit = get_config().cron.max_starts_per_minute
+    if limit <= 0:
+        return
+    while True:
+        now = time.monotonic()
+        while _recent_starts and now - _recent_starts[0] >= 60:
+            _recent_starts.popleft()
+        if len(_recent_starts) < limit:
+            _recent_starts.append(now)
+            return
+        await asyncio.sleep(60 - (now - _recent_starts[0]) + 0.05)
+
+
+def _next_run(cron_id: str) -> str | None:
+    job = _scheduler.get_job(cron_id, jobstore="default") if _scheduler else None
+    if job is None or job.next_run_time is None:
+        return None
+    return job.next_run_time.isoformat(timespec="seconds")
+
+
+async def _save_state(entry: dict):
+    from db.store import update_cron_state
+
+    entry["next_run"] = _next_run(entry["id"])
+    await update_cron_state(
+        entry["id"], entry.get("last_run"), entry["next_run"], entry.get("last_status"), entry.get("last_duration")
+    )
+
+
+async def _run_cron_job(cron_id: str):
+    from claude.queue import execution_queue
     from claude.runner import run_claude
     from db.store import save_execution
+    from memory.prompts import estimate_tokens
+
+    entry = _crons.get(cron_id)
+    if entry is None or not entry.get("enabled", True):
+        logger.warning("등록되지 않았거나 꺼진 크론잡 실행 건너뜀: %s", cron_id)
+        return
+
+    if cron_option(entry, "jitter_mode") == "hash":
+        await asyncio.sleep(_hash_jitter(entry))
+    await _wait_for_start_slot()
 
     logger.info("크론잡 실행: %s", entry["id"])
+    entry["last_run"] = datetime.now().isoformat(timespec="seconds")
     work_dir = os.path.expanduser(entry.get("work_dir", "~"))
-    result = await run_claude(entry["prompt"], work_dir)
+    future = await execution_queue.submit(
+        run_claude, entry["prompt"], work_dir, get_config().claude.timeout_sec,
+        cache_source="cron", pool_owner=f"cron:{entry['id']}",
+        owner=f"cron:{entry['id']}", priority="cron",
+    )
+    result = await future
 
     await save_execution(
         source="cron",
@@ -129,7 +404,24 @@ async def _run_cron_job(entry: dict):
         status=result["status"],
         error_message=result.get("error"),
         cron_id=entry["id"],
+        prompt_chars=len(entry["prompt"]),
+        prompt_tokens=estimate_tokens(entry["prompt"]),
     )
+    entry["last_status"] = result["status"]
+    entry["last_duration"] = round(result["duration"], 2)
+    await _save_state(entry)
+
+    if result["status"] == "rate_limited":
+        from claude.retry import retry_queue
+
+        delay = await retry_queue.schedule(
+            "cron", entry["prompt"], work_dir, cron_id=entry["id"], error=result.get("error")
+        )
+        if _send_telegram_func:
+            await _send_telegram_func(
+                f"⏰ 크론잡 `{entry['id']}`: API 한도 초과, 약 {max(1, round(delay / 60))}분 후 재시도합니다."
+            )
+        return
 
     # Send result via telegram
     if _send_telegram_func:
@@ -141,16 +433,51 @@ async def _run_cron_job(entry: dict):
         await _send_telegram_func(msg)
 
 
-def init_scheduler(send_func=None):
+def _on_job_submitted(event):
+    if event.job_id == MAINTENANCE_JOB_ID or not event.scheduled_run_times:
+        return
+    lateness = datetime.now(event.scheduled_run_times[-1].tzinfo) - event.scheduled_run_times[-1]
+    registry.observe("kkabi_cron_lateness_seconds", max(0.0, lateness.total_seconds()))
+
+
+def _register_maintenance():
+    from db.maintenance import run_maintenance
+
+    interval = get_config().db.maintenance_interval_min
+    if interval <= 0:
+        return
+    _scheduler.add_job(
+        run_maintenance,
+        trigger=IntervalTrigger(minutes=interval),
+        id=MAINTENANCE_JOB_ID,
+        jobstore="memory",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+    )
+
+
+async def init_scheduler(send_func=None):
+    from db.store import load_scheduler_jobs
+
     global _scheduler, _send_telegram_func
     _send_telegram_func = send_func
-    _scheduler = AsyncIOScheduler()
-    # Register all enabled crons
-    for entry in _load_crons():
-        if entry.get("enabled", True):
-            _register_job(entry)
-    _scheduler.start()
-    logger.info("스케줄러 시작됨")
+    await _load_registry()
+    await _migrate_json()
+    await _load_registry()
+
+    _scheduler = AsyncIOScheduler(
+        jobstores={"default": PersistentJobStore(await load_scheduler_jobs()), "memory": MemoryJobStore()}
+    )
+    # Start paused so stored jobs can be reconciled before anything fires
+    _scheduler.add_listener(_on_job_submitted, EVENT_JOB_SUBMITTED)
+    _scheduler.start(paused=True)
+    _restore_jobs()
+    _register_maintenance()
+    _scheduler.resume()
+    for entry in _crons.values():
+        await _save_state(entry)
+    logger.info("스케줄러 시작됨 (크론잡 %d개)", len(_crons))
     return _scheduler
 
 
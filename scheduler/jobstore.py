@@ -0,0 +1,76 @@
+import logging
+import pickle
+
+from apscheduler.job import Job
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.util import datetime_to_utc_timestamp
+
+from db.writer import batch_writer
+
+logger = logging.getLogger(__name__)
+
+_UPSERT_JOB = """INSERT INTO scheduler_jobs (id, next_run_time, job_state) VALUES (?, ?, ?)
+    ON CONFLICT (id) DO UPDATE SET
+        next_run_time = excluded.next_run_time,
+        job_state = excluded.job_state"""
+
+_DELETE_JOB = "DELETE FROM scheduler_jobs WHERE id = ?"
+
+
+class PersistentJobStore(MemoryJobStore):
+    """APScheduler job store that survives restarts via the kkabi SQLite database.
+
+    APScheduler calls job stores synchronously from the event loop, so reads
+    are served from memory and every change is handed to the write-behind
+    batch writer. Blocking sqlite3 calls here would stall the loop while the
+    aiosqlite connection is mid-transaction. ``rows`` are the saved
+    ``(id, job_state)`` pairs, loaded before the scheduler starts.
+    """
+
+    def __init__(self, rows: list[tuple[str, bytes]] = (), pickle_protocol: int = pickle.HIGHEST_PROTOCOL):
+        super().__init__()
+        self._saved_rows = list(rows)
+        self._pickle_protocol = pickle_protocol
+
+    def start(self, scheduler, alias):
+        super().start(scheduler, alias)
+        for job_id, job_state in self._saved_rows:
+            try:
+                super().add_job(self._reconstitute_job(job_state))
+            except Exception:
+                logger.exception("저장된 스케줄 복원 실패, 삭제: %s", job_id)
+                batch_writer.add(_DELETE_JOB, (job_id,))
+        self._saved_rows = []
+
+    def shutdown(self):
+        # MemoryJobStore.shutdown() removes every job, which would wipe the saved rows too
+        MemoryJobStore.remove_all_jobs(self)
+
+    def add_job(self, job):
+        super().add_job(job)
+        self._persist(job)
+
+    def update_job(self, job):
+        super().update_job(job)
+        self._persist(job)
+
+    def remove_job(self, job_id):
+        super().remove_job(job_id)
+        batch_writer.add(_DELETE_JOB, (job_id,))
+
+    def remove_all_jobs(self):
+        for job in self.get_all_jobs():
+            batch_writer.add(_DELETE_JOB, (job.id,))
+        super().remove_all_jobs()
+
+    def _persist(self, job):
+        state = pickle.dumps(job.__getstate__(), self._pickle_protocol)
+        batch_writer.add(_UPSERT_JOB, (job.id, datetime_to_utc_timestamp(job.next_run_time), state))
+
+    def _reconstitute_job(self, job_state: bytes):
+        state = pickle.loads(job_state)
+        job = Job.__new__(Job)
+        job.__setstate__(state)
+        job._scheduler = self._scheduler
+        job._jobstore_alias = self._alias
+        return job
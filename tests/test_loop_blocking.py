@@ -0,0 +1,318 @@
+"""Blocking file I/O must not run on the event loop.
+
+A simulated slow disk makes every file system call made *on the loop's
+thread* take ``SLOW_DISK_SEC``. The code paths that touch disk are then
+driven from a coroutine while a heartbeat measures how late the loop wakes
+up; anything past ``MAX_LOOP_LAG_SEC`` fails with the offending calls.
+"""
+import asyncio
+import builtins
+import dataclasses
+import os
+import threading
+import time
+import traceback
+import types
+
+import pytest
+
+import config
+from bot import file_transfer
+from bot.upload_store import UploadStore
+from claude import context
+from db import store
+from db.connection import database
+from memory import file_cache, manager, persona
+from scheduler import cron
+
+SLOW_DISK_SEC = 0.2
+MAX_LOOP_LAG_SEC = 0.1
+_HEARTBEAT_SEC = 0.01
+
+_PATCHED = [
+    (builtins, "open"),
+    (os, "open"),
+    (os, "stat"),
+    (os, "lstat"),
+    (os, "mkdir"),
+    (os, "listdir"),
+    (os, "scandir"),
+    (os, "replace"),
+    (os, "rename"),
+    (os, "remove"),
+    (os, "unlink"),
+    (os, "symlink"),
+]
+
+
+class SlowDisk:
+    """Delays file system calls made on ``loop_thread`` and records where they came from."""
+
+    def __init__(self, monkeypatch):
+        self._monkeypatch = monkeypatch
+        self.loop_thread: int | None = None
+        self.calls: list[str] = []
+        self._recording = False
+
+    def install(self):
+        for module, name in _PATCHED:
+            self._monkeypatch.setattr(module, name, self._wrap(name, getattr(module, name)))
+
+    def _wrap(self, name, func):
+        def slow(*args, **kwargs):
+            if threading.get_ident() == self.loop_thread and not self._recording:
+                # Formatting the stack reads source files itself
+                self._recording = True
+                try:
+                    stack = "".join(traceback.format_stack(limit=6)[:-1])
+                finally:
+                    self._recording = False
+                self.calls.append(f"{name}{args[:1]}\n{stack}")
+                time.sleep(SLOW_DISK_SEC)
+            return func(*args, **kwargs)
+
+        return slow
+
+    def run(self, scenario, setup=None):
+        """Run ``setup()`` then ``scenario()`` on a fresh loop; return the worst heartbeat lag in seconds.
+
+        Only ``scenario`` is watched.
+        """
+
+        async def main():
+            if setup is not None:
+                await setup()
+            self.loop_thread = threading.get_ident()
+            worst = 0.0
+
+            async def heartbeat():
+                nonlocal worst
+                while True:
+                    started = time.perf_counter()
+                    await asyncio.sleep(_HEARTBEAT_SEC)
+                    worst = max(worst, time.perf_counter() - started - _HEARTBEAT_SEC)
+
+            beat = asyncio.create_task(heartbeat())
+            await asyncio.sleep(0)
+            try:
+                await scenario()
+            finally:
+                beat.cancel()
+                self.loop_thread = None
+            return worst
+
+        return asyncio.run(main())
+
+    def check(self, scenario, setup=None):
+        lag = self.run(scenario, setup)
+        assert not self.calls, f"{len(self.calls)} file system call(s) on the event loop:\n" + "\n".join(self.calls)
+        assert lag < MAX_LOOP_LAG_SEC, f"event loop stalled for {lag * 1000:.0f}ms"
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Point every data path at ``tmp_path`` and freeze the config so get_config doesn't stat."""
+    memory_dir = tmp_path / "memory"
+    monkeypatch.setattr(manager, "DATA_DIR", str(memory_dir))
+    monkeypatch.setattr(manager, "MEMORY_PATH", str(memory_dir / "MEMORY.md"))
+    monkeypatch.setattr(manager, "LOGS_DIR", str(memory_dir / "logs"))
+    monkeypatch.setattr(manager, "PROJECTS_DIR", str(memory_dir / "projects"))
+    monkeypatch.setattr(manager, "_dirs_ready", False)
+    monkeypatch.setattr(persona, "PERSONA_DIR", str(tmp_path / "persona"))
+    monkeypatch.setattr(persona, "_dir_ready", False)
+    monkeypatch.setattr(context, "SYSTEM_PROMPT_PATH", str(tmp_path / "system_prompt.txt"))
+    monkeypatch.setattr(context, "MEMORY_PATH", manager.MEMORY_PATH)
+    monkeypatch.setattr(
+        context,
+        "_PROMPT_FILES",
+        (context.SYSTEM_PROMPT_PATH, manager.MEMORY_PATH, *(persona.persona_path(n) for n in ("soul", "user", "mood"))),
+    )
+    monkeypatch.setattr(context, "_prefix_memo", None)
+    monkeypatch.setattr(cron, "CRONS_PATH", str(tmp_path / "crons.json"))
+    monkeypatch.setattr(database, "_path", str(tmp_path / "assistant.db"))
+
+    base = config.get_config()
+    files = dataclasses.replace(base.files, upload_dir=str(tmp_path / "uploads"))
+    monkeypatch.setattr(config, "_config", dataclasses.replace(base, files=files))
+    monkeypatch.setattr(config, "_STAT_INTERVAL_SEC", float("inf"))
+    monkeypatch.setattr(config, "_checked_at", time.monotonic())
+    return tmp_path
+
+
+@pytest.fixture
+def slow_disk(monkeypatch):
+    disk = SlowDisk(monkeypatch)
+    disk.install()
+    return disk
+
+
+class FakeMessage:
+    """Stands in for a telegram Message; records what the bot sent."""
+
+    def __init__(self, sent: list, text: str = "", message_id: int = 1):
+        self.chat_id = 1
+        self.message_id = message_id
+        self.text = text
+        self._sent = sent
+
+    async def reply_text(self, text):
+        self._sent.append(text)
+        return FakeMessage(self._sent, text, self.message_id + len(self._sent))
+
+    async def reply_document(self, document, filename, caption=None):
+        self._sent.append(filename)
+
+    async def edit_text(self, text):
+        self.text = text
+
+    async def delete(self):
+        pass
+
+
+@pytest.fixture
+def telegram(monkeypatch):
+    """Outbox calls go straight to the fake messages; returns (make_update, sent)."""
+    from bot.outbox import outbox
+
+    def submit(chat_id, factory, priority="interactive", method="send", key=None):
+        return asyncio.ensure_future(factory())
+
+    async def call(chat_id, factory, priority="interactive", method="send", key=None):
+        return await factory()
+
+    monkeypatch.setattr(outbox, "submit", submit)
+    monkeypatch.setattr(outbox, "call", call)
+    sent: list = []
+
+    def make_update(text: str = ""):
+        return types.SimpleNamespace(
+            effective_user=types.SimpleNamespace(id=1),
+            effective_chat=types.SimpleNamespace(id=1),
+            message=FakeMessage(sent, text),
+        )
+
+    return make_update, sent
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """Fresh asyncio primitives on the DB singletons, which bind to the loop that first uses them."""
+    from db.writer import batch_writer
+    from memory import index
+
+    monkeypatch.setattr(database, "_write_lock", asyncio.Lock())
+    monkeypatch.setattr(database, "_open_lock", asyncio.Lock())
+    monkeypatch.setattr(batch_writer, "_wakeup", asyncio.Event())
+    monkeypatch.setattr(batch_writer, "_flush_lock", asyncio.Lock())
+    monkeypatch.setattr(index, "_lock", asyncio.Lock())
+    monkeypatch.setattr(index, "_indexed_content", None)
+    return store
+
+
+def test_memory_and_context(data_dir, slow_disk, telegram, db, monkeypatch):
+    from bot import handlers
+    from claude.queue import execution_queue
+    from memory.prompts import build_memory_block
+
+    make_update, sent = telegram
+    (data_dir / "crons.json").write_text("[]", encoding="utf-8")
+    base = config.get_config()
+    monkeypatch.setattr(
+        config, "_config",
+        dataclasses.replace(base, claude=dataclasses.replace(base.claude, streaming=False, warm_pool_size=0)),
+    )
+    monkeypatch.setattr(execution_queue, "_cond", asyncio.Condition())
+
+    async def fake_run_claude(prompt, work_dir, **kwargs):
+        assert "차분하게" in prompt
+        return {"status": "success", "result": "라떼 기억할게요", "error": None, "duration": 0.1}
+
+    monkeypatch.setattr(handlers, "run_claude", fake_run_claude)
+
+    def ctx(*args):
+        return types.SimpleNamespace(args=list(args))
+
+    async def scenario():
+        execution_queue.start(max_concurrent=1)
+        try:
+            await handlers.cmd_persona(make_update(), ctx("soul", "차분하게"))
+            await handlers.cmd_persona(make_update(), ctx("soul"))
+            await handlers.cmd_system(make_update(), ctx("짧게", "답해"))
+            await handlers.cmd_system(make_update(), ctx())
+            await handlers.cmd_memory_add(make_update(), ctx("커피는", "라떼"))
+            await handlers.cmd_memory(make_update(), ctx())
+            assert "라떼" in await build_memory_block("커피", 2000, 20)
+            await handlers.handle_message(make_update("커피 뭐 좋아하지?"), ctx())
+            await handlers.cmd_memory_clear(make_update(), ctx())
+            await cron._migrate_json()
+        finally:
+            await execution_queue.stop()
+            await db.close_db()
+
+    slow_disk.check(scenario, setup=db.init_db)
+    assert "라떼 기억할게요" in sent
+    assert "🗑 오늘 로그 초기화 완료" in sent
+    assert (data_dir / "crons.json.migrated").exists()
+
+
+def test_send_as_document(data_dir, slow_disk, telegram, monkeypatch):
+    from bot import sender
+
+    make_update, sent = telegram
+    base = config.get_config()
+    telegram_config = dataclasses.replace(base.telegram, document_threshold_chars=100, document_gzip_chars=1000)
+    monkeypatch.setattr(config, "_config", dataclasses.replace(base, telegram=telegram_config))
+
+    async def scenario():
+        await sender.send_long_message(make_update(), "가" * 500)
+        await sender.send_long_message(make_update(), "나" * 5000)
+
+    slow_disk.check(scenario)
+    assert [name.rsplit(".", 1)[-1] for name in sent] == ["md", "gz"]
+
+
+def test_upload_store(data_dir, slow_disk, db):
+    uploads = UploadStore()
+
+    async def scenario():
+        try:
+            tmp = await uploads.temp_path("notes.txt")
+            await file_cache.run_io(lambda: open(tmp, "wb").write(b"hello"))
+            path = await uploads.add(tmp, "notes.txt", "uid-1")
+            assert await uploads.lookup("uid-1", "notes.txt") == path
+        finally:
+            await db.close_db()
+
+    slow_disk.check(scenario, setup=db.init_db)
+    assert os.path.islink(data_dir / "uploads" / "notes.txt")
+
+
+def test_send_file(data_dir, slow_disk, monkeypatch):
+    (data_dir / "out").mkdir()
+    (data_dir / "out" / "a.txt").write_text("a" * 1000, encoding="utf-8")
+    (data_dir / "out" / "b.log").write_text("b", encoding="utf-8")
+    sent, replies = [], []
+
+    async def reply_document(document, filename):
+        sent.append(filename)
+
+    async def reply_text(text):
+        replies.append(text)
+
+    async def call(chat_id, factory, priority="interactive", method="send", key=None):
+        return await factory()
+
+    monkeypatch.setattr(file_transfer.outbox, "call", call)
+    update = types.SimpleNamespace(
+        effective_chat=types.SimpleNamespace(id=1),
+        message=types.SimpleNamespace(reply_document=reply_document, reply_text=reply_text),
+    )
+
+    async def scenario():
+        await file_transfer.send_file(update, "out/a.txt", base_dir=str(data_dir))
+        await file_transfer.send_file(update, "out", base_dir=str(data_dir), exclude=["*.log"])
+        await file_transfer.send_file(update, "missing", base_dir=str(data_dir))
+
+    slow_disk.check(scenario)
+    assert sent == ["a.txt", "out.zip"]
+    assert len(replies) == 1